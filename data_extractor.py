@@ -6,118 +6,129 @@ import PyPDF2
 import os
 import base64
 import io
-import tempfile
 import json
 import subprocess
-import cv2
-import numpy as np
+import time
+from config_manager import config
+from page_renderer import render_pages
+from image_processor import iter_qr_regions, layout_key, record_qr_hit, FULL_PAGE
+from qr_decoders import get_cascade, NO_ZBAR_REQUIRED, DEFAULT_ROI_DECODERS
+from text_scanner import get_scanner
 
-# 检查环境变量，明确禁用二维码支持
-NO_ZBAR_REQUIRED = os.environ.get("NO_ZBAR_REQUIRED", "0") == "1"
+# 二维码识别后端在首次使用时才加载（见qr_decoders），这里只检查是否已安装
 if NO_ZBAR_REQUIRED:
-    logging.warning("环境变量NO_ZBAR_REQUIRED=1，将禁用二维码支持")
-    QRCODE_SUPPORT = False
-    # 定义一个空函数作为替代
-    def decode(image):
-        return []
-else:
-    # 尝试导入pyzbar，但在缺少系统依赖时不会崩溃
-    try:
-        from pyzbar.pyzbar import decode
-        QRCODE_SUPPORT = True
-        logging.info("二维码支持已启用（pyzbar库成功加载）")
-    except ImportError as e:
-        QRCODE_SUPPORT = False
-        logging.warning(f"二维码支持已禁用: {e}")
-        # 定义一个空函数作为替代
-        def decode(image):
-            return []
-
-# 我们将使用pyzxing库，这是一个纯Python的二维码库
-try:
-    from pyzxing import BarCodeReader
-    QRCODE_SUPPORT = True
-    logging.info("二维码支持已启用（使用pyzxing库）")
-    # 初始化条形码/二维码读取器
-    reader = BarCodeReader()
-except ImportError as e:
-    QRCODE_SUPPORT = False
-    logging.warning(f"二维码支持已禁用 (pyzxing导入失败): {e}")
-    # 如果pyzxing不可用，尝试使用OpenCV
-    try:
-        logging.info("尝试使用OpenCV进行二维码识别")
-        QRCODE_SUPPORT = True
-    except:
-        logging.warning("OpenCV二维码识别也不可用")
-        QRCODE_SUPPORT = False
-
-# 尝试导入轻量级QR码库
-try:
-    from qreader import QReader
-    QRCODE_SUPPORT = True
-    logging.info("二维码支持已启用（使用qreader库）")
-    # 初始化QR码读取器
-    qreader = QReader()
-except ImportError as e:
-    QRCODE_SUPPORT = False
-    logging.warning(f"二维码支持已禁用: {e}")
-
-def scan_qrcode(image_path):
+    logging.warning("环境变量NO_ZBAR_REQUIRED=1，将禁用pyzbar二维码支持")
+QRCODE_SUPPORT = get_cascade().available()
+if not QRCODE_SUPPORT:
+    logging.warning("二维码支持已禁用: 未安装任何二维码识别库（opencv/pyzbar/qreader）")
+
+def _limit_image_size(img, max_size=1000):
+    """调整图像大小以提高处理速度"""
+    if img.width > max_size or img.height > max_size:
+        scale = min(max_size / img.width, max_size / img.height)
+        new_size = (int(img.width * scale), int(img.height * scale))
+        img = img.resize(new_size, Image.LANCZOS)
+    return img
+
+def _prepare_qr_image(img):
+    """转换为RGB并限制尺寸，返回numpy数组"""
+    # 转换为RGB模式确保兼容性
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    # 将PIL图像转换为numpy数组
+    import numpy as np
+    return np.array(_limit_image_size(img))
+
+def load_image(image):
+    """
+    将文件路径、图像字节、PIL图像或numpy数组统一转换为PIL图像
+    """
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        img = Image.open(io.BytesIO(image))
+    elif isinstance(image, (str, os.PathLike)):
+        img = Image.open(image)
+    elif hasattr(image, '__array_interface__'):
+        return Image.fromarray(image)
+    else:
+        raise TypeError(f"不支持的图像类型: {type(image).__name__}")
+    img.load()
+    return img
+
+def _describe_image(image):
+    """日志中显示的图像描述"""
+    if isinstance(image, (str, os.PathLike)):
+        return str(image)
+    return f"内存图像({type(image).__name__})"
+
+def scan_qrcode(image, regions=True):
     """
     使用轻量级库扫描二维码
+    先在页面角落的候选区域中识别，都未命中时再扫描整页
+    角落区域只使用开销小的后端（qr_roi_decoders，默认OpenCV和pyzbar），
+    整页和增强识别才按完整级联尝试各后端（qreader兜底），每页最多运行两次qreader
+    
+    Args:
+        image: 图像文件路径、图像字节(PNG/PPM等)、PIL图像或numpy数组
+        regions: 是否先尝试角落区域；图像本身就是二维码（如OFD内嵌图片）时传False
     """
     if not QRCODE_SUPPORT:
         logging.info("二维码支持不可用，跳过扫描")
         return None
         
+    cascade = get_cascade()
     try:
-        logging.info(f"扫描二维码: {image_path}")
-        
-        # 使用PIL加载图像
-        img = Image.open(image_path)
-        # 转换为RGB模式确保兼容性
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-            
-        # 调整图像大小以提高处理速度
-        if img.width > 1000 or img.height > 1000:
-            scale = min(1000 / img.width, 1000 / img.height)
-            new_size = (int(img.width * scale), int(img.height * scale))
-            img = img.resize(new_size, Image.LANCZOS)
+        logging.info(f"扫描二维码: {_describe_image(image)}")
         
-        # 将PIL图像转换为numpy数组
-        img_array = np.array(img)
+        img = load_image(image)
+        page_layout = layout_key(img.width, img.height)
+        # 整页缩小后的图像在普通识别和增强识别之间复用
+        page_img = None
         
-        # 使用qreader识别二维码
-        decoded_text = qreader.detect_and_decode(image=img_array)
-        
-        if decoded_text:
-            logging.info(f"成功识别二维码: {decoded_text[:50]}...")
-            return decoded_text
+        # 依次尝试候选区域，最后是整页；没有可用的轻量后端时直接扫描整页
+        roi_decoders = config.get('qr_roi_decoders', DEFAULT_ROI_DECODERS)
+        if regions and not any(name in roi_decoders for name in cascade.order()):
+            regions = False
+        candidates = iter_qr_regions(img) if regions else [(FULL_PAGE, img)]
+        for region_name, region_img in candidates:
+            decoders = roi_decoders
+            if region_name == FULL_PAGE:
+                page_img = _limit_image_size(region_img)
+                region_img = page_img
+                decoders = None
+            decoded_text, decoder_name = cascade.decode(_prepare_qr_image(region_img), decoders)
+            if decoded_text:
+                logging.info(f"成功识别二维码({region_name}, {decoder_name}): {decoded_text[:50]}...")
+                if region_name != FULL_PAGE:
+                    record_qr_hit(page_layout, region_name)
+                return decoded_text
         
         # 如果识别失败，尝试不同的图像处理方法
         logging.info("标准识别失败，尝试图像增强...")
         
         # 尝试转为灰度图并调整对比度
-        gray_img = img.convert('L')
+        gray_img = (page_img or _limit_image_size(img)).convert('L')
         # 增强对比度
         from PIL import ImageEnhance
         enhancer = ImageEnhance.Contrast(gray_img)
         enhanced_img = enhancer.enhance(2.0)  # 增强对比度
         
         # 转换为numpy数组
+        import numpy as np
         enhanced_array = np.array(enhanced_img)
         
         # 再次尝试识别
         try:
-            decoded_text = qreader.detect_and_decode(image=enhanced_array)
+            decoded_text, decoder_name = cascade.decode(enhanced_array)
             if decoded_text:
-                logging.info(f"增强后成功识别二维码: {decoded_text[:50]}...")
+                logging.info(f"增强后成功识别二维码({decoder_name}): {decoded_text[:50]}...")
                 return decoded_text
         except Exception as e:
             logging.warning(f"增强识别失败: {e}")
             
-        logging.warning(f"未能在图像中识别到二维码: {image_path}")
+        logging.warning(f"未能在图像中识别到二维码: {_describe_image(image)}")
         return None
     except Exception as e:
         logging.error(f"扫描二维码失败: {e}", exc_info=True)
@@ -204,60 +215,13 @@ def extract_information(data_str):
     
     return invoice_number, amount
 
-def extract_images_from_pdf(pdf_path, max_pages=3):
+def extract_images_from_pdf(pdf_path, max_pages=3, dpi=150):
     """
-    使用PyPDF2和Pillow从PDF中提取图像
-    这是一个简化的图像提取器，不需要PyMuPDF
+    将PDF前几页渲染为图像（PPM字节），所有页面一次渲染，不经过临时文件
     """
-    images = []
     try:
         logging.info(f"从PDF提取图像(轻量级方法): {pdf_path}")
-        # 打开PDF
-        with open(pdf_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            
-            # 限制处理的页面数量
-            num_pages = min(len(reader.pages), max_pages)
-            logging.info(f"处理PDF前{num_pages}页（共{len(reader.pages)}页）")
-            
-            # 提取整页图像
-            for page_num in range(num_pages):
-                try:
-                    # 创建一个临时文件用于保存整页图像
-                    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-                        temp_path = temp_file.name
-                    
-                    # 使用一个简单的方法将PDF页面渲染为图像
-                    # 注意：这种方法质量较低，但不需要大型依赖库
-                    # 我们只需要能够识别二维码
-                    command = f"pdftoppm -png -f {page_num+1} -l {page_num+1} -r 150 '{pdf_path}' '{os.path.splitext(temp_path)[0]}'"
-                    
-                    try:
-                        # 尝试使用系统命令提取图像
-                        result = os.system(command)
-                        if result == 0:
-                            # 查找生成的文件
-                            output_pattern = f"{os.path.splitext(temp_path)[0]}-*.png"
-                            import glob
-                            output_files = glob.glob(output_pattern)
-                            if output_files:
-                                with open(output_files[0], 'rb') as img_file:
-                                    images.append(img_file.read())
-                                # 清理临时文件
-                                for f in output_files:
-                                    os.remove(f)
-                    except Exception as cmd_e:
-                        logging.warning(f"命令行提取失败: {cmd_e}, 尝试使用Pillow")
-                        # 如果命令行工具不可用，尝试备选方法
-                        pass
-                    
-                    # 清理临时文件
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-                    
-                except Exception as page_e:
-                    logging.warning(f"处理第{page_num+1}页时出错: {page_e}")
-        
+        images = render_pages(pdf_path, first_page=1, last_page=max_pages, dpi=dpi, image_format='ppm')
         logging.info(f"成功从PDF提取了{len(images)}张图像")
         return images
     except Exception as e:
@@ -268,228 +232,346 @@ def extract_information_from_pdf(file_path):
     """
     从PDF文件中提取发票信息
     优先使用二维码方式，如果失败再尝试文本提取
+    
+    Returns:
+        (发票号码, 金额) 元组
+    """
+    info = extract_invoice_info_from_pdf(file_path)
+    return info['invoice_number'], info['amount']
+
+def _invoice_info(invoice_number=None, amount=None, source=None, amount_source=None):
+    """
+    构造统一的发票信息字典
+    amount_source为'filename'表示金额取自文件名中的[¥金额]，与文件内容无关，不能按内容哈希缓存
+    """
+    return {
+        'invoice_number': invoice_number,
+        'amount': amount,
+        'source': source,
+        'amount_source': amount_source
+    }
+
+def extract_invoice_info_from_pdf(file_path):
+    """
+    从PDF文件中提取发票信息，返回包含来源的信息字典
+    
+    默认先解析文本层（数字发票几乎都带有完整文本层），文本结果缺失或存在歧义时
+    才渲染页面识别二维码。策略可通过配置项pdf_strategy调整：
+    text_first（默认）或 qr_first（先识别二维码）
+    
+    Returns:
+        {'invoice_number': ..., 'amount': ..., 'source': 'qrcode'|'text'|'filename'|'generated'}
     """
     try:
         logging.info(f"从PDF文件提取信息: {file_path}")
+        strategy = config.get('pdf_strategy', 'text_first')
+        decision = {'file': os.path.basename(file_path), 'strategy': strategy}
+        text_info = None
         
-        # 步骤1: 如果二维码支持可用，则尝试从PDF提取图像并识别二维码
-        if QRCODE_SUPPORT:
+        # 步骤1: 逐页解析文本层，发票号码和金额都高可信时提前结束
+        if strategy == 'text_first':
             try:
-                # 使用轻量级方法提取图像
-                images = extract_images_from_pdf(file_path)
-                
-                # 如果提取图像失败，尝试从现有页面提取信息
-                if not images:
-                    logging.warning("未能提取图像，尝试直接从PDF页面提取二维码")
-                    # 此处可以添加备选方法...
-                
-                # 创建临时目录用于保存图像
-                temp_dir = tempfile.gettempdir()
-                
-                # 处理每个提取的图像
-                for idx, img_data in enumerate(images):
-                    try:
-                        # 保存临时图像文件用于二维码扫描
-                        temp_img_path = os.path.join(temp_dir, f"temp_qr_img_{idx}.png")
-                        with open(temp_img_path, 'wb') as img_file:
-                            img_file.write(img_data)
-                        
-                        # 扫描二维码
-                        qr_data = scan_qrcode(temp_img_path)
-                        
-                        # 清理临时文件
-                        try:
-                            os.remove(temp_img_path)
-                        except Exception as e:
-                            logging.warning(f"无法删除临时文件 {temp_img_path}: {e}")
-                            
-                        # 如果找到二维码信息，从中提取发票信息
-                        if qr_data:
-                            invoice_number, amount = extract_information(qr_data)
-                            if invoice_number:
-                                logging.info(f"成功从二维码提取到信息 - 发票号: {invoice_number}, 金额: {amount}")
-                                return invoice_number, amount
-                    except Exception as img_e:
-                        logging.warning(f"处理图像{idx}时出错: {img_e}")
-                        continue
+                text_info = extract_text_info(file_path)
             except Exception as e:
-                logging.warning(f"从PDF提取图像并识别二维码失败: {e}")
+                # 加密、交叉引用表损坏或字体编码异常的PDF无法读取文本，按没有文本层处理，继续识别二维码
+                logging.warning(f"读取PDF文本失败，改为识别二维码: {e}")
+                text_info = _failed_text_info(file_path)
+            decision['text_layer'] = text_info['text_layer']
+            decision['pages_read'] = text_info['pages_read']
+            decision['text_confident'] = text_info['confident']
+            decision['text_reason'] = text_info['reason']
+            if not text_info['text_layer']:
+                # 扫描件只有图像，不采用文本结果，直接识别二维码
+                decision['scanned'] = True
+            elif text_info['confident']:
+                decision['result'] = 'text'
+                _log_decision(decision)
+                return _invoice_info(text_info['invoice_number'], text_info['amount'], text_info['source'],
+                                     text_info['amount_source'])
+        
+        # 步骤2: 文本结果缺失、有歧义或没有文本层，渲染页面识别二维码
+        if QRCODE_SUPPORT:
+            qr_info = extract_info_from_qrcode(file_path)
+            decision['qrcode'] = qr_info is not None
+            if qr_info:
+                decision['result'] = 'qrcode'
+                _log_decision(decision)
+                return qr_info
         else:
+            decision['qrcode'] = 'unsupported'
             logging.info("二维码支持不可用，直接使用文本提取")
-            
-        # 步骤2: 如果二维码提取失败，回退到文本提取方法
-        logging.info("尝试从文本提取信息")
-        text = ""
-        # 使用PyPDF2提取文本
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            # 处理所有页面以确保不错过发票信息
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text
         
-        logging.debug(f"提取的文本长度: {len(text)}")
-        logging.debug(f"提取的文本(前300字符): {text[:300]}")
-        
-        # 提取发票号码 - 使用更灵活的模式匹配
-        invoice_number = None
-        # 尝试多种模式，发票号可能是8位、10位或20位
-        invoice_patterns = [
-            r"\b\d{20}\b",   # 20位发票号
-            r"\b\d{10}\b",   # 10位发票号
-            r"\b\d{8}\b"     # 8位发票号
-        ]
-        
-        for pattern in invoice_patterns:
-            invoice_matches = re.findall(pattern, text)
-            if invoice_matches:
-                # 通常第一个匹配的是发票号
-                invoice_number = invoice_matches[0]
-                logging.info(f"从文本提取到发票号码: {invoice_number}")
-                break
-        
-        # 如果没找到，使用文件名作为备用方案
-        if not invoice_number:
-            base_filename = os.path.basename(file_path)
-            invoice_match = re.search(r"\b\d{8,20}\b", base_filename)
-            if invoice_match:
-                invoice_number = invoice_match.group(0)
-                logging.info(f"从文件名提取到发票号码: {invoice_number}")
-            else:
-                # 使用一个通用标识符和时间戳
-                from datetime import datetime
-                invoice_number = f"INV{datetime.now().strftime('%Y%m%d%H%M%S')}"
-                logging.info(f"使用生成的发票号码: {invoice_number}")
-        
-        # 提取金额 - 优化版本
-        amount = None
-        
-        # 更全面的金额匹配模式
-        amount_patterns = [
-            # 小写合计行的格式模式  
-            r"小写[金额]?[^\d\n]{0,20}(?:¥|￥|RMB|人民币)?(\d+\.\d{2})",
-            r"(?:小写|小写金额|小写总计)[：:]((?:¥|￥)?[0-9,]+\.[0-9]{2})",
-            
-            # 价税合计相关格式
-            r"[价税]+[合计]+[：:]?(?:¥|￥|RMB|人民币)?\s*([0-9,]+\.[0-9]{2})",
-            r"(?:[（(]?小写[）)]?|价税合计)[^\d\n]{0,20}(?:¥|￥|RMB)?\s*([0-9,]+\.[0-9]{2})",
-            
-            # 标准货币格式  
-            r"(?:¥|￥)\s*([0-9,]+\.[0-9]{2})",
-            r"RMB\s*([0-9,]+\.[0-9]{2})",
-            
-            # 发票专用格式
-            r"金额[：:]\s*([0-9,]+\.[0-9]{2})",
-            r"(?:金额|合[计]?)[^\d\n]{0,20}(?:¥|￥)?\s*([0-9,]+\.[0-9]{2})",
-            
-            # 更通用的模式，一般用作备选
-            r"(\d+\.\d{2})元",
-            r"\b(\d+\.\d{2})\b"
-        ]
+        # 步骤3: 二维码提取失败，回退到文本提取结果
+        if text_info is None:
+            text_info = extract_text_info(file_path)
+            decision['text_layer'] = text_info['text_layer']
+            decision['pages_read'] = text_info['pages_read']
+            decision['text_reason'] = text_info['reason']
+        decision['result'] = 'text_fallback'
+        _log_decision(decision)
+        return _invoice_info(text_info['invoice_number'], text_info['amount'], text_info['source'],
+                             text_info['amount_source'])
+    except Exception as e:
+        logging.error(f"从PDF提取信息时出错: {e}", exc_info=True)
+        return _invoice_info()
+
+def _failed_text_info(file_path):
+    """文本读取失败时的结果：没有文本层，只保留文件名中的信息"""
+    info = InvoiceTextMatcher(file_path).result()
+    info['text_layer'] = False
+    info['pages_read'] = 0
+    return info
+
+def _log_decision(decision):
+    """记录提取策略的决策过程，便于调整策略"""
+    logging.info(f"PDF提取策略: {json.dumps(decision, ensure_ascii=False)}")
+
+def extract_info_from_qrcode(file_path):
+    """
+    渲染PDF前几页并识别二维码
+    
+    Returns:
+        发票信息字典，未识别到时返回None
+    """
+    try:
+        # 使用轻量级方法提取图像
+        images = extract_images_from_pdf(file_path)
         
-        # 保存所有匹配到的金额，稍后分析
-        all_amounts = []
-        all_amount_contexts = {}  # 存储金额及其上下文
+        # 如果提取图像失败，尝试从现有页面提取信息
+        if not images:
+            logging.warning("未能提取图像，尝试直接从PDF页面提取二维码")
+            # 此处可以添加备选方法...
         
-        # 先尝试从文件名中提取金额，这通常是最准确的来源
-        base_filename = os.path.basename(file_path)
-        file_amount_match = re.search(r"\[¥?(\d+\.\d{2})\]", base_filename)
-        if file_amount_match:
+        # 处理每个提取的图像，渲染结果直接在内存中识别
+        for idx, img_data in enumerate(images):
             try:
-                file_amount = float(file_amount_match.group(1))
-                all_amounts.append(file_amount)
-                all_amount_contexts[file_amount] = f"文件名: {base_filename}"
-                logging.info(f"从文件名提取到金额: {file_amount}")
-            except:
-                pass
-        
-        # 然后尝试高优先级的金额匹配模式
-        # 小写合计和价税合计是发票上最准确的金额来源
-        high_priority_patterns = [
-            (r"小写[金额]?[^\d\n]{0,20}(?:¥|￥|RMB|人民币)?(\d+\.\d{2})", "小写金额"),
-            (r"(?:小写|小写金额|小写总计)[：:]((?:¥|￥)?[0-9,]+\.[0-9]{2})", "小写金额冒号格式"),
-            (r"[价税]+[合计]+[：:]?(?:¥|￥|RMB|人民币)?\s*([0-9,]+\.[0-9]{2})", "价税合计"),
-            (r"(?:合[计]?金额|价税合计)[^\d\n]{0,20}(?:¥|￥)?\s*([0-9,]+\.[0-9]{2})", "合计金额") 
-        ]
-        
-        for pattern, desc in high_priority_patterns:
-            matches = re.findall(pattern, text)
-            for match in matches:
-                if isinstance(match, tuple):  # 处理多组捕获
-                    match = match[0]
-                # 清理金额字符串
-                clean_amount = match.replace(",", "").replace("¥", "").replace("￥", "")
-                try:
-                    float_amount = float(clean_amount)
-                    if 0.01 <= float_amount <= 100000:
-                        all_amounts.append(float_amount)
-                        # 找出匹配上下文（前后20个字符)
-                        match_context = find_context(text, match)
-                        all_amount_contexts[float_amount] = f"{desc}: {match_context}"
-                        logging.info(f"找到高优先级金额: {float_amount} ({desc})")
-                except ValueError:
-                    continue
-        
-        # 如果高优先级匹配没有结果，则尝试其他模式
-        if not all_amounts:
-            for pattern in amount_patterns:
-                amount_matches = re.findall(pattern, text)
-                for match in amount_matches:
-                    if isinstance(match, tuple):  # 处理多组捕获
-                        match = match[0]
-                    # 清理金额字符串
-                    clean_amount = match.replace(",", "").replace("¥", "").replace("￥", "")
-                    try:
-                        float_amount = float(clean_amount)
-                        if 0.01 <= float_amount <= 100000:
-                            all_amounts.append(float_amount)
-                            # 找出匹配上下文（前后20个字符)
-                            match_context = find_context(text, match)
-                            all_amount_contexts[float_amount] = f"普通匹配: {match_context}"
-                            logging.info(f"找到普通金额: {float_amount}")
-                    except ValueError:
-                        continue
-        
-        # 如果找到多个金额，根据上下文选择最合适的
-        if all_amounts:
-            logging.info(f"找到的所有可能金额: {all_amounts}")
-            for amt, context in all_amount_contexts.items():
-                logging.info(f"金额 {amt} 上下文: {context}")
+                qr_data = scan_qrcode(img_data)
                 
-            # 优先考虑通过文件名得到的金额
-            file_amount = None
-            file_amount_match = re.search(r"\[¥?(\d+\.\d{2})\]", base_filename)
-            if file_amount_match:
-                try:
-                    file_amount = float(file_amount_match.group(1)) 
-                    # 判断文件名金额是否在提取的金额中（允许0.01的误差）
-                    for amt in all_amounts:
-                        if abs(amt - file_amount) < 0.01:
-                            amount = "{:.2f}".format(amt)
-                            logging.info(f"选择与文件名匹配的金额: {amount}")
-                            return invoice_number, amount
-                except:
-                    pass
-                    
+                # 如果找到二维码信息，从中提取发票信息
+                if qr_data:
+                    invoice_number, amount = extract_information(qr_data)
+                    if invoice_number:
+                        logging.info(f"成功从二维码提取到信息 - 发票号: {invoice_number}, 金额: {amount}")
+                        return _invoice_info(invoice_number, amount, 'qrcode', 'qrcode')
+            except Exception as img_e:
+                logging.warning(f"处理图像{idx}时出错: {img_e}")
+                continue
+    except Exception as e:
+        logging.warning(f"从PDF提取图像并识别二维码失败: {e}")
+    return None
+
+# 上下文中出现这些关键词的金额优先
+AMOUNT_CONTEXT_KEYWORDS = ["小写金额", "小写", "价税合计", "合计金额"]
+
+def _clean_amount(amount_text):
+    """返回有效范围内的金额浮点数，否则返回None"""
+    try:
+        value = float(amount_text)
+    except ValueError:
+        return None
+    if 0.01 <= value <= 100000:
+        return value
+    return None
+
+class InvoiceTextMatcher:
+    """
+    逐页输入PDF文本，增量收集发票号码和金额候选
+    每页只用单遍扫描器（见text_scanner）扫描新增的文本，result()在已收集的候选上做选择
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.base_filename = os.path.basename(file_path)
+        self.text = ""
+        self.pages = 0
+        self.has_text_layer = False
+        # (优先级, 偏移, 号码, 是否有"发票号码"标签)
+        self.number_candidates = []
+        # (优先级, 偏移, 金额, 规则名称)
+        self.high_priority_candidates = []
+        self.normal_candidates = []
+        self.file_amount = None
+        file_amount_match = re.search(r"\[¥?(\d+\.\d{2})\]", self.base_filename)
+        if file_amount_match:
+            # 文件名中的金额通常是最准确的来源
+            self.file_amount = float(file_amount_match.group(1))
+            logging.info(f"从文件名提取到金额: {self.file_amount}")
+
+    def feed(self, page_text):
+        """输入一页文本"""
+        if self.pages == 0 and page_text and page_text.strip():
+            self.has_text_layer = True
+        self.pages += 1
+        if not page_text:
+            return
+        # 页与页之间加换行，避免跨页的数字被拼接到一起
+        if self.text:
+            self.text += "\n"
+        offset = len(self.text)
+        self.text += page_text
+
+        for kind, group, priority, position, value, rule_name, labelled in get_scanner().scan(self.text, offset):
+            if kind == "number":
+                self.number_candidates.append((priority, position, value, labelled))
+                continue
+            amount_value = _clean_amount(value)
+            if amount_value is None:
+                continue
+            if group == "high":
+                self.high_priority_candidates.append((priority, position, amount_value, rule_name))
+            else:
+                self.normal_candidates.append((priority, position, amount_value, rule_name))
+        logging.debug(f"第{self.pages}页扫描完成: {len(self.number_candidates)}个号码候选, "
+                      f"{len(self.high_priority_candidates)}个高优先级金额, {len(self.normal_candidates)}个普通金额")
+
+    def _context(self, position, context_chars=20):
+        start = max(0, position - context_chars)
+        return self.text[start:position + context_chars]
+
+    def _select_number(self):
+        """选择发票号码，返回 (号码, 来源)"""
+        if self.number_candidates:
+            # 排在前面的模式优先，同一模式取第一个匹配
+            priority, position, number, labelled = min(self.number_candidates)
+            return number, 'text'
+
+        # 如果没找到，使用文件名作为备用方案
+        invoice_match = re.search(r"\b\d{8,20}\b", self.base_filename)
+        if invoice_match:
+            return invoice_match.group(0), 'filename'
+        return None, 'generated'
+
+    def _number_confident(self, number, source):
+        """发票号码是否可信：来自文本，且为20位全电发票号码或紧跟"发票号码"标签"""
+        if source != 'text':
+            return False
+        if len(number) == 20:
+            return True
+        return any(labelled for _, _, value, labelled in self.number_candidates if value == number)
+
+    def _amounts_agree(self):
+        """高优先级候选金额是否一致：全部相同，或"小写"金额唯一"""
+        all_values = {c[2] for c in self.high_priority_candidates}
+        if len(all_values) == 1:
+            return True
+        lowercase_values = {c[2] for c in self.high_priority_candidates if c[3].startswith("小写")}
+        return len(lowercase_values) == 1
+
+    def _select_amount(self):
+        """选择金额，返回 (金额, 选择依据, 是否无歧义)"""
+        if self.file_amount is not None:
+            return "{:.2f}".format(self.file_amount), "文件名金额", True
+
+        if self.high_priority_candidates:
+            rank, position, value, desc = min(self.high_priority_candidates)
+            agree = self._amounts_agree()
+            return "{:.2f}".format(value), "关键词金额" if agree else "关键词金额存在分歧", agree
+
+        if self.normal_candidates:
             # 优先选择含有"小写"或"价税合计"关键词上下文的金额
-            for amt, context in all_amount_contexts.items():
-                lower_context = context.lower()
-                if any(key in lower_context for key in ["小写金额", "小写", "价税合计", "合计金额"]):
-                    amount = "{:.2f}".format(amt)
-                    logging.info(f"基于关键词上下文选择金额: {amount} (上下文: {context})")
-                    return invoice_number, amount
-            
+            for rank, position, value, desc in sorted(self.normal_candidates):
+                context = self._context(position)
+                if any(key in context for key in AMOUNT_CONTEXT_KEYWORDS):
+                    return "{:.2f}".format(value), "关键词上下文金额", False
             # 如果找不到明确的上下文，则查找最大的那个值
-            if all_amounts:
-                amount = "{:.2f}".format(max(all_amounts))
-                logging.info(f"选择所有金额中的最大值: {amount}")
-        
-        return invoice_number, amount
-    except Exception as e:
-        logging.error(f"从PDF提取信息时出错: {e}", exc_info=True)
-        return None, None
+            value = max(c[2] for c in self.normal_candidates)
+            return "{:.2f}".format(value), "无关键词上下文，取最大金额", False
+
+        return None, "未找到金额", False
+
+    def result(self):
+        """
+        在当前候选上选择发票号码和金额
         
+        Returns:
+            {'invoice_number', 'amount', 'source', 'amount_source', 'confident', 'reason'}
+            confident为False表示结果缺失或候选金额存在分歧，需要其他方式确认；
+            amount_source为'filename'表示金额取自文件名
+        """
+        invoice_number, source = self._select_number()
+        amount, reason, amount_ok = self._select_amount()
+        confident = bool(invoice_number) and amount is not None and amount_ok and \
+            self._number_confident(invoice_number, source)
+        amount_source = None
+        if amount is not None:
+            amount_source = 'filename' if self.file_amount is not None else 'text'
+        return _text_result(invoice_number, amount, source, confident, reason, amount_source)
+
+def iter_pdf_page_texts(file_path, max_pages=None, time_budget=None):
+    """
+    逐页提取PDF文本
+    
+    Args:
+        max_pages: 最多读取的页数
+        time_budget: 读取时间预算（秒），超出后停止读取后续页面
+    """
+    start = time.perf_counter()
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page_index, page in enumerate(reader.pages):
+            if max_pages is not None and page_index >= max_pages:
+                logging.info(f"已达到文本提取页数上限({max_pages})，共{len(reader.pages)}页")
+                break
+            if time_budget is not None and page_index > 0 and time.perf_counter() - start > time_budget:
+                logging.warning(f"文本提取超出时间预算({time_budget}s)，已读取{page_index}页")
+                break
+            yield page.extract_text() or ""
+
+def extract_text_info(file_path, stop_when_confident=True, stop_without_text_layer=True):
+    """
+    逐页提取PDF文本并增量匹配，发票号码和金额都高可信时提前结束
+    首页没有文本层时（扫描件）不再读取后续页面
+    
+    Returns:
+        文本解析结果，额外包含 text_layer（首页是否有文本）和 pages_read
+    """
+    logging.info("尝试从文本提取信息")
+    matcher = InvoiceTextMatcher(file_path)
+    max_pages = config.get('pdf_text_max_pages', 20)
+    time_budget = config.get('pdf_text_time_budget', 5.0)
+    info = matcher.result()
+    for page_text in iter_pdf_page_texts(file_path, max_pages, time_budget):
+        matcher.feed(page_text)
+        info = matcher.result()
+        if stop_when_confident and info['confident']:
+            break
+        if stop_without_text_layer and not matcher.has_text_layer:
+            logging.info("首页没有文本层，可能是扫描件，停止读取文本")
+            break
+
+    if not info['invoice_number']:
+        # 不在这里生成号码，重命名时由name_registry.fallback_invoice_id按内容哈希生成
+        logging.info("未找到发票号码")
+    logging.debug(f"提取的文本长度: {len(matcher.text)}")
+    logging.debug(f"提取的文本(前300字符): {matcher.text[:300]}")
+    logging.info(f"文本提取结果({matcher.pages}页) - 发票号: {info['invoice_number']} ({info['source']}), "
+                 f"金额: {info['amount']} ({info['reason']})")
+    info['text_layer'] = matcher.has_text_layer
+    info['pages_read'] = matcher.pages
+    return info
+
+def parse_invoice_text(text, file_path):
+    """
+    从完整的PDF文本中解析发票号码和金额
+    
+    Returns:
+        {'invoice_number', 'amount', 'source', 'amount_source', 'confident', 'reason'}
+    """
+    matcher = InvoiceTextMatcher(file_path)
+    matcher.feed(text)
+    return matcher.result()
+
+def _text_result(invoice_number, amount, source, confident, reason, amount_source=None):
+    """构造文本解析结果"""
+    return {
+        'invoice_number': invoice_number,
+        'amount': amount,
+        'source': source,
+        'amount_source': amount_source,
+        'confident': confident,
+        'reason': reason
+    }
+
 def find_context(text, match_text, context_chars=20):
     """
     查找匹配文本在原文中的上下文
@@ -0,0 +1,316 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from config_manager import config
+
+# 只缓存由文件内容本身得出的结果，文件名/时间戳得出的结果与内容无关
+CACHEABLE_SOURCES = ('qrcode', 'text', 'xml')
+
+# 提取逻辑的版本，提取规则变化时加1；版本不同的缓存条目视为未命中，不再返回旧逻辑的结果
+EXTRACTOR_VERSION = 1
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class CacheBackend:
+    """缓存存储后端接口，其他存储实现这几个方法即可接入"""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, value):
+        raise NotImplementedError
+
+    def evict(self, max_entries=None, max_age=None):
+        """按条目数（保留最近访问的）和存活时间淘汰，返回删除的条目数"""
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+class MemoryCacheBackend(CacheBackend):
+    """进程内存缓存后端，适用于Vercel等无持久磁盘的环境"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry['accessed_at'] = time.time()
+            return dict(entry['value'])
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {'value': dict(value), 'created_at': now, 'accessed_at': now}
+
+    def evict(self, max_entries=None, max_age=None):
+        removed = 0
+        with self._lock:
+            if max_age:
+                cutoff = time.time() - max_age
+                for key in [k for k, e in self._entries.items() if e['created_at'] < cutoff]:
+                    del self._entries[key]
+                    removed += 1
+            if max_entries is not None and len(self._entries) > max_entries:
+                by_access = sorted(self._entries, key=lambda k: self._entries[k]['accessed_at'])
+                for key in by_access[:len(self._entries) - max_entries]:
+                    del self._entries[key]
+                    removed += 1
+        return removed
+
+    def count(self):
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SQLiteCacheBackend(CacheBackend):
+    """SQLite缓存后端，本地运行时跨进程、跨重启持久化"""
+
+    def __init__(self, db_path):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extraction_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_extraction_cache_accessed ON extraction_cache(accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM extraction_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE extraction_cache SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            self._conn.commit()
+
+    def evict(self, max_entries=None, max_age=None):
+        removed = 0
+        with self._lock:
+            if max_age:
+                cursor = self._conn.execute(
+                    "DELETE FROM extraction_cache WHERE created_at < ?", (time.time() - max_age,)
+                )
+                removed += cursor.rowcount
+            if max_entries is not None:
+                cursor = self._conn.execute(
+                    "DELETE FROM extraction_cache WHERE key NOT IN ("
+                    " SELECT key FROM extraction_cache ORDER BY accessed_at DESC LIMIT ?)",
+                    (max_entries,)
+                )
+                removed += cursor.rowcount
+            self._conn.commit()
+        return removed
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM extraction_cache")
+            self._conn.commit()
+
+class ExtractionCache:
+    """
+    以文件内容SHA-256为键的提取结果缓存
+    记录命中/未命中次数，并定期按条目数和存活时间淘汰
+    """
+
+    def __init__(self, backend, max_entries=10000, max_age=30 * 24 * 3600, evict_interval=100):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._puts_since_evict = 0
+        self._lock = threading.Lock()
+
+    def get(self, content_hash):
+        """查询缓存，命中时返回发票信息字典"""
+        try:
+            value = self.backend.get(content_hash)
+        except Exception as e:
+            logging.warning(f"读取提取缓存失败: {e}")
+            value = None
+        # 过期条目和旧版本提取逻辑的条目等同未命中，由下次淘汰或写入覆盖
+        if value is not None and value.get('version') != EXTRACTOR_VERSION:
+            value = None
+        if value is not None and self.max_age and time.time() - value.get('cached_at', 0) > self.max_age:
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, content_hash, info):
+        """写入缓存，仅保存由文件内容得出的结果（金额取自文件名的结果不缓存）"""
+        if not info or info.get('source') not in CACHEABLE_SOURCES:
+            return False
+        if info.get('amount_source') == 'filename':
+            return False
+        value = {
+            'invoice_number': info.get('invoice_number'),
+            'amount': info.get('amount'),
+            'source': info.get('source'),
+            'version': EXTRACTOR_VERSION,
+            'cached_at': time.time()
+        }
+        try:
+            self.backend.put(content_hash, value)
+        except Exception as e:
+            logging.warning(f"写入提取缓存失败: {e}")
+            return False
+        with self._lock:
+            self._puts_since_evict += 1
+            run_evict = self._puts_since_evict >= self.evict_interval
+            if run_evict:
+                self._puts_since_evict = 0
+        if run_evict:
+            self.evict()
+        return True
+
+    def evict(self):
+        """执行一次淘汰"""
+        try:
+            removed = self.backend.evict(self.max_entries, self.max_age)
+        except Exception as e:
+            logging.warning(f"淘汰提取缓存失败: {e}")
+            return 0
+        with self._lock:
+            self.evictions += removed
+        if removed:
+            logging.info(f"提取缓存淘汰了{removed}条记录")
+        return removed
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'backend': type(self.backend).__name__,
+                'version': EXTRACTOR_VERSION,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'max_entries': self.max_entries,
+                'max_age': self.max_age
+            }
+        try:
+            stats['entries'] = self.backend.count()
+        except Exception as e:
+            stats['entries'] = None
+            stats['error'] = str(e)
+        return stats
+
+_UNSET = object()
+_cache = _UNSET
+_cache_lock = threading.Lock()
+
+def create_cache_from_config():
+    """根据配置创建缓存实例，缓存被禁用时返回None"""
+    if not config.get('extraction_cache_enabled', True):
+        return None
+
+    backend_name = config.get('extraction_cache_backend', 'sqlite')
+    backend = None
+    if backend_name == 'sqlite':
+        db_path = config.get('extraction_cache_path') or os.path.join(
+            config.get('temp_dir', './tmp'), 'extraction_cache.sqlite3')
+        try:
+            backend = SQLiteCacheBackend(db_path)
+        except Exception as e:
+            logging.warning(f"SQLite提取缓存不可用，改用内存缓存: {e}")
+    if backend is None:
+        backend = MemoryCacheBackend()
+
+    return ExtractionCache(
+        backend,
+        max_entries=config.get('extraction_cache_max_entries', 10000),
+        max_age=config.get('extraction_cache_max_age_days', 30) * 24 * 3600
+    )
+
+def get_cache():
+    """获取全局提取缓存实例"""
+    global _cache
+    if _cache is _UNSET:
+        with _cache_lock:
+            if _cache is _UNSET:
+                _cache = create_cache_from_config()
+    return _cache
+
+# fork出的工作进程丢弃的父进程缓存实例，保留引用避免在子进程中关闭父进程的SQLite连接
+_abandoned = []
+
+def reset_cache_after_fork():
+    """
+    工作进程启动时调用：SQLite连接不能跨fork使用，
+    丢弃从父进程继承的缓存实例，之后由get_cache()在本进程中重新打开
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is not _UNSET and _cache is not None:
+            _abandoned.append(_cache)
+        _cache = _UNSET
+
+def set_cache(cache):
+    """替换全局缓存实例（用于接入其他存储后端）"""
+    global _cache
+    with _cache_lock:
+        _cache = cache
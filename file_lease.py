@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import socket
+import secrets
+import logging
+import threading
+from config_manager import config
+
+# 租约文件保存在发票目录下的隐藏子目录中
+LEASE_DIRNAME = '.invoice_leases'
+LEASE_SUFFIX = '.lease'
+DONE_SUFFIX = '.done'
+BREAK_SUFFIX = '.break'
+
+def lease_dir(folder):
+    return os.path.join(folder, LEASE_DIRNAME)
+
+def _create_exclusive(path, data=b''):
+    """以O_EXCL方式创建文件，已存在时抛出FileExistsError（在NFS v3+等共享存储上同样是原子操作）"""
+    fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+def _age(path):
+    """文件距上次心跳的秒数，文件不存在时返回None"""
+    try:
+        return time.time() - os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+def _read_owner(path):
+    """读取租约记录的持有者，文件不存在或内容不完整时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('owner')
+    except (OSError, ValueError):
+        return None
+
+def done_marker(file_path):
+    """文件的处理完成标记路径"""
+    folder, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(lease_dir(folder), name + DONE_SUFFIX)
+
+def done_names(folder):
+    """目录中已由某个节点处理完成的文件名（一次scandir）"""
+    try:
+        with os.scandir(lease_dir(folder)) as entries:
+            return {entry.name[:-len(DONE_SUFFIX)] for entry in entries if entry.name.endswith(DONE_SUFFIX)}
+    except FileNotFoundError:
+        return set()
+
+class LeaseManager:
+    """
+    基于租约文件的多节点协调，不依赖外部服务
+    处理文件前在 .invoice_leases/ 中以O_EXCL创建 <文件名>.lease，创建成功的节点获得处理权；
+    后台线程定期更新持有租约的修改时间作为心跳，超过ttl没有心跳的租约视为持有者已退出，可被其他节点接管。
+    心跳和释放前都会核对租约中记录的持有者，租约已被接管时不会更新或删除新持有者的租约。
+    处理完成后为新文件名写入 .done 标记，其他节点扫描目录时跳过这些文件。
+    各节点的时钟需要同步（误差应远小于ttl）。
+    """
+
+    def __init__(self, ttl=None, heartbeat=None, owner=None):
+        self.ttl = ttl or config.get('lease_ttl_seconds', 120)
+        self.heartbeat = heartbeat or config.get('lease_heartbeat_seconds', self.ttl / 4)
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.pid = os.getpid()
+        self._held = {}
+        self._lost = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @staticmethod
+    def lease_path(file_path):
+        folder, name = os.path.split(os.path.abspath(file_path))
+        return os.path.join(lease_dir(folder), name + LEASE_SUFFIX)
+
+    def acquire(self, file_path):
+        """
+        尝试获得文件的处理权
+
+        Returns:
+            获得租约返回True，其他节点正在处理时返回False
+        """
+        path = self.lease_path(file_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        record = json.dumps({'owner': self.owner, 'file': os.path.basename(file_path), 'acquired': time.time()})
+        for attempt in range(2):
+            try:
+                _create_exclusive(path, record.encode('utf-8'))
+            except FileExistsError:
+                if attempt == 0 and self._break_stale(path):
+                    continue
+                return False
+            with self._lock:
+                self._held[path] = file_path
+                self._lost.discard(path)
+                self._ensure_heartbeat()
+            return True
+        return False
+
+    def owns(self, file_path):
+        """本节点是否仍持有文件的租约（核对租约文件中记录的持有者）"""
+        path = self.lease_path(file_path)
+        with self._lock:
+            if path not in self._held:
+                return False
+        if _read_owner(path) != self.owner:
+            self._mark_lost(path)
+            return False
+        return True
+
+    def _mark_lost(self, path):
+        logging.warning(f"租约已丢失（被其他节点接管）: {path}")
+        with self._lock:
+            self._held.pop(path, None)
+            self._lost.add(path)
+
+    def _break_stale(self, path):
+        """
+        接管过期租约：先以O_EXCL创建 .break 文件，保证同一时刻只有一个节点在判断和删除，
+        持有 .break 后再次确认租约仍然过期才删除
+        """
+        age = _age(path)
+        if age is None:
+            return True
+        if age < self.ttl:
+            return False
+        breaker = path + BREAK_SUFFIX
+        try:
+            _create_exclusive(breaker)
+        except FileExistsError:
+            # 接管中的节点异常退出会留下 .break 文件，同样按ttl清理
+            if (_age(breaker) or 0) > self.ttl:
+                self._remove(breaker)
+            return False
+        try:
+            age = _age(path)
+            if age is not None and age < self.ttl:
+                return False
+            logging.warning(f"租约已过期（{age:.0f}秒无心跳），接管处理: {path}" if age is not None
+                            else f"租约已释放: {path}")
+            self._remove(path)
+            return True
+        finally:
+            self._remove(breaker)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def release(self, file_path, new_path=None):
+        """
+        释放租约，处理成功时为新文件名写入完成标记
+
+        Args:
+            new_path: 重命名后的路径，None表示未处理成功
+        """
+        path = self.lease_path(file_path)
+        if new_path:
+            try:
+                with open(done_marker(new_path), 'w') as f:
+                    f.write(self.owner)
+            except OSError as e:
+                logging.warning(f"写入完成标记失败: {new_path} ({e})")
+        with self._lock:
+            self._held.pop(path, None)
+            lost = path in self._lost
+            self._lost.discard(path)
+        # 只删除自己的租约，已被其他节点接管的租约保留给新持有者
+        if not lost and _read_owner(path) == self.owner:
+            self._remove(path)
+
+    def _ensure_heartbeat(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._heartbeat_loop, name='lease-heartbeat', daemon=True)
+            self._thread.start()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat)
+            self.beat()
+
+    def beat(self):
+        """更新所有仍由本节点持有的租约的心跳"""
+        with self._lock:
+            held = list(self._held)
+        for path in held:
+            if _read_owner(path) != self.owner:
+                self._mark_lost(path)
+                continue
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                self._mark_lost(path)
+            except OSError as e:
+                logging.warning(f"更新租约心跳失败: {path} ({e})")
+
+_manager = None
+
+def get_lease_manager():
+    """当前进程的租约管理器（进程池fork出的工作进程各自创建）"""
+    global _manager
+    if _manager is None or _manager.pid != os.getpid():
+        _manager = LeaseManager()
+    return _manager
+
+def process_claimed(file_path):
+    """
+    获得租约后处理文件，其他节点正在处理或已处理完成时跳过
+    重命名前再次核对租约，已被其他节点接管时放弃重命名；
+    重命名本身使用O_EXCL预留目标文件名，不会覆盖已有文件
+
+    Returns:
+        process_invoice的结果，跳过时包含 'skipped': True
+    """
+    from invoice_pipeline import process_invoice
+    manager = get_lease_manager()
+    skipped = {'original_path': file_path, 'success': True, 'skipped': True, 'new_path': None}
+    if not manager.acquire(file_path):
+        logging.info(f"其他节点正在处理，跳过: {file_path}")
+        return skipped
+    new_path = None
+    try:
+        if not os.path.exists(file_path) or os.path.exists(done_marker(file_path)):
+            logging.info(f"文件已被其他节点处理，跳过: {file_path}")
+            return skipped
+        try:
+            result = process_invoice(file_path, claim_check=lambda: manager.owns(file_path))
+        except Exception as e:
+            logging.error(f"处理文件失败 {file_path}: {e}", exc_info=True)
+            result = {'original_path': file_path, 'success': False, 'error': str(e)}
+        if not result.get('success') and not manager.owns(file_path):
+            return skipped
+        new_path = result.get('new_path') if result.get('success') else None
+        return result
+    finally:
+        manager.release(file_path, new_path)
@@ -0,0 +1,315 @@
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+from concurrent.futures import FIRST_COMPLETED, wait
+from config_manager import config
+from invoice_pipeline import process_invoice
+from worker_pool import create_cpu_executor
+
+# inotify事件掩码
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT_HEADER = struct.Struct('iIII')
+
+# 文件结尾标记：PDF以%%EOF结束，OFD（ZIP）以中央目录结束记录结束
+PDF_TRAILER = b'%%EOF'
+ZIP_END_RECORD = b'PK\x05\x06'
+TAIL_BYTES = {'.pdf': 1024, '.ofd': 65536 + 22}
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+class InotifyWatcher:
+    """基于Linux inotify的目录监视，没有事件时不产生任何开销"""
+
+    def __init__(self, folders):
+        self._libc = _load_libc()
+        if self._libc is None:
+            raise OSError("当前系统不支持inotify")
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        self._folders = {}
+        for folder in folders:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), WATCH_MASK)
+            if wd < 0:
+                self.close()
+                raise OSError(ctypes.get_errno(), f"无法监视目录: {folder}")
+            self._folders[wd] = folder
+
+    def poll(self, timeout):
+        """
+        等待最多timeout秒，返回 [(文件路径, 是否写入完成)]
+        队列溢出时返回 [(目录, None)]，调用方需要重新扫描该目录
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.extend((folder, None) for folder in self._folders.values())
+                continue
+            folder = self._folders.get(wd)
+            if folder is None or mask & IN_ISDIR or not name:
+                continue
+            closed = bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))
+            events.append((os.path.join(folder, os.fsdecode(name)), closed))
+        return events
+
+    def close(self):
+        if self._fd is not None and self._fd >= 0:
+            os.close(self._fd)
+        self._fd = None
+
+class PollingWatcher:
+    """
+    轮询监视，用于网络挂载等不支持inotify的目录
+    每次只检查目录的修改时间，目录内容变化时才列出文件，
+    另外每隔rescan秒完整扫描一次，防止网络文件系统的属性缓存漏掉变化
+    """
+
+    def __init__(self, folders, rescan=None):
+        self.rescan = rescan or config.get('watch_rescan_seconds', 60)
+        self._state = {}
+        for folder in folders:
+            self._state[folder] = (self._mtime(folder), self._names(folder))
+        self._last_rescan = time.monotonic()
+
+    @staticmethod
+    def _mtime(folder):
+        try:
+            return os.stat(folder).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def _names(folder):
+        try:
+            with os.scandir(folder) as entries:
+                return {entry.name for entry in entries if entry.is_file()}
+        except OSError as e:
+            logging.warning(f"扫描目录失败: {folder} ({e})")
+            return set()
+
+    def poll(self, timeout):
+        time.sleep(timeout)
+        full_rescan = time.monotonic() - self._last_rescan >= self.rescan
+        if full_rescan:
+            self._last_rescan = time.monotonic()
+        events = []
+        for folder, (mtime, names) in self._state.items():
+            current_mtime = self._mtime(folder)
+            if current_mtime == mtime and not full_rescan:
+                continue
+            current_names = self._names(folder)
+            events.extend((os.path.join(folder, name), False) for name in current_names - names)
+            self._state[folder] = (current_mtime, current_names)
+        return events
+
+    def close(self):
+        pass
+
+def looks_complete(file_path):
+    """
+    检查文件是否已写完：PDF末尾应有%%EOF，OFD末尾应有ZIP中央目录结束记录
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    tail_bytes = TAIL_BYTES.get(ext)
+    if tail_bytes is None:
+        return True
+    try:
+        with open(file_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - tail_bytes))
+            tail = f.read()
+    except OSError:
+        return False
+    return (PDF_TRAILER if ext == '.pdf' else ZIP_END_RECORD) in tail
+
+def process_arrival(file_path):
+    """在工作进程中处理新到达的文件，异常转换为失败结果"""
+    try:
+        return process_invoice(file_path)
+    except Exception as e:
+        logging.error(f"处理文件失败 {file_path}: {e}", exc_info=True)
+        return {'original_path': file_path, 'success': False, 'error': str(e)}
+
+class FolderWatcher:
+    """
+    监视目录，只处理新到达的PDF/OFD文件并立即重命名
+    新文件在大小和修改时间保持settle秒不变、且文件结尾完整后才提交处理（防止读到写了一半的文件），
+    处理在常驻的进程池中进行，二维码后端在每个工作进程中只加载一次
+    """
+
+    def __init__(self, folders, workers=None, use_polling=False, settle=None, warmup_decoders=True,
+                 log_level=logging.INFO, coordinate=False):
+        """
+        Args:
+            folders: 要监视的目录列表（不含子目录）
+            workers: 工作进程数，默认等于CPU核数
+            use_polling: 强制使用轮询（网络挂载的目录收不到inotify事件）
+            settle: 文件大小和修改时间保持不变多少秒后才处理，默认使用配置项watch_settle_seconds
+            warmup_decoders: 工作进程启动时预加载二维码识别后端
+            coordinate: 多节点协调模式，处理前通过租约文件认领，多台机器可同时监视同一共享目录
+        """
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.workers = workers or os.cpu_count() or 1
+        self.settle = config.get('watch_settle_seconds', 2.0) if settle is None else settle
+        self.max_wait = config.get('watch_max_wait_seconds', 120)
+        self.poll_interval = config.get('watch_poll_interval', 2.0)
+        self.formats = tuple(ext.lower() for ext in config.get('supported_formats', ['.pdf', '.ofd']))
+        self.use_polling = use_polling
+        self.warmup_decoders = warmup_decoders
+        self.log_level = log_level
+        self.coordinate = coordinate
+        self.produced_ttl = config.get('watch_produced_ttl_seconds', 60)
+        self.pending = {}
+        self.inflight = {}
+        # 自己重命名产生的文件 -> 忽略其事件的截止时间
+        self.produced = {}
+        self.stats = {'processed': 0, 'failed': 0}
+
+    def _open_watcher(self):
+        if not self.use_polling:
+            try:
+                watcher = InotifyWatcher(self.folders)
+                logging.info(f"使用inotify监视目录: {', '.join(self.folders)}")
+                return watcher
+            except OSError as e:
+                logging.warning(f"inotify不可用，改用轮询: {e}")
+        logging.info(f"轮询监视目录（间隔{self.poll_interval}秒）: {', '.join(self.folders)}")
+        return PollingWatcher(self.folders)
+
+    def _rescan(self, folder):
+        """inotify队列溢出后，将目录中尚未处理的文件重新加入等待队列"""
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    self._arrived(entry.path, False)
+
+    def _arrived(self, file_path, closed):
+        """记录新到达或正在写入的文件"""
+        if not file_path.lower().endswith(self.formats) or file_path in self.inflight.values():
+            return
+        now = time.monotonic()
+        if file_path in self.produced:
+            # 自己重命名产生的文件：一次重命名会产生占位文件的IN_CREATE、IN_CLOSE_WRITE和IN_MOVED_TO
+            # 多个事件，且可能早于或晚于处理结果到达，在produced_ttl内全部忽略
+            if now < self.produced[file_path]:
+                return
+            del self.produced[file_path]
+        entry = self.pending.get(file_path)
+        if entry is None:
+            self.pending[file_path] = {'stat': None, 'since': now, 'first_seen': now, 'closed': closed}
+        else:
+            entry['since'] = now
+            entry['closed'] = entry['closed'] or closed
+
+    def _check_pending(self, executor):
+        """提交已经写完的文件"""
+        now = time.monotonic()
+        for file_path, entry in list(self.pending.items()):
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                self.pending.pop(file_path, None)
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if signature != entry['stat']:
+                entry['stat'] = signature
+                entry['since'] = now
+                continue
+            settled = now - entry['since'] >= self.settle
+            expired = now - entry['first_seen'] >= self.max_wait
+            if not (settled and (looks_complete(file_path) or expired)):
+                continue
+            del self.pending[file_path]
+            task = process_arrival
+            if self.coordinate:
+                from file_lease import process_claimed
+                task = process_claimed
+            self.inflight[executor.submit(task, file_path)] = file_path
+
+    def _expire_produced(self):
+        now = time.monotonic()
+        for file_path in [path for path, until in self.produced.items() if until <= now]:
+            del self.produced[file_path]
+
+    def _collect(self, timeout=0):
+        """收集已完成的处理结果"""
+        self._expire_produced()
+        if not self.inflight:
+            return
+        done, _ = wait(list(self.inflight), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            file_path = self.inflight.pop(future)
+            result = future.result()
+            if result.get('skipped'):
+                continue
+            if result.get('success'):
+                self.stats['processed'] += 1
+                new_path = result['new_path']
+                if new_path != file_path:
+                    # 重命名事件可能先于处理结果到达，已在等待队列中的直接移除
+                    self.pending.pop(new_path, None)
+                    self.produced[new_path] = time.monotonic() + self.produced_ttl
+                logging.info(f"已处理新文件: {file_path} -> {new_path} (来源: {result.get('source')})")
+            else:
+                self.stats['failed'] += 1
+                logging.warning(f"处理新文件失败: {file_path} ({result.get('error')})")
+
+    def run(self, should_stop=None):
+        """
+        持续监视直到should_stop()返回True或收到Ctrl+C
+
+        Args:
+            should_stop: 可选的停止条件函数
+        """
+        watcher = self._open_watcher()
+        executor = create_cpu_executor(self.workers, 'process', self.warmup_decoders, self.log_level)
+        timeout = self.poll_interval if isinstance(watcher, PollingWatcher) else min(1.0, max(0.1, self.settle / 2))
+        try:
+            while not (should_stop and should_stop()):
+                for file_path, closed in watcher.poll(timeout):
+                    if closed is None:
+                        self._rescan(file_path)
+                    else:
+                        self._arrived(file_path, closed)
+                self._check_pending(executor)
+                self._collect()
+        except KeyboardInterrupt:
+            logging.info("停止监视目录")
+        finally:
+            watcher.close()
+            self._collect(timeout=None)
+            executor.shutdown(wait=True)
+        return self.stats
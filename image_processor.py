@@ -1,10 +1,187 @@
 import os
+import json
+import time
+import atexit
 import logging
+import threading
+from PIL import Image
+from config_manager import config
+
+try:
+    import fcntl
+except ImportError:
+    # Windows没有fcntl，统计文件不加锁（多进程同时写入时可能丢失少量计数）
+    fcntl = None
+
+# 二维码候选区域，按页面比例表示 (左, 上, 右, 下)
+# 电子发票的二维码通常位于页面的某个角落
+DEFAULT_QR_WINDOWS = {
+    "top_left": [0.0, 0.0, 0.3, 0.35],
+    "top_right": [0.7, 0.0, 1.0, 0.35],
+    "bottom_left": [0.0, 0.65, 0.3, 1.0],
+    "bottom_right": [0.7, 0.65, 1.0, 1.0]
+}
+
+FULL_PAGE = "full"
+
+_stats = None
+# 本进程尚未写入文件的命中次数：{版式: {区域: 次数}}
+_pending = {}
+_pending_count = 0
+_last_flush = time.monotonic()
+_pending_pid = os.getpid()
+_stats_lock = threading.Lock()
+
+# 累积这么多次命中或距上次写入超过flush间隔后才写文件
+FLUSH_HITS = 20
+
+def get_qr_windows():
+    """获取配置的二维码候选区域"""
+    return config.get("qr_roi_windows", DEFAULT_QR_WINDOWS)
+
+def _stats_path():
+    return config.get("qr_roi_stats_path") or os.path.join(config.get("temp_dir", "./tmp"), "qr_roi_stats.json")
+
+def _read_stats_file(path):
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except Exception as e:
+        logging.warning(f"加载二维码区域统计失败: {e}")
+    return {}
+
+def _load_stats():
+    global _stats
+    if _stats is None:
+        _stats = _read_stats_file(_stats_path())
+    return _stats
+
+def _merge(target, delta):
+    for key, windows in delta.items():
+        layout_stats = target.setdefault(key, {})
+        for window_name, count in windows.items():
+            layout_stats[window_name] = layout_stats.get(window_name, 0) + count
+
+def _flush_stats():
+    """
+    把本进程累积的命中次数合并进统计文件
+    多个工作进程同时写入时用文件锁串行化"读取-合并-写入"，写入先写临时文件再原子替换，
+    合并后重新读取文件，使本进程也能看到其他进程的统计
+    """
+    global _stats, _pending, _pending_count, _last_flush
+    if not _pending:
+        return
+    path = _stats_path()
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{path}.lock", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            merged = _read_stats_file(path)
+            _merge(merged, _pending)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(merged, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        _stats = merged
+        _pending = {}
+        _pending_count = 0
+    except Exception as e:
+        logging.warning(f"保存二维码区域统计失败: {e}")
+    _last_flush = time.monotonic()
+
+def flush_stats():
+    """立即写入本进程累积的统计（进程退出时自动调用）"""
+    with _stats_lock:
+        _flush_stats()
+
+atexit.register(flush_stats)
+
+def _check_fork():
+    """
+    进程池fork出的工作进程丢弃继承自父进程的未写入计数（由父进程负责写入），
+    并注册退出时写入：工作进程以os._exit退出，不会执行atexit
+    """
+    global _pending, _pending_count, _pending_pid
+    if _pending_pid == os.getpid():
+        return
+    _pending = {}
+    _pending_count = 0
+    _pending_pid = os.getpid()
+    from multiprocessing import util
+    util.Finalize(None, flush_stats, exitpriority=10)
+
+def layout_key(width, height):
+    """
+    根据页面宽高比生成版式标识，相同版式的发票二维码位置基本一致
+    """
+    if not height:
+        return "unknown"
+    ratio = round(width / height * 20) / 20
+    return f"r{ratio:.2f}"
+
+def ordered_windows(key):
+    """按该版式历史命中次数排序候选区域，命中多的先尝试"""
+    windows = get_qr_windows()
+    with _stats_lock:
+        hits = dict(_load_stats().get(key, {}))
+    names = list(windows)
+    return sorted(names, key=lambda name: (-hits.get(name, 0), names.index(name)))
+
+def record_qr_hit(key, window_name):
+    """
+    记录某版式在某区域识别成功
+    命中先累积在内存中并立即影响本进程的排序，批量合并写入文件
+    """
+    global _pending_count
+    with _stats_lock:
+        _check_fork()
+        delta = {key: {window_name: 1}}
+        _merge(_load_stats(), delta)
+        _merge(_pending, delta)
+        _pending_count += 1
+        interval = config.get("qr_roi_stats_flush_seconds", 30)
+        if _pending_count >= FLUSH_HITS or time.monotonic() - _last_flush >= interval:
+            _flush_stats()
+
+def crop_window(img, window):
+    """按比例区域裁剪PIL图像"""
+    left, top, right, bottom = window
+    box = (
+        int(img.width * left),
+        int(img.height * top),
+        int(img.width * right),
+        int(img.height * bottom)
+    )
+    return img.crop(box)
+
+def iter_qr_regions(img):
+    """
+    依次生成二维码候选区域 (区域名, 图像)
+    先按学习到的顺序尝试各角落区域，最后才是整页
+    """
+    windows = get_qr_windows()
+    for name in ordered_windows(layout_key(img.width, img.height)):
+        yield name, crop_window(img, windows[name])
+    yield FULL_PAGE, img
 
 def crop_image(image_path, output_dir):
     """
-    裁剪图像的简化版本 - 实际不进行裁剪
-    此版本仅用于保持API兼容性，不实际处理图像
+    将图像裁剪到该版式最可能包含二维码的区域，保存到output_dir并返回新路径
     """
-    logging.info(f"图像处理已简化，不进行实际裁剪: {image_path}")
-    return image_path
+    try:
+        img = Image.open(image_path)
+        windows = get_qr_windows()
+        name = ordered_windows(layout_key(img.width, img.height))[0]
+        cropped = crop_window(img, windows[name])
+        base_name, ext = os.path.splitext(os.path.basename(image_path))
+        output_path = os.path.join(output_dir, f"{base_name}_{name}{ext or '.png'}")
+        cropped.save(output_path)
+        logging.info(f"裁剪二维码区域({name}): {image_path} -> {output_path}")
+        return output_path
+    except Exception as e:
+        logging.warning(f"裁剪图像失败，使用原图: {e}")
+        return image_path
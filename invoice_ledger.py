@@ -0,0 +1,242 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+from decimal import Decimal, InvalidOperation
+from config_manager import config
+from extraction_cache import file_sha256
+
+# 每个发票目录中的清单文件
+LEDGER_FILENAME = '.invoice_ledger.sqlite3'
+
+# 重命名后的文件名格式：[¥金额]发票号码.ext 或 发票号码.ext（重名时带 _序号）
+AMOUNT_IN_NAME = re.compile(r'\[¥([0-9][0-9,]*(?:\.[0-9]+)?)\]')
+NUMBER_IN_NAME = re.compile(r'(?<!\d)(\d{8,20})(?!\d)')
+
+FEN = Decimal('0.01')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT,
+    invoice_number TEXT,
+    amount_fen INTEGER,
+    source TEXT,
+    updated REAL NOT NULL,
+    extracted INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+def parse_amount(text):
+    """将金额文本解析为精确到分的Decimal，无法解析时返回None"""
+    if text is None:
+        return None
+    try:
+        return Decimal(str(text).replace(',', '')).quantize(FEN)
+    except (InvalidOperation, ValueError):
+        return None
+
+def to_fen(amount):
+    """Decimal金额转换为整数分"""
+    return int(amount * 100) if amount is not None else None
+
+def format_fen(fen):
+    """整数分格式化为两位小数的金额文本"""
+    return str((Decimal(fen or 0) / 100).quantize(FEN))
+
+def parse_invoice_name(filename):
+    """从重命名后的文件名中解析 (发票号码, 金额)"""
+    amount_match = AMOUNT_IN_NAME.search(filename)
+    amount = parse_amount(amount_match.group(1)) if amount_match else None
+    rest = filename[amount_match.end():] if amount_match else filename
+    number_match = NUMBER_IN_NAME.search(os.path.splitext(rest)[0])
+    return (number_match.group(1) if number_match else None), amount
+
+class InvoiceLedger:
+    """
+    发票目录的增量清单
+    记录每个文件的大小、修改时间、内容哈希、发票号码和金额（整数分），
+    刷新时只处理新增或大小/修改时间变化的文件，合计由SQLite直接对整数分求和，结果精确到分
+
+    用法:
+        with InvoiceLedger(folder) as ledger:
+            ledger.refresh()
+            total = ledger.total()
+    """
+
+    def __init__(self, folder, extract=None, path=None):
+        """
+        Args:
+            folder: 发票目录
+            extract: 文件名中没有金额时是否解析文件内容获取，默认使用配置项ledger_extract
+            path: 清单文件路径，默认为目录下的.invoice_ledger.sqlite3
+        """
+        self.folder = folder
+        self.extract = config.get('ledger_extract', False) if extract is None else extract
+        self.path = path or os.path.join(folder, LEDGER_FILENAME)
+        self.formats = tuple(ext.lower() for ext in config.get('supported_formats', ['.pdf', '.ofd']))
+        self.last_refresh = None
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(SCHEMA)
+        # 旧版清单没有extracted列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(invoices)")}
+        if 'extracted' not in columns:
+            self._conn.execute("ALTER TABLE invoices ADD COLUMN extracted INTEGER NOT NULL DEFAULT 0")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _describe(self, file_path, filename):
+        """
+        读取新增或变化的文件：计算哈希，从文件名或内容中获取发票号码和金额
+        最后一项表示是否已解析过内容，开启extract后只重新读取尚未解析过内容且没有金额的文件
+        """
+        content_hash = file_sha256(file_path)
+        invoice_number, amount = parse_invoice_name(filename)
+        source = 'filename' if amount is not None else None
+        extracted = 0
+        if amount is None and self.extract:
+            from invoice_pipeline import extract_invoice
+            info = extract_invoice(file_path, content_hash) or {}
+            amount = parse_amount(info.get('amount'))
+            invoice_number = info.get('invoice_number') or invoice_number
+            source = info.get('source')
+            extracted = 1
+        return content_hash, invoice_number, to_fen(amount), source, extracted
+
+    def refresh(self):
+        """
+        用os.scandir比对目录与清单：新增和变化的文件重新读取，已删除的文件移出清单；
+        开启extract时，之前未解析内容而没有金额的文件也重新读取
+
+        Returns:
+            {'scanned', 'added', 'updated', 'removed', 'unchanged', 'elapsed_ms'}
+        """
+        start = time.perf_counter()
+        known = {
+            name: ((size, mtime_ns), amount_fen is None and not extracted)
+            for name, size, mtime_ns, amount_fen, extracted in self._conn.execute(
+                "SELECT name, size, mtime_ns, amount_fen, extracted FROM invoices")
+        }
+        stats = {'scanned': 0, 'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        rows = []
+        seen = set()
+
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(self.formats) or not entry.is_file():
+                    continue
+                stats['scanned'] += 1
+                seen.add(entry.name)
+                stat = entry.stat()
+                previous, needs_extract = known.get(entry.name, (None, False))
+                if previous == (stat.st_size, stat.st_mtime_ns) and not (self.extract and needs_extract):
+                    stats['unchanged'] += 1
+                    continue
+                try:
+                    described = self._describe(entry.path, entry.name)
+                except OSError as e:
+                    logging.warning(f"读取发票文件失败，跳过: {entry.path} ({e})")
+                    continue
+                stats['added' if previous is None else 'updated'] += 1
+                rows.append((entry.name, stat.st_size, stat.st_mtime_ns, *described, time.time()))
+
+        removed = [(name,) for name in known if name not in seen]
+        stats['removed'] = len(removed)
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO invoices "
+                "(name, size, mtime_ns, content_hash, invoice_number, amount_fen, source, extracted, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("DELETE FROM invoices WHERE name = ?", removed)
+
+        stats['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        self.last_refresh = stats
+        logging.info(f"发票清单已更新: {self.folder} {stats}")
+        return stats
+
+    def total(self):
+        """所有发票金额的精确合计（Decimal）"""
+        fen = self._conn.execute("SELECT COALESCE(SUM(amount_fen), 0) FROM invoices").fetchone()[0]
+        return Decimal(fen) / 100
+
+    def entries(self):
+        """清单中的所有记录"""
+        cursor = self._conn.execute(
+            "SELECT name, invoice_number, amount_fen, content_hash, source FROM invoices ORDER BY name"
+        )
+        return [
+            {
+                'name': name,
+                'invoice_number': invoice_number,
+                'amount': format_fen(amount_fen) if amount_fen is not None else None,
+                'content_hash': content_hash,
+                'source': source
+            }
+            for name, invoice_number, amount_fen, content_hash, source in cursor
+        ]
+
+    def summary(self):
+        """目录汇总：文件数、有金额的文件数、合计金额、重复内容的文件数"""
+        count, with_amount, total_fen = self._conn.execute(
+            "SELECT COUNT(*), COUNT(amount_fen), COALESCE(SUM(amount_fen), 0) FROM invoices"
+        ).fetchone()
+        duplicates = self._conn.execute(
+            "SELECT COALESCE(SUM(n - 1), 0) FROM "
+            "(SELECT COUNT(*) AS n FROM invoices WHERE content_hash IS NOT NULL GROUP BY content_hash HAVING n > 1)"
+        ).fetchone()[0]
+        return {
+            'folder': self.folder,
+            'count': count,
+            'with_amount': with_amount,
+            'total': format_fen(total_fen),
+            'duplicates': duplicates,
+            'refresh': self.last_refresh
+        }
+
+def write_total_file(folder, total):
+    """
+    在目录中以合计金额命名汇总文件（如 1234.56.txt）
+    已有.txt文件时重命名该文件，否则新建
+    """
+    formatted_total = str(Decimal(total).quantize(FEN))
+    new_filepath = os.path.join(folder, f"{formatted_total}.txt")
+    with os.scandir(folder) as entries:
+        existing = next((entry.path for entry in entries if entry.name.endswith(".txt") and entry.is_file()), None)
+    if existing:
+        try:
+            os.replace(existing, new_filepath)
+            return new_filepath
+        except FileNotFoundError:
+            # 另一个进程刚刚重命名了这个文件，改为新建
+            logging.info(f"汇总文件已被其他进程重命名: {existing}")
+    with open(new_filepath, 'w') as f:
+        f.write(f"Total amount: ¥{formatted_total}\n")
+    return new_filepath
+
+def sum_folder(folder, extract=None, write_total=True):
+    """
+    增量更新目录的发票清单并返回汇总
+
+    Args:
+        folder: 发票目录
+        extract: 文件名中没有金额时是否解析文件内容
+        write_total: 是否写出以合计金额命名的.txt文件
+    """
+    with InvoiceLedger(folder, extract) as ledger:
+        ledger.refresh()
+        summary = ledger.summary()
+    if write_total:
+        write_total_file(folder, summary['total'])
+    return summary
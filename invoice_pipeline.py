@@ -0,0 +1,115 @@
+import os
+import time
+import logging
+from data_extractor import extract_invoice_info_from_pdf
+from pdf_processor import process_special_pdf
+from ofd_processor import process_ofd, extract_ofd_info
+from extraction_cache import get_cache, file_sha256, CACHEABLE_SOURCES
+
+def extract_invoice(file_path, content_hash=None):
+    """
+    提取发票信息（每个文件只解析一次），相同内容的文件直接命中缓存
+
+    Args:
+        file_path: 发票文件路径
+        content_hash: 已知的文件内容SHA-256，未提供时按需计算
+
+    Returns:
+        {'invoice_number': ..., 'amount': ..., 'source': ..., 'content_hash': ..., 'cached': ...}，
+        不支持的格式返回None
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == '.pdf':
+        extractor = extract_invoice_info_from_pdf
+    elif ext == '.ofd':
+        extractor = extract_ofd_info
+    else:
+        logging.warning(f"不支持的文件类型: {ext}")
+        return None
+
+    cache = get_cache()
+    if cache is not None and content_hash is None:
+        try:
+            content_hash = file_sha256(file_path)
+        except OSError as e:
+            logging.warning(f"计算文件哈希失败: {e}")
+
+    if cache is not None and content_hash:
+        cached = cache.get(content_hash)
+        if cached:
+            logging.info(f"命中提取缓存: {file_path} ({content_hash[:12]})")
+            return {
+                'invoice_number': cached.get('invoice_number'),
+                'amount': cached.get('amount'),
+                'source': cached.get('source'),
+                'content_hash': content_hash,
+                'cached': True
+            }
+
+    info = extractor(file_path)
+    info['content_hash'] = content_hash
+    info['cached'] = False
+    if cache is not None and content_hash:
+        cache.put(content_hash, info)
+    return info
+
+def process_invoice(file_path, rename=True, content_hash=None, with_amount=None, claim_check=None):
+    """
+    发票处理流水线入口：提取一次信息，再按需重命名
+
+    Args:
+        file_path: 发票文件路径
+        rename: 是否根据提取结果重命名文件
+        content_hash: 已知的文件内容SHA-256
+        with_amount: 新文件名是否包含金额，None表示使用配置项rename_with_amount。
+            通过参数传递而不是临时修改全局配置，多个请求并发处理时互不影响
+        claim_check: 可选，重命名前调用，返回False时放弃重命名（多节点协调模式下租约已被接管）
+
+    Returns:
+        结果字典，包含 invoice_number、amount、source、content_hash、cached、
+        original_path、new_path、new_name、success、elapsed_ms（提取耗时）
+    """
+    result = {
+        'invoice_number': None,
+        'amount': None,
+        'source': None,
+        'content_hash': content_hash,
+        'cached': False,
+        'original_path': file_path,
+        'new_path': None,
+        'new_name': None,
+        'success': False,
+        'elapsed_ms': None
+    }
+
+    start = time.perf_counter()
+    info = extract_invoice(file_path, content_hash)
+    result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    if info is None:
+        result['error'] = "不支持的文件类型"
+        return result
+
+    result.update(info)
+    logging.info(f"提取结果 - 发票号: {info.get('invoice_number')}, 金额: {info.get('amount')}, 来源: {info.get('source')}")
+
+    if not rename:
+        # 只提取时，号码必须来自文件内容（二维码、文本层或OFD XML）才算成功
+        if result['source'] == 'generated':
+            result['invoice_number'] = None
+        result['success'] = bool(result['invoice_number']) and result['source'] in CACHEABLE_SOURCES
+        return result
+
+    if claim_check is not None and not claim_check():
+        result['error'] = "租约已被其他节点接管，放弃重命名"
+        return result
+
+    if file_path.lower().endswith('.pdf'):
+        new_path = process_special_pdf(file_path, info=info, with_amount=with_amount)
+    else:
+        new_path = process_ofd(file_path, "", False, info=info, with_amount=with_amount)
+
+    result['new_path'] = new_path
+    result['success'] = new_path is not None
+    if new_path:
+        result['new_name'] = os.path.basename(new_path)
+    return result
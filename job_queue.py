@@ -0,0 +1,150 @@
+import time
+import asyncio
+import logging
+import secrets
+from config_manager import config
+
+class Job:
+    """
+    后台处理任务：记录每个文件的状态，并把状态变化作为事件保存，
+    事件按顺序编号，断线重连的客户端可以从上次收到的编号继续接收
+    """
+
+    def __init__(self, filenames):
+        self.id = secrets.token_hex(8)
+        self.created = time.time()
+        self.finished = None
+        self.status = 'queued'
+        self.error = None
+        self.files = [{'filename': name, 'status': 'pending'} for name in filenames]
+        self.summary = {}
+        self.events = []
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self):
+        return self.status in ('done', 'failed')
+
+    def publish(self, event, data):
+        """记录一个事件并唤醒等待中的订阅者"""
+        self.events.append({'id': len(self.events), 'event': event, 'data': data})
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def set_status(self, status, error=None):
+        self.status = status
+        self.error = error
+        if self.done:
+            self.finished = time.time()
+        self.publish('status', self.snapshot(include_files=False))
+
+    def update_file(self, index, item, status):
+        """更新单个文件的处理结果"""
+        self.files[index] = {**item, 'status': status}
+        self.publish('file', {'index': index, **self.files[index]})
+
+    def progress(self):
+        completed = sum(1 for item in self.files if item['status'] != 'pending')
+        return {'completed': completed, 'total': len(self.files)}
+
+    def snapshot(self, include_files=True):
+        """任务的当前状态"""
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'error': self.error,
+            'created': self.created,
+            'finished': self.finished,
+            'progress': self.progress(),
+            **self.summary
+        }
+        if include_files:
+            data['files'] = self.files
+        return data
+
+    async def wait_events(self, since, timeout=None):
+        """
+        获取编号since之后的事件，没有新事件时等待
+        任务已结束或等待超时时返回空列表
+        """
+        while len(self.events) <= since:
+            if self.done:
+                return []
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        return self.events[since:]
+
+class JobQueue:
+    """
+    后台任务队列：任务按提交顺序排队，最多concurrency个任务同时执行
+    单个任务内文件的并发由工作池控制
+    """
+
+    def __init__(self, concurrency=None, ttl=None):
+        self.concurrency = concurrency or config.get('job_concurrency', 2)
+        self.ttl = ttl or config.get('job_ttl_seconds', 3600)
+        self.jobs = {}
+        self._queue = None
+        self._workers = []
+
+    def _ensure_workers(self):
+        """在事件循环中首次提交任务时启动后台工作协程"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if not self._workers:
+            self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.concurrency)]
+
+    async def _worker(self):
+        while True:
+            job, runner = await self._queue.get()
+            try:
+                job.set_status('running')
+                await runner(job)
+                job.set_status('done')
+            except Exception as e:
+                logging.error(f"后台任务{job.id}执行失败: {e}", exc_info=True)
+                job.set_status('failed', str(e))
+            finally:
+                self._queue.task_done()
+
+    def _cleanup(self):
+        """清理超过保留时间的已结束任务"""
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.done and now - job.finished > self.ttl]:
+            self.jobs.pop(job_id, None)
+
+    def submit(self, job, runner):
+        """
+        提交任务，立即返回
+
+        Args:
+            job: Job对象
+            runner: 协程函数，以job为参数，负责处理文件并调用job.update_file
+        """
+        self._cleanup()
+        self._ensure_workers()
+        self.jobs[job.id] = job
+        self._queue.put_nowait((job, runner))
+        job.publish('status', job.snapshot(include_files=False))
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def status(self):
+        return {
+            'concurrency': self.concurrency,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'jobs': len(self.jobs)
+        }
+
+_job_queue = None
+
+def get_job_queue():
+    """获取全局任务队列，并发数通过配置项job_concurrency调整"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
@@ -1,11 +1,16 @@
 import sys
 import os
-from pdf_processor import convert_to_image, process_special_pdf
-from image_processor import crop_image
-from data_extractor import scan_qrcode, extract_information, extract_information_from_pdf
-from file_processor import ensure_dir, rename_file, clean_up
+import glob
+import json
+import time
+import random
 import logging
-from ofd_processor import process_ofd  # 确保你已经创建了这个模块
+import argparse
+from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, wait
+from config_manager import config
+from invoice_pipeline import process_invoice
+from worker_pool import create_cpu_executor
+from invoice_ledger import sum_folder
 
 def toggle_debug_mode(debug_mode):
     if debug_mode:
@@ -15,93 +20,296 @@ def toggle_debug_mode(debug_mode):
         logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(sys.stdout)])
         print("Debug mode disabled.")
 
-toggle_debug_mode(True)
-
-def process_pdf(file_path, tmp_dir, keep_temp_files):  # 添加 keep_temp_files 参数
-    image_paths = convert_to_image(file_path, tmp_dir, pages=[0])  # 假设这个函数接受一个页码列表作为参数
-    if image_paths:
-        cropped_image_path = crop_image(image_paths[0], tmp_dir)
-        qrcode_data = scan_qrcode(cropped_image_path)
-        
-        if not keep_temp_files:  # 检查 keep_temp_files 参数
-            clean_up(*image_paths, cropped_image_path)  # 清理生成的图像文件
-
-        if qrcode_data:
-            invoice_number, amount = extract_information_from_pdf(qrcode_data, file_path)
-            if invoice_number and amount:
-                new_file_name = f"[¥{amount}]{invoice_number}.pdf"
-                new_file_path = rename_file(file_path, new_file_name)
-                print(f"Processed file: {new_file_path}")
+def batch_task(file_path):
+    """批量模式中在工作进程里处理单个文件，异常转换为失败结果"""
+    try:
+        result = process_invoice(file_path)
+    except Exception as e:
+        logging.error(f"处理文件失败 {file_path}: {e}", exc_info=True)
+        result = {'original_path': file_path, 'success': False, 'error': str(e)}
+    return result
+
+def collect_files(paths, recursive=False):
+    """
+    展开命令行参数中的文件、目录和通配符，返回支持格式的文件列表（去重并保持顺序）
+
+    Args:
+        paths: 文件路径、目录或glob模式（recursive时支持**）
+        recursive: 是否递归处理子目录
+    """
+    formats = tuple(ext.lower() for ext in config.get('supported_formats', ['.pdf', '.ofd']))
+    files = []
+    seen = set()
+
+    def add(file_path):
+        key = os.path.abspath(file_path)
+        if key not in seen and file_path.lower().endswith(formats):
+            seen.add(key)
+            files.append(file_path)
+
+    for path in paths:
+        matches = sorted(glob.glob(path, recursive=recursive)) if glob.has_magic(path) else [path]
+        for match in matches:
+            if os.path.isdir(match):
+                if recursive:
+                    for root, dirs, names in os.walk(match):
+                        dirs.sort()
+                        for name in sorted(names):
+                            add(os.path.join(root, name))
+                else:
+                    with os.scandir(match) as entries:
+                        for entry in sorted(entries, key=lambda e: e.name):
+                            if entry.is_file():
+                                add(entry.path)
+            elif os.path.isfile(match):
+                add(match)
+            else:
+                print(f"File not found: {match}", file=sys.stderr)
+    return files
+
+class BatchProgress:
+    """在标准错误输出上刷新进度和吞吐量"""
+
+    def __init__(self, total, interval=0.5):
+        self.total = total
+        self.interval = interval
+        self.completed = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self._last_print = 0.0
+        self._tty = sys.stderr.isatty()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def rate(self):
+        elapsed = self.elapsed()
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+    def update(self, success):
+        self.completed += 1
+        if not success:
+            self.failed += 1
+        now = time.perf_counter()
+        if self.completed == self.total or now - self._last_print >= (self.interval if self._tty else 10):
+            self._last_print = now
+            self.print()
+
+    def print(self, final=False):
+        remaining = (self.total - self.completed) / self.rate() if self.rate() else 0
+        line = (f"[{self.completed}/{self.total}] {self.rate():.1f} files/s, "
+                f"failed {self.failed}, elapsed {self.elapsed():.0f}s, eta {remaining:.0f}s")
+        if self._tty:
+            sys.stderr.write("\r" + line + ("\n" if final or self.completed == self.total else ""))
         else:
-            process_special_pdf(file_path)
-
-def process_file(file_path, keep_temp_files):  # 添加 keep_temp_files 参数
-    tmp_dir = "tmp"
-    ensure_dir(tmp_dir)
-    
-    if file_path.lower().endswith('.ofd'):
-        process_ofd(file_path, tmp_dir, keep_temp_files)  # 添加 keep_temp_files 参数
-    elif file_path.lower().endswith('.pdf'):
-        process_pdf(file_path, tmp_dir, keep_temp_files)  # 添加 keep_temp_files 参数
+            sys.stderr.write(line + "\n")
+        sys.stderr.flush()
+
+def _rebuild_executor(executor, workers, warmup_decoders, log_level):
+    """丢弃已损坏的进程池并创建新的进程池，批量处理继续进行"""
+    logging.warning("工作进程异常退出，重新创建进程池")
+    executor.shutdown(wait=False)
+    return create_cpu_executor(workers, 'process', warmup_decoders, log_level)
+
+def run_batch(files, workers=None, warmup_decoders=False, log_level=logging.INFO, task=batch_task):
+    """
+    在常驻进程池中并行处理文件
+    同时提交的任务数限制为工作进程数的4倍，文件数很多时内存占用保持平稳
+
+    Args:
+        task: 在工作进程中处理单个文件的函数，多节点协调时为file_lease.process_claimed
+
+    Returns:
+        (每个文件的结果列表, 汇总信息)
+    """
+    workers = workers or os.cpu_count() or 1
+    progress = BatchProgress(len(files))
+    results = []
+
+    if workers == 1:
+        # 单进程直接处理，不创建进程池
+        for file_path in files:
+            result = task(file_path)
+            results.append(result)
+            progress.update(result.get('success', False))
     else:
-        print(f"Unsupported file format: {file_path}")
-
-    if not keep_temp_files:
-        # 删除临时目录
-        for file_name in os.listdir(tmp_dir):
-            file_path = os.path.join(tmp_dir, file_name)
-            try:
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
-            except Exception as e:
-                print(e)
-
-def extract_amount(filename):
-    import re
-    # 使用正则表达式提取金额
-    match = re.search(r'\[¥([0-9.]+)\]', filename)
-    if match:
-        return float(match.group(1))
-    return 0.0
+        executor = create_cpu_executor(workers, 'process', warmup_decoders, log_level)
+        try:
+            queue = iter(files)
+            # 正在处理的任务 -> (文件路径, 提交时进程池的代数)
+            running = {}
+            generation = 0
+            max_pending = workers * 4
+            while True:
+                for file_path in queue:
+                    try:
+                        future = executor.submit(task, file_path)
+                    except BrokenExecutor:
+                        executor = _rebuild_executor(executor, workers, warmup_decoders, log_level)
+                        generation += 1
+                        future = executor.submit(task, file_path)
+                    running[future] = (file_path, generation)
+                    if len(running) >= max_pending:
+                        break
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    file_path, submitted_generation = running.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenExecutor as e:
+                        # 工作进程异常退出（如识别库的原生代码崩溃），进程池中正在处理的文件都记为失败
+                        broken = broken or submitted_generation == generation
+                        logging.error(f"工作进程异常退出，文件记为失败: {file_path}")
+                        result = {'original_path': file_path, 'success': False, 'error': f"工作进程异常退出: {e}"}
+                    except Exception as e:
+                        logging.error(f"处理文件失败 {file_path}: {e}")
+                        result = {'original_path': file_path, 'success': False, 'error': str(e)}
+                    results.append(result)
+                    progress.update(result.get('success', False))
+                if broken:
+                    # 旧进程池中其余的任务随后同样以BrokenExecutor结束，不再重复重建
+                    executor = _rebuild_executor(executor, workers, warmup_decoders, log_level)
+                    generation += 1
+        finally:
+            executor.shutdown(wait=True)
+
+    elapsed = progress.elapsed()
+    summary = {
+        'total': len(files),
+        'succeeded': sum(1 for r in results if r.get('success') and not r.get('skipped')),
+        'skipped': sum(1 for r in results if r.get('skipped')),
+        'failed': sum(1 for r in results if not r.get('success')),
+        'cached': sum(1 for r in results if r.get('cached')),
+        'workers': workers,
+        'elapsed_seconds': round(elapsed, 2),
+        'files_per_second': round(len(results) / elapsed, 2) if elapsed > 0 else None
+    }
+    return results, summary
+
+def write_summary(summary, results, path):
+    """输出机器可读的汇总（JSON）"""
+    fields = ('original_path', 'new_path', 'invoice_number', 'amount', 'source',
+              'cached', 'elapsed_ms', 'content_hash', 'success', 'error')
+    data = {**summary, 'files': [{key: r.get(key) for key in fields} for r in results]}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"Summary written to {path}")
 
 def sum_invoices(invoice_folder):
-    total_sum = 0.0
-
-    # 遍历发票文件夹中的所有文件
-    for filename in os.listdir(invoice_folder):
-        filepath = os.path.join(invoice_folder, filename)
-        if os.path.isfile(filepath):
-            # 提取文件名中的金额部分并累加
-            amount = extract_amount(filename)
-            total_sum += amount
-
-    # 格式化总金额，确保只有两位小数
-    formatted_total = f"{total_sum:.2f}"
-
-    # 查找文件夹中的 .txt 文件
-    txt_file_found = False
-    for filename in os.listdir(invoice_folder):
-        if filename.endswith(".txt"):
-            old_filepath = os.path.join(invoice_folder, filename)
-            new_filepath = os.path.join(invoice_folder, f"{formatted_total}.txt")
-            os.rename(old_filepath, new_filepath)
-            txt_file_found = True
-            break  # Assuming there is only one .txt file to rename
-
-    # 如果没有找到 .txt 文件，则创建一个新的
-    if not txt_file_found:
-        new_filepath = os.path.join(invoice_folder, f"{formatted_total}.txt")
-        with open(new_filepath, 'w') as f:
-            f.write(f"Total amount: ¥{formatted_total}\n")
-
-    print(f"Total amount: ¥{formatted_total}")
+    """增量更新目录的发票清单，输出精确到分的总金额"""
+    summary = sum_folder(invoice_folder)
+    print(f"Total amount: ¥{summary['total']} ({summary['count']} files, "
+          f"refreshed in {summary['refresh']['elapsed_ms']}ms)")
+    return summary
+
+def shard_files(files):
+    """
+    多节点协调模式：跳过其他节点已处理完成的文件，并按本节点打乱处理顺序，
+    各节点从不同位置开始认领，减少同时争抢同一个文件
+    """
+    from file_lease import done_names, get_lease_manager
+    done = {}
+    pending = []
+    for file_path in files:
+        folder, name = os.path.split(os.path.abspath(file_path))
+        if folder not in done:
+            done[folder] = done_names(folder)
+        if name not in done[folder]:
+            pending.append(file_path)
+    random.Random(get_lease_manager().owner).shuffle(pending)
+    return pending
+
+def watch_folders(folders, workers=None, use_polling=False, log_level=logging.INFO, coordinate=False):
+    """监视目录并处理新到达的发票，目录中已有的文件不处理"""
+    from folder_watcher import FolderWatcher
+    missing = [folder for folder in folders if not os.path.isdir(folder)]
+    if missing:
+        print(f"Not a directory: {', '.join(missing)}", file=sys.stderr)
+        return 1
+    print(f"Watching {', '.join(folders)} for new invoices (Ctrl+C to stop)")
+    stats = FolderWatcher(folders, workers, use_polling, log_level=log_level, coordinate=coordinate).run()
+    print(f"Stopped watching: {stats['processed']} processed, {stats['failed']} failed")
+    return 0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="发票重命名工具：按发票号码和金额重命名PDF/OFD文件")
+    parser.add_argument("paths", nargs="*", help="文件、目录或通配符（如 'archive/**/*.pdf'）")
+    parser.add_argument("-r", "--recursive", action="store_true", help="递归处理子目录")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="工作进程数（默认等于CPU核数，1表示在当前进程中处理）")
+    parser.add_argument("--summary", metavar="PATH", help="处理结束后将JSON汇总写入该文件")
+    parser.add_argument("--no-sum", action="store_true", help="不统计各目录的发票总金额")
+    parser.add_argument("--warmup", action="store_true", help="处理前预加载二维码识别后端（每个工作进程各加载一次）")
+    parser.add_argument("--watch", action="store_true",
+                        help="持续监视给定目录，只处理新到达的PDF/OFD文件（Ctrl+C停止）")
+    parser.add_argument("--poll", action="store_true", help="监视目录时使用轮询代替inotify（用于网络挂载的目录）")
+    parser.add_argument("--coordinate", action="store_true",
+                        help="多节点协调模式：通过共享目录中的租约文件认领文件，多台机器可同时处理同一目录")
+    parser.add_argument("--debug", action="store_true", help="输出DEBUG日志")
+    parser.add_argument("--quiet", action="store_true", help="只输出警告和错误日志")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    toggle_debug_mode(args.debug)
+    log_level = logging.DEBUG if args.debug else (logging.WARNING if args.quiet else logging.INFO)
+    logging.getLogger().setLevel(log_level)
+
+    # --warmup: 处理文件前预加载二维码识别后端，并输出各后端耗时
+    if args.warmup:
+        from qr_decoders import warmup
+        for name, status in warmup().items():
+            if status['loaded']:
+                print(f"{name}: import {status['import_time_ms']}ms, init {status['init_time_ms']}ms")
+            else:
+                print(f"{name}: unavailable ({status['error'] or 'not installed'})")
+
+    if not args.paths:
+        if not args.warmup:
+            print("请提供文件路径作为参数。")
+        return 0
+
+    if args.watch:
+        return watch_folders(args.paths, args.workers, args.poll, log_level, args.coordinate)
+
+    files = collect_files(args.paths, args.recursive)
+    if not files:
+        print("没有找到需要处理的PDF/OFD文件。")
+        return 1
+
+    task = batch_task
+    if args.coordinate:
+        from file_lease import process_claimed
+        task = process_claimed
+        files = shard_files(files)
+        if not files:
+            print("所有文件都已由其他节点处理完成。")
+            return 0
+
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(files)))
+    results, summary = run_batch(files, workers, args.warmup, log_level, task)
+    print(f"Processed {summary['succeeded']}/{summary['total']} files "
+          f"({summary['failed']} failed, {summary['skipped']} skipped) in {summary['elapsed_seconds']}s, "
+          f"{summary['files_per_second']} files/s with {workers} workers")
+
+    if args.coordinate and not args.no_sum:
+        # 多个节点同时写共享目录中的SQLite清单和合计文件并不可靠，由所有节点完成后单独运行sum.py汇总
+        print("多节点协调模式不自动汇总金额，所有节点处理完成后请运行 sum.py 汇总。")
+    elif not args.no_sum:
+        folders = []
+        for result in results:
+            folder = os.path.dirname(result.get('new_path') or result.get('original_path') or '')
+            if result.get('success') and folder not in folders:
+                folders.append(folder)
+        for folder in folders:
+            sum_invoices(folder or '.')
+
+    if args.summary:
+        write_summary(summary, results, args.summary)
+    return 0 if summary['failed'] == 0 else 2
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        for file_path in sys.argv[1:]:
-            process_file(file_path, True)  # 添加 True 作为 keep_temp_files 参数的默认值
-        
-        invoice_folder = os.path.dirname(sys.argv[1])
-        sum_invoices(invoice_folder)
-    else:
-        print("请提供文件路径作为参数。")
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from config_manager import config
+from extraction_cache import file_sha256
+
+# 无法识别发票号码时，文件名使用内容哈希的前若干位，同一文件每次得到相同的名称
+FALLBACK_ID_LENGTH = 16
+
+# 同时保留索引的目录数，Web上传每个请求使用单独的目录，超出时淘汰最久未使用的索引
+MAX_INDEXED_DIRS = 64
+
+def fallback_invoice_id(prefix, file_path, content_hash=None):
+    """
+    根据文件内容生成确定的替代发票号，如 PDF-3F9A0C1D2E4B5A67
+
+    Args:
+        prefix: 'PDF' 或 'OFD'
+        content_hash: 已知的文件内容SHA-256，未提供时计算
+    """
+    content_hash = content_hash or file_sha256(file_path)
+    return f"{prefix}-{content_hash[:FALLBACK_ID_LENGTH].upper()}"
+
+class DirectoryNames:
+    """
+    单个目录的文件名索引
+    首次使用时用一次scandir加载目录中的文件名，之后在内存中判断冲突；
+    每个基础文件名记住下一个可用的序号，同名文件再多也不需要从_1逐个探测。
+    预留名称时仍以O_EXCL创建占位文件，其他进程或节点同时创建的文件会被发现并跳过
+    """
+
+    def __init__(self, folder, ttl=None):
+        self.folder = folder
+        self.ttl = ttl or config.get('naming_index_ttl_seconds', 300)
+        self._names = None
+        self._next_suffix = {}
+        self._loaded = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """加载目录文件名，超过ttl后重新加载以反映外部删除的文件"""
+        if self._names is not None and time.monotonic() - self._loaded < self.ttl:
+            return
+        with os.scandir(self.folder) as entries:
+            self._names = {entry.name for entry in entries}
+        self._next_suffix = {}
+        self._loaded = time.monotonic()
+
+    def _try_create(self, name):
+        """以O_EXCL创建占位文件，成功返回True；文件已存在时记入索引并返回False"""
+        try:
+            os.close(os.open(os.path.join(self.folder, name), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+        except FileExistsError:
+            self._names.add(name)
+            return False
+        self._names.add(name)
+        return True
+
+    def reserve(self, name):
+        """
+        预留文件名，与已有文件冲突时依次使用 名称_1、名称_2 ……
+
+        Returns:
+            实际预留的文件名（目录中已创建同名的空占位文件）
+        """
+        with self._lock:
+            self._load()
+            if name not in self._names and self._try_create(name):
+                return name
+            base, ext = os.path.splitext(name)
+            suffix = self._next_suffix.get(name, 1)
+            while True:
+                candidate = f"{base}_{suffix}{ext}"
+                suffix += 1
+                if candidate not in self._names and self._try_create(candidate):
+                    self._next_suffix[name] = suffix
+                    return candidate
+
+    def discard(self, name):
+        """文件已移走或删除，名称可以再次使用"""
+        with self._lock:
+            if self._names is not None:
+                self._names.discard(name)
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def get_directory_names(folder):
+    """获取目录的文件名索引（每个进程各自维护）"""
+    folder = os.path.abspath(folder)
+    with _indexes_lock:
+        index = _indexes.get(folder)
+        if index is None:
+            index = _indexes[folder] = DirectoryNames(folder)
+            while len(_indexes) > MAX_INDEXED_DIRS:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(folder)
+        return index
+
+def rename_reserved(file_path, new_file_name):
+    """
+    将文件重命名为new_file_name，冲突时自动加序号，已经是目标名称时保持不变
+
+    Returns:
+        重命名后的文件路径
+    """
+    folder, current_name = os.path.split(file_path)
+    if current_name == new_file_name:
+        logging.info(f"文件名已是目标名称，不需要重命名: {file_path}")
+        return file_path
+
+    index = get_directory_names(folder or '.')
+    reserved = index.reserve(new_file_name)
+    new_file_path = os.path.join(folder, reserved)
+    logging.info(f"重命名文件: {file_path} -> {new_file_path}")
+    try:
+        # 替换自己预留的占位文件
+        os.replace(file_path, new_file_path)
+    except OSError:
+        os.remove(new_file_path)
+        index.discard(reserved)
+        raise
+    index.discard(current_name)
+    return new_file_path
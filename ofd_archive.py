@@ -0,0 +1,198 @@
+import io
+import mmap
+import logging
+import zipfile
+import posixpath
+from config_manager import config
+
+ZIP_SIGNATURE = b'PK'
+
+class BoundedReader(io.RawIOBase):
+    """
+    限制读取字节数的成员流
+    除了检查压缩包目录中声明的大小，还按实际解压出的字节计数，
+    防止目录中的大小被篡改（压缩炸弹）
+    """
+
+    def __init__(self, stream, name, max_bytes):
+        self._stream = stream
+        self.name = name
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self._stream.seekable()
+
+    def read(self, size=-1):
+        remaining = self.max_bytes - self.bytes_read
+        # 多读一个字节，用于判断是否超出上限
+        if size is None or size < 0 or size > remaining + 1:
+            size = remaining + 1
+        data = self._stream.read(size)
+        self.bytes_read += len(data)
+        if self.bytes_read > self.max_bytes:
+            raise ValueError(f"OFD成员解压后超过大小上限: {self.name} (>{self.max_bytes}字节)")
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        position = self._stream.seek(offset, whence)
+        # 向回定位后重新读取的字节不重复计数
+        self.bytes_read = min(self.bytes_read, position)
+        return position
+
+    def tell(self):
+        return self._stream.tell()
+
+    def close(self):
+        if not self.closed:
+            self._stream.close()
+        super().close()
+
+class MappedFile(io.RawIOBase):
+    """内存映射的只读文件对象，供zipfile定位和读取（mmap本身在旧版本Python中缺少seekable）"""
+
+    def __init__(self, mapped):
+        self._mmap = mapped
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._mmap.read(None if size is None or size < 0 else size)
+
+    def readinto(self, buffer):
+        data = self._mmap.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._mmap.seek(offset, whence)
+        return self._mmap.tell()
+
+    def tell(self):
+        return self._mmap.tell()
+
+class OfdArchive:
+    """
+    OFD压缩包句柄
+    文件只打开一次（可选内存映射），压缩包目录在首次访问时解析并缓存，
+    成员通过限制大小的流读取；同一个句柄可以在XML解析、图片识别等各阶段之间共享
+
+    用法:
+        with OfdArchive(file_path) as archive:
+            if archive.is_valid():
+                data = archive.read_member('OFD.xml')
+    """
+
+    def __init__(self, file_path, use_mmap=None, max_member_bytes=None, max_members=None):
+        self.file_path = file_path
+        self.use_mmap = config.get('ofd_use_mmap', True) if use_mmap is None else use_mmap
+        self.max_member_bytes = max_member_bytes or config.get('ofd_member_max_bytes', 2 * 1024 * 1024)
+        self.max_members = max_members or config.get('ofd_max_members', 5000)
+        self._file = None
+        self._mmap = None
+        self._zip = None
+        self._index = None
+        self.error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _open(self):
+        """打开文件并解析压缩包目录，只执行一次"""
+        if self._zip is not None or self.error is not None:
+            return self._zip
+        try:
+            self._file = open(self.file_path, 'rb')
+            if self._file.read(2) != ZIP_SIGNATURE:
+                raise zipfile.BadZipFile("缺少ZIP文件头")
+            self._file.seek(0)
+            source = self._file
+            if self.use_mmap:
+                try:
+                    self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                    source = MappedFile(self._mmap)
+                except (ValueError, OSError) as e:
+                    logging.debug(f"内存映射失败，使用普通文件读取: {e}")
+            self._zip = zipfile.ZipFile(source)
+            if len(self._zip.filelist) > self.max_members:
+                raise zipfile.BadZipFile(f"成员数量过多({len(self._zip.filelist)})")
+        except (OSError, zipfile.BadZipFile) as e:
+            self.error = str(e)
+            logging.warning(f"文件不是有效的OFD/ZIP格式: {self.file_path} ({e})")
+            self.close()
+        return self._zip
+
+    def is_valid(self):
+        """是否为可读取的ZIP压缩包"""
+        return self._open() is not None
+
+    @property
+    def index(self):
+        """规范化的小写路径 -> ZipInfo，首次访问时建立"""
+        if self._index is None:
+            zip_file = self._open()
+            self._index = {}
+            if zip_file is not None:
+                for info in zip_file.infolist():
+                    self._index.setdefault(posixpath.normpath(info.filename).lower(), info)
+        return self._index
+
+    def namelist(self):
+        return [info.filename for info in self.infolist()]
+
+    def infolist(self):
+        zip_file = self._open()
+        return zip_file.infolist() if zip_file is not None else []
+
+    def getinfo(self, name):
+        return self._open().getinfo(name)
+
+    def find(self, path):
+        """按OFD内的路径（不区分大小写，允许./和..）查找成员名，找不到时返回None"""
+        info = self.index.get(posixpath.normpath(path.lstrip('/')).lower())
+        return info.filename if info else None
+
+    def open_member(self, name, max_bytes=None):
+        """
+        以流的方式打开成员，解压后的字节数超过max_bytes时读取会抛出ValueError
+
+        Args:
+            name: 成员名或ZipInfo
+            max_bytes: 大小上限，默认使用配置项ofd_member_max_bytes
+        """
+        limit = max_bytes or self.max_member_bytes
+        info = name if isinstance(name, zipfile.ZipInfo) else self.getinfo(name)
+        if info.file_size > limit:
+            raise ValueError(f"OFD成员过大: {info.filename} ({info.file_size}字节)")
+        return BoundedReader(self._open().open(info), info.filename, limit)
+
+    def read_member(self, name, max_bytes=None):
+        """读取整个成员，大小限制同open_member"""
+        with self.open_member(name, max_bytes) as stream:
+            return stream.read()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,115 @@
+import re
+import math
+from array import array
+
+# 需要定位的标签文字（页面上的文字与其右侧/下方的值相邻）
+AMOUNT_LABELS = ["小写", "价税合计"]
+NUMBER_LABELS = ["发票号码"]
+LABELS = AMOUNT_LABELS + NUMBER_LABELS
+
+AMOUNT_VALUE = re.compile(r"[¥￥]?\s*(\d[\d,]*\.\d{2})(?!\d)")
+NUMBER_VALUE = re.compile(r"(?<!\d)(\d{8,20})(?!\d)")
+
+class TextIndex:
+    """
+    OFD页面文字的位置索引
+    每个TextCode文字块的坐标、文字和字体以列的方式存放在数组中，
+    并按坐标划分网格，标签相邻的值通过网格做最近邻查找
+    """
+
+    def __init__(self, cell_size=20.0):
+        self.cell_size = cell_size
+        self.xs = array('d')
+        self.ys = array('d')
+        self.fonts = array('l')
+        self.texts = []
+        self.grid = {}
+        self.label_hits = {label: [] for label in LABELS}
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def add(self, x, y, text, font=0):
+        """添加一个文字块，坐标单位为毫米，原点在页面左上角"""
+        index = len(self.texts)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.fonts.append(font)
+        self.texts.append(text)
+        self.grid.setdefault(self._cell(x, y), []).append(index)
+        for label in LABELS:
+            if label in text:
+                self.label_hits[label].append(index)
+        return index
+
+    def nearest(self, index, pattern, max_distance=80.0, row_tolerance=4.0):
+        """
+        查找index右侧（同一行优先）或下方最近的、文字匹配pattern的文字块
+
+        Returns:
+            (文字块序号, 匹配对象)，找不到时返回 (None, None)
+        """
+        x0, y0 = self.xs[index], self.ys[index]
+        cx, cy = self._cell(x0, y0)
+        radius = int(math.ceil(max_distance / self.cell_size))
+        best = None
+        for gx in range(cx - 1, cx + radius + 1):
+            for gy in range(cy - 1, cy + radius + 1):
+                for other in self.grid.get((gx, gy), ()):
+                    if other == index:
+                        continue
+                    dx = self.xs[other] - x0
+                    dy = self.ys[other] - y0
+                    if dx < -row_tolerance or dy < -row_tolerance:
+                        continue
+                    # 同一行的值优先于下方的值
+                    score = dx + (0 if abs(dy) <= row_tolerance else 3 * abs(dy))
+                    if score > max_distance:
+                        continue
+                    if best is not None and score >= best[0]:
+                        continue
+                    match = pattern.search(self.texts[other])
+                    if match:
+                        best = (score, other, match)
+        if best is None:
+            return None, None
+        return best[1], best[2]
+
+    def _value_for_labels(self, labels, pattern):
+        for label in labels:
+            for index in self.label_hits[label]:
+                # 标签和值可能在同一个文字块中，如"（小写）¥100.00"
+                text = self.texts[index]
+                match = pattern.search(text, text.find(label) + len(label))
+                if match:
+                    return match.group(1)
+                other, match = self.nearest(index, pattern)
+                if match:
+                    return match.group(1)
+        return None
+
+    def find_amount(self):
+        """按"小写"、"价税合计"标签查找金额"""
+        value = self._value_for_labels(AMOUNT_LABELS, AMOUNT_VALUE)
+        return value.replace(",", "") if value else None
+
+    def find_invoice_number(self):
+        """按"发票号码"标签查找发票号码"""
+        return self._value_for_labels(NUMBER_LABELS, NUMBER_VALUE)
+
+def parse_boundary(boundary):
+    """解析Boundary属性"x y 宽 高"，返回左上角坐标"""
+    try:
+        parts = boundary.split()
+        return float(parts[0]), float(parts[1])
+    except (AttributeError, IndexError, ValueError):
+        return 0.0, 0.0
+
+def parse_font(font):
+    try:
+        return int(font)
+    except (TypeError, ValueError):
+        return 0
@@ -1,67 +1,69 @@
 import os
 import logging
 import re
-import zipfile
+import posixpath
 import xml.etree.ElementTree as ET
-from pdf_processor import create_new_filename
-from data_extractor import scan_qrcode, extract_information
+from pdf_processor import rename_invoice_file
+from ofd_archive import OfdArchive
+from ofd_layout import TextIndex, parse_boundary, parse_font
+from data_extractor import scan_qrcode, extract_information, QRCODE_SUPPORT
 from config_manager import config
-from datetime import datetime
+from name_registry import fallback_invoice_id
 from PIL import Image
 import io
 
-def process_ofd(file_path, tmp_dir, keep_temp_files=False):
+def process_ofd(file_path, tmp_dir, keep_temp_files=False, info=None, with_amount=None):
     """
     处理OFD文件
     OFD(Open Fixed-layout Document)是一种电子文档格式标准
+    
+    Args:
+        info: 已提取的发票信息字典，提供时不再重复提取
+        with_amount: 文件名是否包含金额，None表示使用配置项rename_with_amount
     """
     try:
         logging.info(f"处理OFD文件: {file_path}")
-        extracted_info = extract_ofd_info_direct(file_path)
-        
-        invoice_number = extracted_info.get('invoice_number')
-        amount = extracted_info.get('amount')
+        if info is None:
+            info = extract_ofd_info(file_path)
         
-        # 如果无法从内容提取，则尝试从文件名提取发票号
-        if not invoice_number:
-            filename = os.path.basename(file_path)
-            invoice_number = extract_invoice_number_from_filename(filename)
-            logging.info(f"从文件名提取到发票号码: {invoice_number}")
+        invoice_number = info.get('invoice_number')
+        amount = info.get('amount')
         
-        # 如果仍然没有发票号，生成一个基于时间戳的唯一标识符
+        # 如果仍然没有发票号，生成一个基于文件内容哈希的标识符，同一文件每次得到相同的名称
         if not invoice_number:
-            invoice_number = f"OFD{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            logging.info(f"生成时间戳发票号: {invoice_number}")
+            invoice_number = fallback_invoice_id('OFD', file_path, info.get('content_hash'))
+            logging.info(f"生成替代发票号: {invoice_number}")
             
         logging.info(f"发票号: {invoice_number}, 金额: {amount}")
         
-        # 创建新文件名
-        new_file_name = create_new_filename(invoice_number, amount, file_path)
-        new_file_path = os.path.join(os.path.dirname(file_path), new_file_name)
-        
-        # 处理文件名冲突
-        counter = 1
-        while os.path.exists(new_file_path) and new_file_path != file_path:
-            base_name = os.path.splitext(new_file_name)[0]
-            ext = os.path.splitext(new_file_name)[1]
-            new_file_path = os.path.join(os.path.dirname(file_path), f"{base_name}_{counter}{ext}")
-            counter += 1
-        
-        # 防止重命名为自己
-        if new_file_path == file_path:
-            timestamp = datetime.now().strftime("%H%M%S")
-            base_name = os.path.splitext(new_file_name)[0]
-            ext = os.path.splitext(new_file_name)[1]
-            new_file_path = os.path.join(os.path.dirname(file_path), f"{base_name}_{timestamp}{ext}")
-        
-        # 重命名文件
-        logging.info(f"重命名文件: {file_path} -> {new_file_path}")
-        os.rename(file_path, new_file_path)
-        return new_file_path
+        return rename_invoice_file(file_path, invoice_number, amount, with_amount)
     except Exception as e:
         logging.error(f"处理OFD文件时出错: {e}", exc_info=True)
         return None
 
+def extract_ofd_info(file_path, archive=None):
+    """
+    从OFD文件提取发票信息，内容中找不到发票号时回退到文件名
+    
+    Args:
+        archive: 已打开的OfdArchive，可在多个处理阶段间共享
+    
+    Returns:
+        {'invoice_number': ..., 'amount': ..., 'source': 'xml'|'filename'|None}
+    """
+    info = extract_ofd_info_direct(file_path, archive)
+    
+    # 如果无法从内容提取，则尝试从文件名提取发票号
+    if not info.get('invoice_number'):
+        filename = os.path.basename(file_path)
+        invoice_number = extract_invoice_number_from_filename(filename)
+        if invoice_number:
+            logging.info(f"从文件名提取到发票号码: {invoice_number}")
+            info['invoice_number'] = invoice_number
+            info['source'] = 'filename'
+    
+    return info
+
 def extract_invoice_number_from_filename(filename):
     """从文件名中提取发票号码"""
     invoice_patterns = [
@@ -77,218 +79,381 @@ def extract_invoice_number_from_filename(filename):
     
     return None
 
-def extract_ofd_info_direct(file_path):
+def _resolve_member(base_dir, location, archive):
+    """将OFD内的相对/绝对路径解析为zip成员名，找不到时返回None"""
+    if not location:
+        return None
+    location = location.strip().replace('\\', '/')
+    if location.startswith('/'):
+        path = location.lstrip('/')
+    else:
+        path = posixpath.join(base_dir, location)
+    return archive.find(path)
+
+def _read_index_xml(archive, name):
+    """读取OFD中的索引类XML（OFD.xml、Document.xml等），过大时跳过"""
+    try:
+        return ET.fromstring(archive.read_member(name))
+    except ValueError as e:
+        logging.warning(f"OFD索引文件无法读取，跳过: {e}")
+        return None
+
+def _iter_text_by_local_name(root, *names):
+    """遍历指定本地名元素的文本"""
+    for elem in root.iter():
+        if _local_name(elem.tag) in names and elem.text:
+            yield elem.text
+
+def plan_ofd_members(archive):
+    """
+    按OFD文档结构确定XML成员的读取顺序
+    OFD.xml -> DocRoot(Document.xml) -> CustomTags/Attachs（结构化发票数据）-> 首页Content.xml，
+    其余XML成员排在最后，仅在前面的成员中找不到信息时读取
+    
+    Returns:
+        有序的成员名列表
+    """
+    names = archive.namelist()
+    planned = []
+    index_files = set()
+    
+    def add(name):
+        if name and name not in planned:
+            planned.append(name)
+    
+    try:
+        ofd_name = archive.find('OFD.xml')
+        ofd_root = _read_index_xml(archive, ofd_name) if ofd_name else None
+        if ofd_root is not None:
+            index_files.add(ofd_name)
+            for doc_root in _iter_text_by_local_name(ofd_root, 'docroot'):
+                doc_name = _resolve_member('', doc_root, archive)
+                if not doc_name:
+                    continue
+                doc_dir = posixpath.dirname(doc_name)
+                doc = _read_index_xml(archive, doc_name)
+                if doc is None:
+                    continue
+                index_files.add(doc_name)
+                
+                # 自定义标签和附件中通常保存结构化的发票数据
+                for index_tag, item_dir_tag in (('customtags', 'customtag'), ('attachments', 'attachment')):
+                    for location in _iter_text_by_local_name(doc, index_tag):
+                        index_name = _resolve_member(doc_dir, location, archive)
+                        if not index_name:
+                            continue
+                        index_files.add(index_name)
+                        index_root = _read_index_xml(archive, index_name)
+                        if index_root is None:
+                            continue
+                        index_dir = posixpath.dirname(index_name)
+                        for file_loc in _iter_text_by_local_name(index_root, 'fileloc'):
+                            # 有的生成工具写相对索引文件的路径，有的写相对文档根的路径
+                            member = _resolve_member(index_dir, file_loc, archive) or \
+                                _resolve_member(doc_dir, file_loc, archive)
+                            if member and member.lower().endswith('.xml'):
+                                add(member)
+                
+                # 首页内容
+                for elem in doc.iter():
+                    if _local_name(elem.tag) == 'page':
+                        add(_resolve_member(doc_dir, elem.get('BaseLoc'), archive))
+                        break
+    except Exception as e:
+        logging.warning(f"解析OFD文档结构失败，按压缩包顺序读取: {e}")
+    
+    # 其余XML成员放在最后
+    for name in names:
+        if name.lower().endswith('.xml') and name not in index_files:
+            add(name)
+    return planned
+
+def extract_ofd_info_direct(file_path, archive=None):
     """
     直接从OFD文件中提取信息，不使用临时目录
+    
+    Args:
+        archive: 已打开的OfdArchive，提供时复用该句柄（不在此关闭），否则打开一次文件
     """
+    if archive is None:
+        with OfdArchive(file_path) as own_archive:
+            return extract_ofd_info_direct(file_path, own_archive)
+    
     result = {
         'invoice_number': None,
-        'amount': None
+        'amount': None,
+        'source': None
     }
     
     try:
-        if not zipfile.is_zipfile(file_path):
-            logging.warning(f"文件不是有效的OFD/ZIP格式: {file_path}")
+        if not archive.is_valid():
             return result
-            
-        with zipfile.ZipFile(file_path) as ofd_zip:
-            # 搜索可能的XML文件
-            xml_files = [f for f in ofd_zip.namelist() if f.lower().endswith('.xml')]
-            
-            # 处理每个XML文件
-            for xml_file in xml_files:
-                try:
-                    with ofd_zip.open(xml_file) as xml_data:
-                        xml_content = xml_data.read()
-                        invoice_info = parse_ofd_xml_content(xml_content)
-                        
-                        # 如果找到了发票号或金额，更新结果
-                        if invoice_info.get('invoice_number'):
-                            result['invoice_number'] = invoice_info['invoice_number']
-                        if invoice_info.get('amount'):
-                            result['amount'] = invoice_info['amount']
-                            
-                        # 如果已经找到了所有信息，可以提前返回
-                        if result['invoice_number'] and result['amount']:
-                            return result
-                except Exception as e:
-                    logging.warning(f"解析XML文件 {xml_file} 时出错: {e}")
-                    continue
-            
-            # 如果从XML获取不到完整信息，尝试从图片中提取
-            image_files = [f for f in ofd_zip.namelist() 
-                        if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.tiff'))]
-            
-            for img_file in image_files:
-                try:
-                    with ofd_zip.open(img_file) as img_data:
-                        img_bytes = img_data.read()
-                        # 创建临时内存文件对象
-                        img_io = io.BytesIO(img_bytes)
-                        # 将图像加载到内存中
-                        image = Image.open(img_io)
-                        
-                        # 使用图像宽度作为临时文件名（仅作为标识符）
-                        temp_id = f"memimg_{hash(img_file)}"
-                        
-                        # 通过从图像中提取文本来模拟扫描二维码
-                        # 注意：由于我们没有实际的二维码库，这部分功能有限
-                        # 直接从图像提取文本模式尝试查找发票号和金额
-                        if not result['invoice_number'] or not result['amount']:
-                            # 在内存中处理图像
-                            try:
-                                invoice_number = None
-                                amount = None
-                                
-                                # 将图像转为灰度
-                                gray_img = image.convert('L')
-                                
-                                # 使用简单模式尝试查找发票号（20位数字）
-                                # 这里只是一个示例，实际需要OCR库支持
-                                
-                                # 如果发现了信息，更新结果
-                                if invoice_number and not result['invoice_number']:
-                                    result['invoice_number'] = invoice_number
-                                if amount and not result['amount']:
-                                    result['amount'] = amount
-                            except Exception as img_err:
-                                logging.warning(f"处理图像文件时出错: {img_err}")
+        
+        # 按文档结构排序XML文件，结构化发票数据优先
+        xml_files = plan_ofd_members(archive)
+        
+        # 处理每个XML文件，金额在所有成员中按优先级取最好的一个
+        text_amount = None
+        best_amount = None   # (优先级, 金额)
+        for xml_file in xml_files:
+            try:
+                # 超过ofd_member_max_bytes的成员在打开或读取时抛出ValueError
+                with archive.open_member(xml_file) as xml_data:
+                    invoice_info = parse_ofd_xml_stream(xml_data)
                 
-                except Exception as e:
-                    logging.warning(f"处理图像文件 {img_file} 时出错: {e}")
-                    continue
+                # 如果找到了发票号或金额，更新结果
+                if invoice_info.get('invoice_number') and not result['invoice_number']:
+                    result['invoice_number'] = invoice_info['invoice_number']
+                    result['source'] = 'xml'
+                if invoice_info.get('amount'):
+                    if invoice_info['amount_source'] in ('tag', 'layout'):
+                        priority = invoice_info['amount_priority']
+                        if best_amount is None or priority < best_amount[0]:
+                            best_amount = (priority, invoice_info['amount'])
+                            result['amount'] = invoice_info['amount']
+                    elif text_amount is None:
+                        text_amount = invoice_info['amount']
                     
+                # 找到发票号码和价税合计后提前返回，合计金额等较低优先级的金额继续在后续成员中查找
+                if result['invoice_number'] and best_amount and best_amount[0] == 0:
+                    return result
+            except Exception as e:
+                logging.warning(f"解析XML文件 {xml_file} 时出错: {e}")
+                continue
+        
+        # 如果从XML获取不到完整信息，识别内嵌图片中的二维码
+        if QRCODE_SUPPORT and not (result['invoice_number'] and result['amount']):
+            _scan_ofd_images(archive, result)
+        
+        # 没有金额标签、标签相邻文字和二维码时，使用XML文本中的金额作为备选
+        if not result['amount'] and text_amount:
+            result['amount'] = text_amount
+        
     except Exception as e:
         logging.error(f"直接从OFD文件中提取信息时出错: {e}", exc_info=True)
     
     return result
 
-def parse_ofd_xml_content(xml_content):
+OFD_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+def plan_ofd_images(archive):
     """
-    从XML内容中解析发票信息
+    按二维码的可能性排序OFD内嵌图片：二维码图片小且接近正方形，
+    印章、底纹等大图排在最后，只在前面的图片都识别失败时才解码
+    排序只读取图片头部的尺寸，不解码像素
+    
+    Returns:
+        [(成员名, (宽, 高)或None)]
+    """
+    max_side = config.get('ofd_qr_image_max_side', 1000)
+    candidates = []
+    image_limit = config.get('ofd_image_max_bytes', 20 * 1024 * 1024)
+    for info in archive.infolist():
+        if not info.filename.lower().endswith(OFD_IMAGE_EXTENSIONS):
+            continue
+        size = None
+        try:
+            with archive.open_member(info, image_limit) as img_data:
+                # Image.open只解析头部，像素在load()时才解码
+                size = Image.open(img_data).size
+        except Exception as e:
+            logging.debug(f"读取图片尺寸失败 {info.filename}: {e}")
+        
+        if size and min(size) > 0:
+            width, height = size
+            square = max(width, height) / min(width, height) <= 1.25
+            rank = 0 if square and max(width, height) <= max_side else (1 if square else 2)
+            candidates.append(((rank, width * height), info.filename, size))
+        else:
+            candidates.append(((3, info.file_size), info.filename, None))
+    candidates.sort(key=lambda item: item[0])
+    return [(name, size) for _, name, size in candidates]
+
+def _open_reduced_image(archive, name, max_side):
+    """
+    读取内嵌图片并缩小到max_side以内
+    JPEG使用draft在解码时按DCT比例缩小，其他格式解码后用reduce整数倍缩小
+    """
+    image_bytes = archive.read_member(name, config.get('ofd_image_max_bytes', 20 * 1024 * 1024))
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.format == 'JPEG':
+        image.draft('L', (max_side, max_side))
+    if image.mode not in ('L', 'RGB', 'RGBA'):
+        image = image.convert('L')
+    factor = max(image.size) // max_side
+    if factor > 1:
+        image = image.reduce(factor)
+    return image
+
+def _scan_ofd_images(archive, result):
+    """
+    在内存中识别OFD内嵌图片的二维码，取到有效的发票信息后立即停止
+    识别结果直接补充到result中
+    """
+    max_side = config.get('ofd_qr_image_max_side', 1000)
+    for name, size in plan_ofd_images(archive):
+        try:
+            logging.info(f"识别OFD内嵌图片中的二维码: {name} {size or ''}")
+            qr_text = scan_qrcode(_open_reduced_image(archive, name, max_side), regions=False)
+            if not qr_text:
+                continue
+            invoice_number, amount = extract_information(qr_text)
+            if not invoice_number and not amount:
+                continue
+            if invoice_number and not result['invoice_number']:
+                result['invoice_number'] = invoice_number
+                result['source'] = 'qrcode'
+            if amount and not result['amount']:
+                result['amount'] = amount
+            return True
+        except Exception as e:
+            logging.warning(f"处理图像文件 {name} 时出错: {e}")
+    return False
+
+# OFD发票XML中的字段标签表（元素本地名小写 -> 优先级，数值越小越优先）
+OFD_NUMBER_TAGS = {
+    'fphm': 0,              # 发票号码
+    'invoiceno': 0,
+    'invoicenumber': 0,
+    'eiid': 0,              # 全电发票号码
+    '发票号码': 0,
+    'fpdm': 1               # 发票代码，仅在没有发票号码时使用
+}
+
+OFD_AMOUNT_TAGS = {
+    'jshj': 0,              # 价税合计
+    'taxinclusivetotalamount': 0,
+    'taxinclusiveamount': 0,
+    'totaltax-includedamount': 0,
+    '价税合计': 0,
+    'totalamount': 1,
+    'hjje': 2,              # 合计金额
+    '合计金额': 2
+}
+
+# 页面文字按"小写"、"价税合计"标签取到的金额就是价税合计，与价税合计标签同一优先级
+LAYOUT_AMOUNT_PRIORITY = 0
+
+NUMBER_PATTERN = re.compile(r'\b\d{8,20}\b')
+AMOUNT_PATTERN = re.compile(r'\d+\.\d{2}')
+
+def _local_name(tag):
+    """去掉命名空间前缀，返回小写的元素本地名"""
+    if not isinstance(tag, str):
+        return ''
+    return tag.rsplit('}', 1)[-1].lower()
+
+def _parse_amount(text):
+    """从文本中取出有效范围内的金额"""
+    match = AMOUNT_PATTERN.search(text)
+    if not match:
+        return None
+    value = float(match.group(0))
+    if 0.01 <= value <= 100000:
+        return value
+    return None
+
+def parse_ofd_xml_stream(stream, collect_text_amounts=True):
+    """
+    单遍流式扫描OFD中的XML，按标签表匹配发票号码和金额
+    找到发票号码和最高优先级的金额后立即停止读取
+    页面内容(Content.xml)中的TextCode文字同时建立位置索引，
+    没有结构化标签时按"小写"、"发票号码"等标签的相邻文字取值
+    
+    Args:
+        stream: XML文件对象（如zip成员流）
+        collect_text_amounts: 其他方式都取不到金额时，是否使用所有文本中的最大金额作为备选
+    
+    Returns:
+        {'invoice_number', 'amount', 'amount_source', 'amount_priority'}，amount_source为'tag'、'layout'或'text'，
+        amount_priority为金额标签的优先级（见OFD_AMOUNT_TAGS，0为价税合计），文本中的最大金额没有优先级
     """
     result = {
         'invoice_number': None,
-        'amount': None
+        'amount': None,
+        'amount_source': None,
+        'amount_priority': None
     }
+    best_number = None   # (优先级, 号码)
+    best_amount = None   # (优先级, 金额)
+    max_text_amount = None
+    text_index = TextIndex()
+    origin = (0.0, 0.0)
+    font = 0
     
     try:
-        root = ET.fromstring(xml_content)
-        
-        # 使用XPath搜索可能包含发票号的元素
-        invoice_patterns = [
-            ".//*[contains(local-name(), 'Invoice')]",
-            ".//*[contains(local-name(), 'Number')]",
-            ".//*[contains(local-name(), 'Code')]",
-            ".//*[contains(local-name(), 'ID')]",
-            ".//*[contains(local-name(), 'DocumentID')]",
-            ".//*[contains(local-name(), 'InvoiceNo')]",
-            ".//*[contains(local-name(), 'fpdm')]",  # 发票代码
-            ".//*[contains(local-name(), 'fphm')]"   # 发票号码
-        ]
-        
-        for pattern in invoice_patterns:
-            elements = root.findall(pattern)
-            for element in elements:
-                text = element.text if hasattr(element, 'text') else None
-                if text and re.search(r'\b\d{8,20}\b', text):
-                    invoice_number = re.search(r'\b\d{8,20}\b', text).group(0)
-                    logging.info(f"从XML中提取到发票号码: {invoice_number}")
-                    result['invoice_number'] = invoice_number
-                    break
-            
-            if result['invoice_number']:
-                break
-        
-        # 搜索可能包含金额的元素
-        amount_patterns = [
-            ".//*[contains(local-name(), 'Amount')]",
-            ".//*[contains(local-name(), 'Price')]",
-            ".//*[contains(local-name(), 'Money')]",
-            ".//*[contains(local-name(), 'Sum')]",
-            ".//*[contains(lower-case(local-name()), 'amount')]",
-            ".//*[contains(lower-case(local-name()), 'price')]",
-            ".//*[contains(lower-case(local-name()), 'money')]",
-            ".//*[contains(lower-case(local-name()), 'sum')]",
-            ".//*[contains(local-name(), 'Tax')]",
-            ".//*[contains(local-name(), 'Total')]",
-            ".//*[contains(local-name(), 'jshj')]",  # 价税合计
-            ".//*[contains(local-name(), 'hjje')]",  # 合计金额
-            ".//*[contains(local-name(), 'jshjxx')]" # 价税合计信息
-        ]
-        
-        # 收集所有可能的金额
-        all_amounts = []
-        
-        for pattern in amount_patterns:
-            elements = root.findall(pattern)
-            for element in elements:
-                text = element.text if hasattr(element, 'text') else None
-                if text and re.search(r'\d+\.\d{2}', text):
-                    amount_match = re.search(r'\d+\.\d{2}', text)
-                    if amount_match:
-                        try:
-                            amount_value = float(amount_match.group(0))
-                            # 过滤掉极小或极大的值
-                            if 0.01 <= amount_value <= 100000:
-                                all_amounts.append(amount_value)
-                                logging.debug(f"从XML中提取到可能的金额: {amount_value} (使用模式: {pattern})")
-                        except ValueError:
-                            continue
-        
-        # 如果找到金额，使用优化策略选择
-        if all_amounts:
-            # 策略1: 优先选择具有特定属性的节点
-            priority_tags = ["价税合计", "合计金额", "小写", "TotalAmount", "TaxInclusiveAmount"]
-            for tag in priority_tags:
-                for pattern in [f".//*[contains(local-name(), '{tag}')]", f".//*[@*[contains(name(), '{tag}')]]"]:
-                    elements = root.findall(pattern)
-                    for element in elements:
-                        text = element.text if hasattr(element, 'text') else None
-                        if text and re.search(r'\d+\.\d{2}', text):
-                            amount_match = re.search(r'\d+\.\d{2}', text)
-                            if amount_match:
-                                try:
-                                    amount_value = float(amount_match.group(0))
-                                    result['amount'] = "{:.2f}".format(amount_value)
-                                    logging.info(f"基于优先标签'{tag}'从XML提取到金额: {result['amount']}")
-                                    break
-                                except ValueError:
-                                    continue
-                if result['amount']:
-                    break
+        for event, elem in ET.iterparse(stream, events=('start', 'end')):
+            name = _local_name(elem.tag)
+            if event == 'start':
+                if name == 'textobject':
+                    origin = parse_boundary(elem.get('Boundary'))
+                    font = parse_font(elem.get('Font'))
+                continue
             
-            # 策略2: 如果没有找到优先标签，且有明显的最大值
-            if not result['amount'] and len(all_amounts) > 1:
-                sorted_amounts = sorted(all_amounts)
-                if sorted_amounts[-1] > sorted_amounts[-2] * 1.5:
-                    result['amount'] = "{:.2f}".format(sorted_amounts[-1])
-                    logging.info(f"选择最大金额: {result['amount']} (明显大于其他值)")
+            text = elem.text
+            if text:
+                if name == 'textcode':
+                    try:
+                        x = origin[0] + float(elem.get('X', 0))
+                        y = origin[1] + float(elem.get('Y', 0))
+                    except ValueError:
+                        x, y = origin
+                    text_index.add(x, y, text, font)
+                number_priority = OFD_NUMBER_TAGS.get(name)
+                amount_priority = OFD_AMOUNT_TAGS.get(name)
+                if number_priority is not None and (best_number is None or number_priority < best_number[0]):
+                    number_match = NUMBER_PATTERN.search(text)
+                    if number_match:
+                        best_number = (number_priority, number_match.group(0))
+                        logging.info(f"从XML标签<{name}>中提取到发票号码: {best_number[1]}")
+                if amount_priority is not None and (best_amount is None or amount_priority < best_amount[0]):
+                    amount_value = _parse_amount(text)
+                    if amount_value is not None:
+                        best_amount = (amount_priority, amount_value)
+                        logging.info(f"从XML标签<{name}>中提取到金额: {amount_value:.2f}")
+                if collect_text_amounts and best_amount is None:
+                    amount_value = _parse_amount(text)
+                    if amount_value is not None and (max_text_amount is None or amount_value > max_text_amount):
+                        max_text_amount = amount_value
+            # 已处理的元素及时释放，大文件内存占用保持平稳
+            elem.clear()
             
-            # 策略3: 如果都没有找到，取最大值
-            if not result['amount'] and all_amounts:
-                result['amount'] = "{:.2f}".format(max(all_amounts))
-                logging.info(f"从XML中提取到的最大金额: {result['amount']}")
-        
-        # 扫描所有文本内容以搜索金额
-        if not result['amount']:
-            all_text = ""
-            for elem in root.iter():
-                if elem.text:
-                    all_text += elem.text + " "
-            
-            decimal_matches = re.findall(r'(\d+\.\d{2})', all_text)
-            if decimal_matches:
-                decimal_amounts = [float(m) for m in decimal_matches if 0.01 <= float(m) <= 100000]
-                if decimal_amounts:
-                    result['amount'] = "{:.2f}".format(max(decimal_amounts))
-                    logging.info(f"从所有XML文本中提取到金额: {result['amount']}")
-    
-    except Exception as e:
+            if best_number and best_number[0] == 0 and best_amount and best_amount[0] == 0:
+                break
+    except ET.ParseError as e:
         logging.warning(f"解析XML内容时出错: {e}")
     
+    if best_number:
+        result['invoice_number'] = best_number[1]
+    elif len(text_index):
+        result['invoice_number'] = text_index.find_invoice_number()
+        if result['invoice_number']:
+            logging.info(f"从页面文字位置提取到发票号码: {result['invoice_number']}")
+    
+    if best_amount:
+        result['amount'] = "{:.2f}".format(best_amount[1])
+        result['amount_source'] = 'tag'
+        result['amount_priority'] = best_amount[0]
+        return result
+    
+    layout_amount = _parse_amount(text_index.find_amount() or '') if len(text_index) else None
+    if layout_amount is not None:
+        result['amount'] = "{:.2f}".format(layout_amount)
+        result['amount_source'] = 'layout'
+        result['amount_priority'] = LAYOUT_AMOUNT_PRIORITY
+        logging.info(f"从页面文字位置提取到金额: {result['amount']}")
+    elif max_text_amount is not None:
+        result['amount'] = "{:.2f}".format(max_text_amount)
+        result['amount_source'] = 'text'
+        logging.info(f"从所有XML文本中提取到金额: {result['amount']}")
     return result
 
+def parse_ofd_xml_content(xml_content):
+    """
+    从XML内容中解析发票信息
+    """
+    return parse_ofd_xml_stream(io.BytesIO(xml_content))
+
 # 删除未使用的功能
 # def extract_text_from_ofd(file_path):
 #     """从OFD文件中提取文本（如果需要）"""
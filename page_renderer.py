@@ -0,0 +1,161 @@
+import shutil
+import logging
+import threading
+import subprocess
+
+# PDF坐标单位（点）与英寸的换算
+POINTS_PER_INCH = 72.0
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def _detect_backend():
+    """
+    选择渲染后端：优先使用进程内的PyMuPDF，其次使用pdftoppm（一次调用渲染所有页面）
+    """
+    try:
+        import fitz  # PyMuPDF
+        logging.info("页面渲染使用PyMuPDF（进程内）")
+        return 'pymupdf'
+    except ImportError:
+        pass
+    if shutil.which('pdftoppm'):
+        logging.info("页面渲染使用pdftoppm（管道输出）")
+        return 'pdftoppm'
+    logging.warning("没有可用的PDF渲染后端（PyMuPDF或pdftoppm）")
+    return None
+
+def get_backend():
+    """获取当前渲染后端名称，首次调用时检测"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _detect_backend() or ''
+    return _backend or None
+
+def split_ppm_stream(data):
+    """
+    将连续输出的多个PPM/PGM图像拆分为单独的图像字节
+    """
+    images = []
+    pos = 0
+    length = len(data)
+    while pos < length:
+        start = pos
+        fields = []
+        # 头部：魔数、宽、高、最大值，以空白分隔，可能包含注释
+        while len(fields) < 4:
+            while pos < length and data[pos:pos + 1].isspace():
+                pos += 1
+            if pos >= length:
+                break
+            if data[pos:pos + 1] == b'#':
+                while pos < length and data[pos:pos + 1] not in (b'\n', b'\r'):
+                    pos += 1
+                continue
+            token_start = pos
+            while pos < length and not data[pos:pos + 1].isspace():
+                pos += 1
+            fields.append(data[token_start:pos])
+        if len(fields) < 4:
+            break
+        magic, width, height, maxval = fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+        channels = 3 if magic == b'P6' else 1
+        sample_size = 1 if maxval < 256 else 2
+        # 头部结束后紧跟一个空白字符
+        pos += 1
+        pos += width * height * channels * sample_size
+        images.append(data[start:pos])
+    return images
+
+def split_png_stream(data):
+    """
+    将连续输出的多个PNG图像拆分为单独的图像字节
+    """
+    images = []
+    pos = 0
+    length = len(data)
+    while pos < length:
+        if data[pos:pos + 8] != PNG_SIGNATURE:
+            break
+        start = pos
+        pos += 8
+        while pos + 8 <= length:
+            chunk_length = int.from_bytes(data[pos:pos + 4], 'big')
+            chunk_type = data[pos + 4:pos + 8]
+            pos += 12 + chunk_length
+            if chunk_type == b'IEND':
+                break
+        images.append(data[start:pos])
+    return images
+
+def _render_with_pymupdf(pdf_path, first_page, last_page, dpi, region, image_format):
+    import fitz
+    images = []
+    with fitz.open(pdf_path) as doc:
+        last = len(doc) if last_page is None else min(last_page, len(doc))
+        for page_index in range(first_page - 1, last):
+            page = doc[page_index]
+            clip = None
+            if region:
+                x, y, w, h = region
+                clip = fitz.Rect(x, y, x + w, y + h) & page.rect
+            pix = page.get_pixmap(dpi=dpi, clip=clip)
+            images.append(pix.tobytes(image_format))
+    return images
+
+def _render_with_pdftoppm(pdf_path, first_page, last_page, dpi, region, image_format, timeout):
+    # 不指定输出前缀时pdftoppm将所有页面依次写到标准输出
+    command = ['pdftoppm', '-r', str(dpi), '-f', str(first_page)]
+    if last_page is not None:
+        command += ['-l', str(last_page)]
+    if image_format == 'png':
+        command.append('-png')
+    if region:
+        x, y, w, h = region
+        scale = dpi / POINTS_PER_INCH
+        command += ['-x', str(int(x * scale)), '-y', str(int(y * scale)),
+                    '-W', str(max(1, int(w * scale))), '-H', str(max(1, int(h * scale)))]
+    command.append(pdf_path)
+
+    completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    if completed.returncode != 0:
+        logging.warning(f"pdftoppm渲染失败({completed.returncode}): {completed.stderr.decode(errors='ignore')[:200]}")
+    if image_format == 'png':
+        return split_png_stream(completed.stdout)
+    return split_ppm_stream(completed.stdout)
+
+def render_pages(pdf_path, first_page=1, last_page=None, dpi=150, region=None, image_format='ppm', timeout=60):
+    """
+    一次性渲染PDF的连续页面，直接返回内存中的图像字节，不产生临时文件
+
+    Args:
+        pdf_path: PDF文件路径
+        first_page: 起始页（从1开始）
+        last_page: 结束页（包含），None表示到最后一页，超出页数时自动截断
+        dpi: 渲染分辨率
+        region: 只渲染页面的一部分 (x, y, 宽, 高)，单位为PDF点，原点在页面左上角
+        image_format: 'ppm'（未压缩，解码最快）或 'png'
+        timeout: 外部渲染进程的超时秒数
+
+    Returns:
+        每页一个图像字节串的列表，渲染失败时返回空列表
+    """
+    backend = get_backend()
+    if backend is None:
+        return []
+    try:
+        if backend == 'pymupdf':
+            images = _render_with_pymupdf(pdf_path, first_page, last_page, dpi, region, image_format)
+        else:
+            images = _render_with_pdftoppm(pdf_path, first_page, last_page, dpi, region, image_format, timeout)
+        logging.info(f"渲染PDF页面{first_page}-{last_page or '末页'}完成，共{len(images)}张图像 ({backend}, {dpi}dpi)")
+        return images
+    except subprocess.TimeoutExpired:
+        logging.warning(f"渲染PDF超时: {pdf_path}")
+    except Exception as e:
+        logging.warning(f"渲染PDF页面失败: {e}")
+    return []
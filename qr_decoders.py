@@ -0,0 +1,281 @@
+import os
+import time
+import logging
+import threading
+import importlib.util
+from config_manager import config
+
+# 检查环境变量，明确禁用pyzbar（需要系统库zbar）
+NO_ZBAR_REQUIRED = os.environ.get("NO_ZBAR_REQUIRED", "0") == "1"
+
+class DecoderBackend:
+    """
+    二维码识别后端，首次使用时才导入和初始化
+    记录导入耗时和初始化耗时，便于排查冷启动开销
+    """
+
+    def __init__(self, name, module_name, loader, enabled=True):
+        self.name = name
+        self.module_name = module_name
+        self._loader = loader
+        self.enabled = enabled
+        self.decoder = None
+        self.loaded = False
+        self.error = None
+        self.import_time = None
+        self.init_time = None
+        self._lock = threading.Lock()
+
+    def available(self):
+        """不导入模块，仅检查是否已安装"""
+        if not self.enabled:
+            return False
+        if self.loaded:
+            return self.decoder is not None
+        try:
+            return importlib.util.find_spec(self.module_name) is not None
+        except (ImportError, ValueError):
+            return False
+
+    def load(self):
+        """导入并初始化后端，返回识别函数，失败时返回None"""
+        if self.loaded:
+            return self.decoder
+        with self._lock:
+            if self.loaded:
+                return self.decoder
+            if not self.enabled:
+                self.error = "已被环境变量禁用"
+            else:
+                try:
+                    self.decoder = self._loader(self)
+                    logging.info(f"二维码后端{self.name}已加载 (导入{self.import_time * 1000:.0f}ms, 初始化{self.init_time * 1000:.0f}ms)")
+                except Exception as e:
+                    self.decoder = None
+                    self.error = str(e)
+                    logging.warning(f"二维码后端{self.name}不可用: {e}")
+            self.loaded = True
+        return self.decoder
+
+    def decode(self, image_array):
+        """识别numpy图像中的二维码，返回文本或None"""
+        decoder = self.load()
+        if decoder is None:
+            return None
+        return decoder(image_array)
+
+    def status(self):
+        return {
+            'available': self.available(),
+            'loaded': self.loaded and self.decoder is not None,
+            'import_time_ms': round(self.import_time * 1000, 1) if self.import_time is not None else None,
+            'init_time_ms': round(self.init_time * 1000, 1) if self.init_time is not None else None,
+            'error': self.error
+        }
+
+def _timed_import(backend, import_func):
+    start = time.perf_counter()
+    module = import_func()
+    backend.import_time = time.perf_counter() - start
+    return module
+
+def _timed_init(backend, init_func):
+    start = time.perf_counter()
+    instance = init_func()
+    backend.init_time = time.perf_counter() - start
+    return instance
+
+def _first_text(results):
+    """统一各后端的返回值：取第一个非空文本"""
+    if not results:
+        return None
+    if isinstance(results, (str, bytes)):
+        results = [results]
+    for item in results:
+        if isinstance(item, bytes):
+            item = item.decode('utf-8', errors='ignore')
+        if item:
+            return item
+    return None
+
+def _load_qreader(backend):
+    qreader_module = _timed_import(backend, lambda: __import__('qreader'))
+    reader = _timed_init(backend, qreader_module.QReader)
+    return lambda image: _first_text(reader.detect_and_decode(image=image))
+
+def binarize(image):
+    """转为灰度并按均值二值化，机打二维码二值化后zbar识别更稳定"""
+    import numpy as np
+    gray = image if image.ndim == 2 else image[..., :3].mean(axis=2)
+    return np.where(gray > gray.mean(), 255, 0).astype(np.uint8)
+
+def _load_pyzbar(backend):
+    pyzbar_module = _timed_import(backend, lambda: importlib.import_module('pyzbar.pyzbar'))
+    backend.init_time = 0.0
+    return lambda image: _first_text([symbol.data for symbol in pyzbar_module.decode(binarize(image))])
+
+def _load_pyzxing(backend):
+    pyzxing_module = _timed_import(backend, lambda: __import__('pyzxing'))
+    # BarCodeReader会启动Java工具链，开销较大
+    reader = _timed_init(backend, pyzxing_module.BarCodeReader)
+    return lambda image: _first_text([item.get('parsed') for item in (reader.decode_array(image) or [])])
+
+def _load_opencv(backend):
+    cv2 = _timed_import(backend, lambda: __import__('cv2'))
+    detector = _timed_init(backend, cv2.QRCodeDetector)
+    return lambda image: _first_text(detector.detectAndDecode(image)[0])
+
+DECODERS = {
+    'qreader': DecoderBackend('qreader', 'qreader', _load_qreader),
+    'pyzbar': DecoderBackend('pyzbar', 'pyzbar', _load_pyzbar, enabled=not NO_ZBAR_REQUIRED),
+    'pyzxing': DecoderBackend('pyzxing', 'pyzxing', _load_pyzxing),
+    'opencv': DecoderBackend('opencv', 'cv2', _load_opencv)
+}
+
+def get_decoder(name):
+    """获取指定名称的后端"""
+    return DECODERS.get(name)
+
+def available_decoders():
+    """已安装的后端名称列表（不触发导入）"""
+    return [name for name, backend in DECODERS.items() if backend.available()]
+
+def warmup(names=None):
+    """
+    预加载二维码后端，避免首个请求承担导入和初始化开销
+
+    Args:
+        names: 要加载的后端名称列表，None表示加载识别级联中的后端（不包括级联之外的pyzxing等）
+
+    Returns:
+        各后端状态
+    """
+    for name in names or get_cascade().order():
+        backend = DECODERS.get(name)
+        if backend is None:
+            logging.warning(f"未知的二维码后端: {name}")
+            continue
+        backend.load()
+    return decoder_status()
+
+def decoder_status():
+    """各后端的可用性、加载状态及耗时"""
+    return {name: backend.status() for name, backend in DECODERS.items()}
+
+# 默认识别顺序：先用开销小的传统检测器，未命中再使用神经网络检测器qreader
+DEFAULT_CASCADE = ['opencv', 'pyzbar', 'qreader']
+
+# 页面角落候选区域只用开销小的后端识别，qreader只在整页上运行
+DEFAULT_ROI_DECODERS = ['opencv', 'pyzbar']
+
+class DecoderCascade:
+    """
+    多后端二维码识别级联
+    按各后端的历史成功率和平均耗时排序：期望开销（平均耗时/成功率）越低越先尝试。
+    排在后面的后端只在前面的后端未命中时才运行，样本积累很慢，
+    因此每explore_every次识别会让样本不足的后端先尝试一次
+    """
+
+    def __init__(self, names, min_samples=20, explore_every=20):
+        self.names = list(names)
+        self.min_samples = min_samples
+        self.explore_every = explore_every
+        self.stats = {name: {'attempts': 0, 'successes': 0, 'total_time': 0.0} for name in self.names}
+        self._decodes = 0
+        self._lock = threading.Lock()
+
+    def _expected_cost(self, name):
+        stat = self.stats[name]
+        # 拉普拉斯平滑，避免样本少时成功率为0或1
+        success_rate = (stat['successes'] + 1) / (stat['attempts'] + 2)
+        avg_time = stat['total_time'] / stat['attempts'] if stat['attempts'] else 0.0
+        return avg_time / success_rate
+
+    def order(self):
+        """
+        当前识别顺序：样本足够的后端按期望开销排序，
+        占据它们在默认顺序中的位置；样本不足的后端保持默认位置
+        """
+        names = [name for name in self.names if DECODERS.get(name) and DECODERS[name].available()]
+        with self._lock:
+            sampled = [name for name in names if self.stats[name]['attempts'] >= self.min_samples]
+            ranked = iter(sorted(sampled, key=lambda name: (self._expected_cost(name), self.names.index(name))))
+            return [next(ranked) if name in sampled else name for name in names]
+
+    def _explore(self, order):
+        """每explore_every次识别，把样本最少且不足的后端提到最前"""
+        with self._lock:
+            self._decodes += 1
+            if not self.explore_every or self._decodes % self.explore_every:
+                return order
+            unsampled = [name for name in order if self.stats[name]['attempts'] < self.min_samples]
+            if not unsampled:
+                return order
+            name = min(unsampled, key=lambda n: self.stats[n]['attempts'])
+        return [name] + [n for n in order if n != name]
+
+    def available(self):
+        return bool(self.order())
+
+    def _record(self, name, elapsed, success):
+        with self._lock:
+            stat = self.stats[name]
+            stat['attempts'] += 1
+            stat['total_time'] += elapsed
+            if success:
+                stat['successes'] += 1
+
+    def decode(self, image_array, names=None):
+        """
+        依次尝试各后端识别numpy图像
+
+        Args:
+            names: 只使用这些后端（顺序仍由级联决定），None表示全部
+
+        Returns:
+            (文本, 后端名称)，都未识别时返回 (None, None)
+        """
+        order = self._explore(self.order())
+        if names is not None:
+            order = [name for name in order if name in names]
+        for name in order:
+            backend = DECODERS[name]
+            if backend.load() is None:
+                continue
+            start = time.perf_counter()
+            try:
+                text = backend.decode(image_array)
+            except Exception as e:
+                logging.debug(f"二维码后端{name}识别出错: {e}")
+                text = None
+            self._record(name, time.perf_counter() - start, bool(text))
+            if text:
+                return text, name
+        return None, None
+
+    def status(self):
+        with self._lock:
+            stats = {
+                name: {
+                    'attempts': stat['attempts'],
+                    'successes': stat['successes'],
+                    'success_rate': round(stat['successes'] / stat['attempts'], 4) if stat['attempts'] else None,
+                    'avg_time_ms': round(stat['total_time'] / stat['attempts'] * 1000, 1) if stat['attempts'] else None
+                }
+                for name, stat in self.stats.items()
+            }
+        return {'order': self.order(), 'stats': stats}
+
+_cascade = None
+_cascade_lock = threading.Lock()
+
+def get_cascade():
+    """获取全局识别级联，顺序可通过配置项qr_decoder_cascade调整"""
+    global _cascade
+    if _cascade is None:
+        with _cascade_lock:
+            if _cascade is None:
+                names = [name for name in config.get('qr_decoder_cascade', DEFAULT_CASCADE) if name in DECODERS]
+                _cascade = DecoderCascade(names, config.get('qr_decoder_min_samples', 20),
+                                          config.get('qr_decoder_explore_every', 20))
+    return _cascade
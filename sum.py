@@ -1,54 +1,31 @@
 import os
-import re
-import sys
-
-def extract_amount(filename):
-    # 使用正则表达式提取金额
-    match = re.search(r'\[¥([0-9.]+)\]', filename)
-    if match:
-        return float(match.group(1))
-    return 0.0
-
-def main(invoice_folder):
-    total_sum = 0.0
+import argparse
+from invoice_ledger import sum_folder, InvoiceLedger
 
+def main(invoice_folder, extract=None, show_entries=False):
     # 检查发票文件夹是否存在
     if not os.path.isdir(invoice_folder):
         print("Invoice folder does not exist.")
-        return
-
-    # 遍历发票文件夹中的所有文件
-    for filename in os.listdir(invoice_folder):
-        filepath = os.path.join(invoice_folder, filename)
-        if os.path.isfile(filepath):
-            # 提取文件名中的金额部分并累加
-            amount = extract_amount(filename)
-            total_sum += amount
-
-    # 格式化总金额，确保只有两位小数
-    formatted_total = f"{total_sum:.2f}"
-
-    # 查找文件夹中的 .txt 文件
-    txt_file_found = False
-    for filename in os.listdir(invoice_folder):
-        if filename.endswith(".txt"):
-            old_filepath = os.path.join(invoice_folder, filename)
-            new_filepath = os.path.join(invoice_folder, f"{formatted_total}.txt")
-            os.rename(old_filepath, new_filepath)
-            txt_file_found = True
-            break  # Assuming there is only one .txt file to rename
-
-    # 如果没有找到 .txt 文件，则创建一个新的
-    if not txt_file_found:
-        new_filepath = os.path.join(invoice_folder, f"{formatted_total}.txt")
-        with open(new_filepath, 'w') as f:
-            f.write(f"Total amount: ¥{formatted_total}\n")
-
-    print(f"Total amount: ¥{formatted_total}")
+        return None
+
+    # 增量更新目录清单，只读取新增或变化的文件，合计按整数分计算
+    summary = sum_folder(invoice_folder, extract)
+    if show_entries:
+        with InvoiceLedger(invoice_folder, extract) as ledger:
+            for entry in ledger.entries():
+                print(f"{entry['name']}\t{entry['invoice_number'] or '-'}\t{entry['amount'] or '-'}")
+
+    refresh = summary['refresh']
+    print(f"Total amount: ¥{summary['total']}")
+    print(f"{summary['count']} files ({summary['with_amount']} with amount, {summary['duplicates']} duplicates); "
+          f"added {refresh['added']}, updated {refresh['updated']}, removed {refresh['removed']} "
+          f"in {refresh['elapsed_ms']}ms")
+    return summary
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python sum_invoices.py <path_to_invoice_folder>")
-    else:
-        invoice_folder = sys.argv[1]
-        main(invoice_folder)
+    parser = argparse.ArgumentParser(description="统计目录中发票的总金额")
+    parser.add_argument("invoice_folder", help="发票目录")
+    parser.add_argument("--extract", action="store_true", help="文件名中没有金额时解析文件内容获取")
+    parser.add_argument("--list", action="store_true", help="列出每个文件的发票号码和金额")
+    args = parser.parse_args()
+    main(args.invoice_folder, args.extract or None, args.list)
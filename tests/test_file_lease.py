@@ -0,0 +1,65 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from file_lease import LeaseManager
+
+def make_manager(owner, ttl=60):
+    # 心跳间隔设得很长，测试中手动调用beat()
+    return LeaseManager(ttl=ttl, heartbeat=3600, owner=owner)
+
+def expire(manager, file_path, seconds=600):
+    """把租约的心跳时间改到过去，模拟持有者停顿超过ttl"""
+    path = manager.lease_path(file_path)
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+def test_only_one_node_acquires(tmp_path):
+    file_path = str(tmp_path / "a.pdf")
+    managers = [make_manager(f"node{i}") for i in range(16)]
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        acquired = list(executor.map(lambda m: m.acquire(file_path), managers))
+    assert acquired.count(True) == 1
+
+def test_stale_break_race(tmp_path):
+    file_path = str(tmp_path / "a.pdf")
+    a, b, c = make_manager("A"), make_manager("B"), make_manager("C")
+
+    assert a.acquire(file_path)
+    assert not b.acquire(file_path)
+
+    # A停顿超过ttl，B接管租约
+    expire(a, file_path)
+    assert b.acquire(file_path)
+    assert b.owns(file_path)
+
+    # A恢复后的心跳和释放都不能动B的租约
+    a.beat()
+    assert not a.owns(file_path)
+    a.release(file_path)
+    assert os.path.exists(b.lease_path(file_path))
+
+    # C仍然无法获得租约，只有B在处理
+    assert not c.acquire(file_path)
+    assert b.owns(file_path)
+
+    b.release(file_path)
+    assert not os.path.exists(b.lease_path(file_path))
+    assert c.acquire(file_path)
+
+def test_heartbeat_keeps_lease(tmp_path):
+    file_path = str(tmp_path / "a.pdf")
+    a, b = make_manager("A", ttl=60), make_manager("B", ttl=60)
+    assert a.acquire(file_path)
+    expire(a, file_path)
+    a.beat()
+    assert not b.acquire(file_path)
+    assert a.owns(file_path)
+
+def test_done_marker_written_on_release(tmp_path):
+    from file_lease import done_names
+    file_path = str(tmp_path / "a.pdf")
+    a = make_manager("A")
+    assert a.acquire(file_path)
+    a.release(file_path, str(tmp_path / "12345678.pdf"))
+    assert done_names(str(tmp_path)) == {"12345678.pdf"}
@@ -0,0 +1,51 @@
+import os
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("PIL")
+pytest.importorskip("PyPDF2")
+
+import folder_watcher
+from folder_watcher import FolderWatcher
+from name_registry import rename_reserved
+
+class SyncExecutor:
+    """同步执行任务，结果在submit时就已完成"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+def fake_process(file_path):
+    # 每个文件都识别为同一张发票，重复的发票会得到 12345678_1.pdf 这样的名称
+    new_path = rename_reserved(file_path, "12345678.pdf")
+    return {'original_path': file_path, 'new_path': new_path, 'success': True, 'source': 'text'}
+
+def test_own_rename_events_are_ignored(tmp_path, monkeypatch):
+    monkeypatch.setattr(folder_watcher, "process_arrival", fake_process)
+    (tmp_path / "12345678.pdf").write_bytes(b"%PDF-1.4\n%%EOF")
+    dup = tmp_path / "dup.pdf"
+    dup.write_bytes(b"%PDF-1.4\n%%EOF")
+
+    watcher = FolderWatcher([str(tmp_path)], settle=0)
+    executor = SyncExecutor()
+    watcher._arrived(str(dup), True)
+    watcher._check_pending(executor)
+    watcher._check_pending(executor)
+    watcher._collect()
+    assert watcher.stats['processed'] == 1
+    renamed = str(tmp_path / "12345678_1.pdf")
+    assert os.path.exists(renamed)
+
+    # 处理结果先于inotify事件被收集：占位文件的IN_CREATE、IN_CLOSE_WRITE和IN_MOVED_TO随后才到达
+    for closed in (False, True, True):
+        watcher._arrived(renamed, closed)
+    for _ in range(3):
+        watcher._check_pending(executor)
+        watcher._collect()
+
+    assert watcher.pending == {}
+    assert watcher.stats['processed'] == 1
+    assert sorted(os.listdir(tmp_path)) == ["12345678.pdf", "12345678_1.pdf"]
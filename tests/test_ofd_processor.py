@@ -0,0 +1,37 @@
+import zipfile
+
+import pytest
+
+pytest.importorskip("PIL")
+pytest.importorskip("PyPDF2")
+
+import ofd_processor
+
+CONTENT_XML = (
+    '<?xml version="1.0"?><ofd:Page xmlns:ofd="http://www.ofdspec.org/2016"><ofd:Content><ofd:Layer>'
+    '<ofd:TextObject Boundary="10 50 40 5" Font="1"><ofd:TextCode X="0" Y="0">价税合计(小写)</ofd:TextCode></ofd:TextObject>'
+    '<ofd:TextObject Boundary="60 50 20 5" Font="1"><ofd:TextCode X="0" Y="0">¥100.00</ofd:TextCode></ofd:TextObject>'
+    '</ofd:Layer></ofd:Content></ofd:Page>'
+)
+
+def test_total_in_later_member_beats_subtotal_tag(tmp_path, monkeypatch):
+    monkeypatch.setattr(ofd_processor, "QRCODE_SUPPORT", False)
+    path = tmp_path / "invoice.ofd"
+    with zipfile.ZipFile(path, "w") as archive:
+        # 合计金额（不含税）在前面的成员中，价税合计在页面内容中
+        archive.writestr("Doc_0/CustomTag.xml",
+                         '<?xml version="1.0"?><root><fphm>12345678</fphm><hjje>88.50</hjje></root>')
+        archive.writestr("Doc_0/Pages/Page_0/Content.xml", CONTENT_XML)
+
+    info = ofd_processor.extract_ofd_info_direct(str(path))
+    assert info["invoice_number"] == "12345678"
+    assert info["amount"] == "100.00"
+
+def test_subtotal_tag_used_when_no_total(tmp_path, monkeypatch):
+    monkeypatch.setattr(ofd_processor, "QRCODE_SUPPORT", False)
+    path = tmp_path / "invoice.ofd"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("Doc_0/CustomTag.xml",
+                         '<?xml version="1.0"?><root><fphm>12345678</fphm><hjje>88.50</hjje></root>')
+
+    assert ofd_processor.extract_ofd_info_direct(str(path))["amount"] == "88.50"
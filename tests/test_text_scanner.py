@@ -0,0 +1,111 @@
+import re
+
+import pytest
+
+from text_scanner import TextScanner
+
+# 被单遍扫描器替换之前的正则规则（逐条findall），作为对照
+LEGACY_NUMBER_PATTERNS = [
+    r"\b\d{20}\b",
+    r"\b\d{10}\b",
+    r"\b\d{8}\b"
+]
+
+LEGACY_HIGH_PRIORITY_AMOUNT_PATTERNS = [
+    r"小写[金额]?[^\d\n]{0,20}(?:¥|￥|RMB|人民币)?(\d+\.\d{2})",
+    r"(?:小写|小写金额|小写总计)[：:]((?:¥|￥)?[0-9,]+\.[0-9]{2})",
+    r"[价税]+[合计]+[：:]?(?:¥|￥|RMB|人民币)?\s*([0-9,]+\.[0-9]{2})",
+    r"(?:合[计]?金额|价税合计)[^\d\n]{0,20}(?:¥|￥)?\s*([0-9,]+\.[0-9]{2})"
+]
+
+LEGACY_AMOUNT_PATTERNS = [
+    r"小写[金额]?[^\d\n]{0,20}(?:¥|￥|RMB|人民币)?(\d+\.\d{2})",
+    r"(?:小写|小写金额|小写总计)[：:]((?:¥|￥)?[0-9,]+\.[0-9]{2})",
+    r"[价税]+[合计]+[：:]?(?:¥|￥|RMB|人民币)?\s*([0-9,]+\.[0-9]{2})",
+    r"(?:[（(]?小写[）)]?|价税合计)[^\d\n]{0,20}(?:¥|￥|RMB)?\s*([0-9,]+\.[0-9]{2})",
+    r"(?:¥|￥)\s*([0-9,]+\.[0-9]{2})",
+    r"RMB\s*([0-9,]+\.[0-9]{2})",
+    r"金额[：:]\s*([0-9,]+\.[0-9]{2})",
+    r"(?:金额|合[计]?)[^\d\n]{0,20}(?:¥|￥)?\s*([0-9,]+\.[0-9]{2})",
+    r"(\d+\.\d{2})元",
+    r"\b(\d+\.\d{2})\b"
+]
+
+SAMPLES = [
+    "01,10,044001900111,12345678,100.00,20240102",
+    "电子发票（普通发票）\n发票号码：24112000000123456789\n开票日期：2024年01月02日\n"
+    "合计 ¥88.50 ¥11.50\n价税合计（大写）壹佰圆整 （小写）¥100.00",
+    "发票代码: 044001900111 发票号码: 12345678\n金额: 1,234.56\n价税合计: ¥1,395.05",
+    "No. 1234567890 RMB 300.00\n单价 12.50 数量 2 金额 25.00",
+    "增值税专用发票 发票号码 87654321\n小写金额：￥2,000.00\n合计金额 1769.91 税额 230.09",
+    "收款人: 张三 复核: 李四 开票人: 王五 合计 45.00元",
+]
+
+def _legacy_clean(text):
+    value = float(text.replace(",", "").replace("¥", "").replace("￥", ""))
+    return value if 0.01 <= value <= 100000 else None
+
+def legacy_number(text):
+    candidates = [(rank, match.start(), match.group(0))
+                  for rank, pattern in enumerate(LEGACY_NUMBER_PATTERNS)
+                  for match in re.finditer(pattern, text)]
+    return min(candidates)[2] if candidates else None
+
+def legacy_amounts(patterns, text):
+    values = set()
+    for pattern in patterns:
+        for match in re.finditer(pattern, text):
+            value = _legacy_clean(match.group(1))
+            if value is not None:
+                values.add(value)
+    return values
+
+def legacy_high_amount(text):
+    candidates = []
+    for rank, pattern in enumerate(LEGACY_HIGH_PRIORITY_AMOUNT_PATTERNS):
+        for match in re.finditer(pattern, text):
+            value = _legacy_clean(match.group(1))
+            if value is not None:
+                candidates.append((rank, match.start(1), value))
+    return min(candidates)[2] if candidates else None
+
+def scan(text):
+    numbers, high, normal = [], [], []
+    for kind, group, priority, offset, value, rule_name, labelled in TextScanner().scan(text):
+        if kind == "number":
+            numbers.append((priority, offset, value))
+        elif 0.01 <= float(value) <= 100000:
+            (high if group == "high" else normal).append((priority, offset, float(value)))
+    return numbers, high, normal
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_number_matches_legacy(text):
+    numbers, _, _ = scan(text)
+    assert (min(numbers)[2] if numbers else None) == legacy_number(text)
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_high_priority_amount_matches_legacy(text):
+    _, high, _ = scan(text)
+    assert (min(high)[2] if high else None) == legacy_high_amount(text)
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_amount_candidates_match_legacy(text):
+    _, high, normal = scan(text)
+    assert {c[2] for c in high} == legacy_amounts(LEGACY_HIGH_PRIORITY_AMOUNT_PATTERNS, text)
+    legacy = legacy_amounts(LEGACY_AMOUNT_PATTERNS, text)
+    scanned = {c[2] for c in normal}
+    assert scanned <= legacy
+    # 旧的\b(\d+\.\d{2})\b会把 1,234.56 的后半段 234.56 也当作金额，扫描器不再产生这种片段
+    assert all(f",{value:.2f}" in text for value in legacy - scanned)
+
+def test_comma_separated_fields_are_split():
+    numbers, _, _ = scan("01,10,044001900111,12345678,100.00,20240102")
+    assert [value for _, _, value in numbers] == ["12345678", "20240102"]
+
+def test_thousands_separator_kept_in_amount():
+    _, high, _ = scan("价税合计: ¥1,395.05")
+    assert [value for _, _, value in high] == [1395.05]
+
+def test_unit_price_with_more_decimals_is_not_an_amount():
+    _, high, normal = scan("单价 12.345 金额 24.69")
+    assert {c[2] for c in high + normal} == {24.69}
@@ -0,0 +1,120 @@
+import re
+
+# 文本规则表：扫描时对每个数字只做一次分类，新增规则不会增加扫描遍数
+#   kind: number（发票号码）或 amount（金额）
+#   group: 金额规则的分组，high为高优先级（小写/价税合计），normal为普通
+#   priority: 同类规则中的优先级，数值越小越优先
+#   digits: 发票号码的位数
+#   prefix: 数字前紧邻文本需要满足的模式（在有限长度的窗口内匹配）
+#   suffix: 数字后紧邻文本需要满足的模式
+#   boundary: 是否要求数字两侧不是字母、数字或汉字（等同正则中的\b）
+TEXT_RULES = [
+    {"name": "20位发票号", "kind": "number", "priority": 0, "digits": 20, "boundary": True},
+    {"name": "10位发票号", "kind": "number", "priority": 1, "digits": 10, "boundary": True},
+    {"name": "8位发票号", "kind": "number", "priority": 2, "digits": 8, "boundary": True},
+
+    {"name": "小写金额", "kind": "amount", "group": "high", "priority": 0,
+     "prefix": r"小写[金额]?[^\d\n]{0,20}(?:¥|￥|RMB|人民币)?"},
+    {"name": "小写金额冒号格式", "kind": "amount", "group": "high", "priority": 1,
+     "prefix": r"(?:小写|小写金额|小写总计)[：:](?:¥|￥)?"},
+    {"name": "价税合计", "kind": "amount", "group": "high", "priority": 2,
+     "prefix": r"[价税]+[合计]+[：:]?(?:¥|￥|RMB|人民币)?\s*"},
+    {"name": "合计金额", "kind": "amount", "group": "high", "priority": 3,
+     "prefix": r"(?:合[计]?金额|价税合计)[^\d\n]{0,20}(?:¥|￥)?\s*"},
+
+    {"name": "小写或价税合计", "kind": "amount", "group": "normal", "priority": 0,
+     "prefix": r"(?:[（(]?小写[）)]?|价税合计)[^\d\n]{0,20}(?:¥|￥|RMB)?\s*"},
+    {"name": "人民币符号", "kind": "amount", "group": "normal", "priority": 1,
+     "prefix": r"(?:¥|￥)\s*"},
+    {"name": "RMB", "kind": "amount", "group": "normal", "priority": 2,
+     "prefix": r"RMB\s*"},
+    {"name": "金额冒号", "kind": "amount", "group": "normal", "priority": 3,
+     "prefix": r"金额[：:]\s*"},
+    {"name": "金额或合计", "kind": "amount", "group": "normal", "priority": 4,
+     "prefix": r"(?:金额|合[计]?)[^\d\n]{0,20}(?:¥|￥)?\s*"},
+    {"name": "元", "kind": "amount", "group": "normal", "priority": 5,
+     "suffix": r"元"},
+    {"name": "通用金额", "kind": "amount", "group": "normal", "priority": 6, "boundary": True}
+]
+
+# 发票号码前的标签，用于判断号码是否可信
+NUMBER_LABEL = r"发票号码[：:\s]*"
+
+# 所有数字只用这一个正则扫描一遍
+# 只把真正的千分位（每组3位）当作数字的一部分，"01,10,12345678"这样逗号分隔的字段拆成多个数字
+TOKEN_PATTERN = re.compile(r"\d{1,3}(?:,\d{3}(?!\d))+(?:\.\d+)?|\d+(?:\.\d+)?")
+
+# 前缀模式最多向前查看的字符数
+WINDOW_CHARS = 32
+
+class TextScanner:
+    """
+    预编译的单遍文本扫描器
+    对文本中的每个数字按规则表分类，输出所有候选，候选的选择由调用方完成
+    """
+
+    def __init__(self, rules=None, window_chars=WINDOW_CHARS):
+        self.window_chars = window_chars
+        self.number_rules = {}
+        self.amount_rules = []
+        for rule in rules or TEXT_RULES:
+            if rule["kind"] == "number":
+                self.number_rules[rule["digits"]] = rule
+            else:
+                self.amount_rules.append((
+                    rule,
+                    re.compile(f"(?:{rule['prefix']})\\Z") if rule.get("prefix") else None,
+                    re.compile(rule["suffix"]) if rule.get("suffix") else None
+                ))
+        self.number_label = re.compile(f"{NUMBER_LABEL}\\Z")
+
+    @staticmethod
+    def _is_word_char(char):
+        return char.isalnum() or char == "_"
+
+    def scan(self, text, start=0):
+        """
+        扫描text[start:]中的数字
+
+        Yields:
+            (kind, group, priority, offset, value, rule_name, labelled)
+            kind为number时value是号码字符串，labelled表示号码前是否有"发票号码"标签；
+            kind为amount时value是金额字符串（已去掉千分位逗号）
+        """
+        for match in TOKEN_PATTERN.finditer(text, start):
+            token = match.group(0)
+            offset = match.start()
+            end = offset + len(token)
+            before = text[offset - 1] if offset > 0 else ""
+            after = text[end] if end < len(text) else ""
+            bounded = not self._is_word_char(before) and not self._is_word_char(after)
+            window = text[max(0, offset - self.window_chars):offset]
+
+            if "." not in token:
+                rule = self.number_rules.get(len(token))
+                if rule and "," not in token and (bounded or not rule.get("boundary")):
+                    labelled = self.number_label.search(window) is not None
+                    yield ("number", None, rule["priority"], offset, token, rule["name"], labelled)
+                continue
+
+            integer_part, decimals = token.split(".", 1)
+            if len(decimals) != 2:
+                continue
+            value = token.replace(",", "")
+            for rule, prefix, suffix in self.amount_rules:
+                if rule.get("boundary") and not bounded:
+                    continue
+                if prefix is not None and not prefix.search(window):
+                    continue
+                if suffix is not None and not suffix.match(text, end):
+                    continue
+                yield ("amount", rule["group"], rule["priority"], offset, value, rule["name"], False)
+
+_default_scanner = None
+
+def get_scanner():
+    """获取使用默认规则表的扫描器"""
+    global _default_scanner
+    if _default_scanner is None:
+        _default_scanner = TextScanner()
+    return _default_scanner
@@ -0,0 +1,197 @@
+import os
+import json
+import hashlib
+import logging
+from config_manager import config
+from name_registry import get_directory_names
+
+# 各格式的文件头：PDF以%PDF开头（规范允许前面有少量字节），OFD为ZIP压缩包
+UPLOAD_SIGNATURES = {
+    '.pdf': b'%PDF',
+    '.ofd': b'PK\x03\x04'
+}
+PDF_HEADER_WINDOW = 1024
+
+def upload_limits():
+    """上传限制：(分块大小, 单个文件上限, 单次请求上限)，单位字节"""
+    return (
+        config.get('upload_chunk_size', 1024 * 1024),
+        config.get('upload_max_file_bytes', 50 * 1024 * 1024),
+        config.get('upload_max_request_bytes', 500 * 1024 * 1024)
+    )
+
+def safe_filename(filename):
+    """去掉客户端文件名中的目录部分，防止写到上传目录之外"""
+    name = os.path.basename((filename or '').replace('\\', '/')).strip()
+    if name in ('', '.', '..'):
+        return 'upload'
+    return name
+
+def check_signature(ext, head):
+    """检查文件头是否与扩展名一致，不一致时抛出ValueError"""
+    signature = UPLOAD_SIGNATURES.get(ext)
+    if signature is None:
+        raise ValueError(f"不支持的文件类型: {ext}")
+    if ext == '.pdf':
+        matched = signature in head[:PDF_HEADER_WINDOW]
+    else:
+        matched = head.startswith(signature)
+    if not matched:
+        raise ValueError(f"文件内容不是有效的{ext[1:].upper()}格式")
+
+class RequestBudget:
+    """单次请求剩余可写入的字节数"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def consume(self, size):
+        if self.used + size > self.max_bytes:
+            raise ValueError(f"超过单次上传总大小限制({self.max_bytes}字节)")
+        self.used += size
+
+    def release(self, size):
+        """被拒绝的文件已删除，归还其占用的字节数"""
+        self.used = max(0, self.used - size)
+
+def copy_upload(source, dest_path, budget=None):
+    """
+    将上传文件按固定大小分块写入磁盘，复制的同时计算SHA-256
+    第一块读到后立即校验文件头，超出大小限制时立即停止；失败时不留下部分文件
+    目标文件名以O_EXCL预留，同一请求中的同名文件依次保存为 名称_1、名称_2 ……，不会互相覆盖，
+    返回的哈希始终对应实际保存的文件内容
+
+    Args:
+        source: 上传文件对象（同步读取）
+        dest_path: 期望的目标路径，扩展名决定期望的文件格式
+        budget: RequestBudget，多个文件共享单次请求的总大小限制
+
+    Returns:
+        {'path': 实际保存的路径, 'size': 字节数, 'content_hash': SHA-256}
+    """
+    chunk_size, max_file_bytes, _ = upload_limits()
+    ext = os.path.splitext(dest_path)[1].lower()
+    if ext not in UPLOAD_SIGNATURES:
+        raise ValueError(f"不支持的文件类型: {ext}")
+
+    folder, name = os.path.split(dest_path)
+    names = get_directory_names(folder)
+    dest_path = os.path.join(folder, names.reserve(name))
+    digest = hashlib.sha256()
+    size = 0
+    consumed = 0
+    part_path = f"{dest_path}.part"
+    try:
+        with open(part_path, 'wb') as out:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                if size == 0:
+                    check_signature(ext, chunk)
+                size += len(chunk)
+                if size > max_file_bytes:
+                    raise ValueError(f"文件超过大小限制({max_file_bytes}字节)")
+                if budget is not None:
+                    budget.consume(len(chunk))
+                    consumed += len(chunk)
+                digest.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise ValueError("文件为空")
+        os.replace(part_path, dest_path)
+    except Exception:
+        if budget is not None:
+            budget.release(consumed)
+        for path in (part_path, dest_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        names.discard(os.path.basename(dest_path))
+        raise
+
+    logging.info(f"已保存上传文件: {dest_path} ({size}字节)")
+    return {'path': dest_path, 'size': size, 'content_hash': digest.hexdigest()}
+
+# 上传接口的请求体上限在文件总大小上限之外为multipart分隔行和表单字段预留的字节数
+MULTIPART_OVERHEAD = 1024 * 1024
+
+class RequestTooLarge(Exception):
+    """请求体超过上限"""
+
+class RequestSizeLimit:
+    """
+    ASGI中间件：在表单解析之前限制上传接口的请求体大小
+    Starlette在调用处理函数之前就会把整个multipart请求体写入临时文件，
+    copy_upload中的大小限制和文件头校验只能在上传完成后进行；
+    这里先检查Content-Length，超过上限时不读取请求体直接返回413，
+    没有Content-Length（分块传输）时边接收边计数，超过上限立即中止
+    """
+
+    def __init__(self, app, paths, max_bytes=None):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    def limit(self):
+        return self.max_bytes or upload_limits()[2] + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope.get('method') != 'POST' or scope.get('path') not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.limit()
+        headers = dict(scope.get('headers') or [])
+        try:
+            declared = int(headers.get(b'content-length', b'0'))
+        except ValueError:
+            declared = 0
+        if declared > max_bytes:
+            logging.warning(f"拒绝上传请求: Content-Length {declared} 超过上限 {max_bytes}")
+            await self._reject(send, max_bytes)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > max_bytes:
+                    exceeded = True
+                    raise RequestTooLarge(f"请求体超过上限({max_bytes}字节)")
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            # 超过上限后丢弃应用自己生成的错误响应，统一返回413
+            if exceeded and not started:
+                return
+            started = started or message['type'] == 'http.response.start'
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except RequestTooLarge:
+            pass
+        if exceeded:
+            logging.warning(f"上传请求在接收{received}字节后超过上限 {max_bytes}，已中止")
+            if not started:
+                await self._reject(send, max_bytes)
+
+    @staticmethod
+    async def _reject(send, max_bytes):
+        body = json.dumps({'detail': f"超过单次上传总大小限制({max_bytes}字节)"}, ensure_ascii=False).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                        (b'connection', b'close')]
+        })
+        await send({'type': 'http.response.body', 'body': body})
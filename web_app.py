@@ -1,5 +1,5 @@
 from fastapi import FastAPI, UploadFile, File, Form, Request, HTTPException, Depends
-from fastapi.responses import JSONResponse, HTMLResponse, FileResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import os
@@ -7,15 +7,20 @@ import logging
 from typing import List, Dict, Any
 import shutil
 from datetime import datetime
-import zipfile
-import re
+import json
+import time
 import hashlib
 import secrets
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from config_manager import config
-from pdf_processor import process_special_pdf
-from ofd_processor import process_ofd, extract_ofd_info_direct
-from data_extractor import extract_information_from_pdf
+from invoice_pipeline import process_invoice
+from extraction_cache import get_cache
+from qr_decoders import warmup, decoder_status, get_cascade
+from worker_pool import run_io, map_concurrent, iter_completed, pool_status, pool_type, warmup_workers, worker_stats, \
+    shutdown as shutdown_workers
+from upload_store import copy_upload, safe_filename, upload_limits, RequestBudget, RequestSizeLimit
+from zip_stream import ZipStream, iter_zip
+from job_queue import Job, get_job_queue
 import uvicorn
 
 # 检查可选功能的可用性
@@ -43,25 +48,32 @@ def add_log_entry(level, message):
     if len(logs_buffer) > max_logs:
         logs_buffer.pop(0)
 
+def qrcode_support_label():
+    """二维码支持状态的描述，包含当前识别级联顺序"""
+    if not QRCODE_SUPPORT:
+        return '不可用'
+    return f"可用 ({', '.join(get_cascade().order())})"
+
 # 添加初始日志
 add_log_entry('INFO', '发票处理系统启动')
 add_log_entry('INFO', f"运行环境: {'Vercel' if os.environ.get('VERCEL') == '1' else '本地'}")
-add_log_entry('INFO', f"二维码支持: {'可用 (qreader)' if QRCODE_SUPPORT else '不可用'}")
+add_log_entry('INFO', f"二维码支持: {qrcode_support_label()}")
 if not QRCODE_SUPPORT:
     add_log_entry('WARNING', '二维码识别功能不可用，请检查qreader库的安装')
 
 # 确保目录存在
 tmp_dir = "/tmp"
 uploads_dir = "/tmp/uploads"
-downloads_dir = "/tmp/downloads"
 
 os.makedirs(uploads_dir, exist_ok=True)
-os.makedirs(downloads_dir, exist_ok=True)
 os.makedirs("static", exist_ok=True)
 os.makedirs("templates", exist_ok=True)
 
 app = FastAPI(title="发票处理系统")
 
+# 上传接口在表单解析之前按Content-Length和已接收字节数限制请求体大小
+app.add_middleware(RequestSizeLimit, paths=["/upload", "/upload/zip", "/api/jobs", "/api/extract"])
+
 # 静态文件和模板配置
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -89,6 +101,13 @@ def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
         )
     return credentials
 
+def background_jobs_supported():
+    """
+    是否可以使用后台任务和事件流
+    Vercel函数在响应返回后会被冻结，且任务状态不在实例之间共享，只能使用同步的 /upload
+    """
+    return os.environ.get("VERCEL") != "1"
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """主页"""
@@ -99,27 +118,11 @@ async def home(request: Request):
         "index.html",
         {
             "request": request,
-            "config": config_data
+            "config": config_data,
+            "use_jobs": background_jobs_supported()
         }
     )
 
-def create_zip_file(files_info):
-    """创建包含处理后文件的ZIP包"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    zip_filename = f"processed_invoices_{timestamp}.zip"
-    zip_path = os.path.join(downloads_dir, zip_filename)
-    
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for info in files_info:
-            if info["success"] and info.get("new_path"):
-                # 将文件添加到ZIP中，使用新文件名作为ZIP中的名称
-                zipf.write(
-                    info["new_path"],
-                    os.path.basename(info["new_path"])
-                )
-    
-    return zip_path, zip_filename
-
 # 简化的日志API
 @app.get("/api/logs")
 async def get_logs(limit: int = 100, level: str = None, test: bool = False):
@@ -136,7 +139,7 @@ async def get_logs(limit: int = 100, level: str = None, test: bool = False):
             add_log_entry('ERROR', '这是一条测试ERROR日志')
             # 添加系统状态信息
             add_log_entry('INFO', f"运行环境: {'Vercel' if os.environ.get('VERCEL') == '1' else '本地'}")
-            add_log_entry('INFO', f"二维码支持: {'可用 (qreader)' if QRCODE_SUPPORT else '不可用'}")
+            add_log_entry('INFO', f"二维码支持: {qrcode_support_label()}")
             if not QRCODE_SUPPORT:
                 add_log_entry('WARNING', '二维码识别功能不可用 - 请检查qreader库是否正确安装')
         
@@ -156,120 +159,189 @@ async def get_logs(limit: int = 100, level: str = None, test: bool = False):
         add_log_entry('ERROR', f'获取日志时出错: {str(e)}')
         return {"logs": [], "error": str(e)}
 
-@app.post("/upload")
-async def upload_files(files: List[UploadFile] = File(...)):
-    """处理上传的文件并返回ZIP包下载链接"""
+@app.get("/api/warmup")
+async def warmup_decoders(backends: str = None):
+    """
+    预加载二维码识别后端，返回各后端的导入和初始化耗时
+    进程池模式下识别在工作进程中进行，改为以预加载参数重启工作进程，加载情况通过 /api/decoders 查看
+    """
+    names = [name.strip() for name in backends.split(",") if name.strip()] if backends else None
+    if pool_type() == 'process':
+        warmup_workers(names)
+        add_log_entry('INFO', "工作进程正在以预加载二维码后端的方式重启")
+        return {"success": True, "workers": "restarting", "decoders": decoder_status()}
+    status = warmup(names)
+    add_log_entry('INFO', f"二维码后端预热完成: {', '.join(n for n, st in status.items() if st['loaded']) or '无'}")
+    return {"success": True, "decoders": status}
+
+@app.get("/api/decoders")
+async def get_decoder_status():
+    """
+    查看二维码识别后端的加载状态和识别级联统计（不触发加载）
+    进程池模式下workers为各工作进程汇总的级联统计和已加载的后端
+    """
+    return {"decoders": decoder_status(), "cascade": get_cascade().status(), "workers": worker_stats()}
+
+@app.get("/api/workers")
+async def get_worker_status():
+    """查看发票处理工作池的配置"""
+    return {**pool_status(), "jobs": get_job_queue().status()}
+
+@app.on_event("shutdown")
+def stop_workers():
+    """应用退出时关闭工作池"""
+    shutdown_workers(wait=False)
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """
+    获取提取缓存的命中/未命中统计
+    进程池模式下查询发生在工作进程中，hits/misses为Web进程与各工作进程之和
+    """
+    cache = get_cache()
+    if cache is None:
+        return {"enabled": False}
+    stats = cache.stats()
+    workers = worker_stats()
+    if workers:
+        for key in ('hits', 'misses', 'evictions'):
+            stats[key] += workers['cache'][key]
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['workers'] = workers['workers']
+    return {"enabled": True, **stats}
+
+@app.post("/api/cache/clear")
+async def clear_cache(credentials: HTTPBasicCredentials = Depends(verify_admin)):
+    """清空提取缓存（需要密码验证）"""
+    cache = get_cache()
+    if cache is None:
+        return {"success": False, "error": "提取缓存未启用"}
+    cache.clear()
+    add_log_entry('INFO', '提取缓存已清空')
+    return {"success": True}
+
+def build_result_item(filename, pipeline_result):
+    """将流水线结果转换为上传接口的返回项"""
+    success = bool(pipeline_result and pipeline_result['success'])
+    return {
+        "filename": filename,
+        "success": success,
+        "amount": pipeline_result['amount'] if pipeline_result else None,
+        "invoice_number": pipeline_result['invoice_number'] if pipeline_result else None,
+        "source": pipeline_result['source'] if pipeline_result else None,
+        "cached": pipeline_result['cached'] if pipeline_result else False,
+        "new_name": pipeline_result['new_name'] if success else None,
+        "new_path": pipeline_result['new_path'] if success else None
+    }
+
+async def save_uploads(files, request_dir=None):
+    """
+    保存一个请求中上传的文件
+    分块写入磁盘并同时计算哈希，文件头不符或超出大小限制的文件立即拒绝
+
+    Args:
+        request_dir: 保存目录，默认在上传目录下新建一个子目录
+
+    Returns:
+        (results, pending)：results为每个文件的返回项，
+        pending为待处理的 (results中的序号, 文件路径, 内容哈希)
+    """
     results = []
-    processed_files = []
+    pending = []
+    budget = RequestBudget(upload_limits()[2])
+    # 每个请求使用单独的子目录，并发请求中的同名文件互不覆盖
+    request_dir = request_dir or os.path.join(uploads_dir, secrets.token_hex(8))
+    os.makedirs(request_dir, exist_ok=True)
+    add_log_entry('INFO', f"接收到{len(files)}个文件上传请求")
+    
+    for file in files:
+        try:
+            saved = await run_io(copy_upload, file.file, os.path.join(request_dir, safe_filename(file.filename)), budget)
+            file_path = saved['path']
+            add_log_entry('INFO', f"已保存文件: {file_path}, 大小: {saved['size']} 字节")
+            add_log_entry('INFO', f"开始处理{os.path.splitext(file_path)[1][1:].upper()}文件: {file_path}")
+            pending.append((len(results), file_path, saved['content_hash']))
+            results.append(build_result_item(file.filename, None))
+        except ValueError as e:
+            add_log_entry('WARNING', f"拒绝上传文件 {file.filename}: {e}")
+            results.append({
+                "filename": file.filename,
+                "success": False,
+                "error": str(e)
+            })
+        except Exception as e:
+            add_log_entry('ERROR', f"处理文件失败: {e}")
+            results.append({
+                "filename": file.filename,
+                "success": False,
+                "error": str(e)
+            })
+    return results, pending
+
+def record_outcome(results, index, outcome):
+    """记录一个文件的处理结果，返回是否成功"""
+    if isinstance(outcome, Exception):
+        add_log_entry('ERROR', f"处理文件时出错: {outcome}")
+        return False
+    add_log_entry('INFO', f"提取到信息 - 发票号: {outcome['invoice_number']}, 金额: {outcome['amount']}, 来源: {outcome['source']}")
+    results[index] = build_result_item(results[index]["filename"], outcome)
+    add_log_entry('INFO', f"处理结果: {results[index]}")
+    return results[index]["success"]
+
+# 待下载的ZIP包：下载文件名 -> {'files': [(文件路径, 包内文件名)], 'created': 时间戳}
+# 只记录文件清单，下载时再边打包边发送，不在磁盘上生成压缩包
+download_registry = {}
+
+def register_download(results):
+    """登记成功处理的文件，返回下载文件名"""
+    now = time.time()
+    ttl = config.get('download_ttl_seconds', 3600)
+    for name in [name for name, entry in download_registry.items() if now - entry['created'] > ttl]:
+        download_registry.pop(name, None)
     
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    zip_filename = f"processed_invoices_{timestamp}_{secrets.token_hex(4)}.zip"
+    download_registry[zip_filename] = {
+        'files': [(r["new_path"], r["new_name"]) for r in results if r["success"]],
+        'created': now
+    }
+    return zip_filename
+
+def zip_response(generator, zip_filename):
+    """以流的方式返回ZIP包"""
+    return StreamingResponse(
+        generator,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{zip_filename}"'}
+    )
+
+@app.post("/upload")
+async def upload_files(files: List[UploadFile] = File(...)):
+    """
+    处理上传的文件并返回ZIP包下载链接
+    文件的解析、识别和打包都在工作池中执行，事件循环保持响应；
+    同一请求的多个文件并发处理，并发数受单请求上限和全局上限约束
+    """
     try:
-        # 获取当前的配置状态
+        # Web UI的重命名配置按请求传递，不修改全局配置，并发请求互不影响
         rename_with_amount = config.get("webui_rename_with_amount", False)
         add_log_entry('INFO', f"当前配置: rename_with_amount={rename_with_amount}")
+        results, pending = await save_uploads(files)
         
-        # 暂时设置为False，确保提取金额但不包含在文件名中
-        if not rename_with_amount:
-            config.set("rename_with_amount", False)
-        
-        add_log_entry('INFO', f"接收到{len(files)}个文件上传请求")
-        
-        for file in files:
-            try:
-                # 保存上传的文件
-                file_path = os.path.join(uploads_dir, file.filename)
-                with open(file_path, "wb") as buffer:
-                    content = await file.read()
-                    buffer.write(content)
-                
-                add_log_entry('INFO', f"已保存文件: {file_path}, 大小: {len(content)} 字节")
-                
-                # 处理文件
-                ext = os.path.splitext(file.filename)[1].lower()
-                result = None
-                amount = None
-                
-                try:
-                    if ext == '.pdf':
-                        add_log_entry('INFO', f"开始处理PDF文件: {file_path}")
-                        # 直接从PDF提取发票号和金额
-                        invoice_number, extracted_amount = extract_information_from_pdf(file_path)
-                        add_log_entry('INFO', f"从PDF中提取到信息 - 发票号: {invoice_number}, 金额: {extracted_amount}")
-                        
-                        # 记录金额信息，无论是否用于重命名
-                        amount = extracted_amount
-                        
-                        # 处理PDF文件
-                        result = process_special_pdf(file_path)
-                        add_log_entry('INFO', f"PDF处理结果: {result}")
-                        
-                        # 如果处理成功但没有金额信息，尝试从文件名获取
-                        if result and not amount:
-                            try:
-                                amount_match = re.search(r'\[¥(\d+\.\d{2})\]', os.path.basename(result))
-                                if amount_match:
-                                    amount = amount_match.group(1)
-                                    add_log_entry('INFO', f"从文件名提取到金额: {amount}")
-                            except Exception as e:
-                                add_log_entry('WARNING', f"从文件名提取金额失败: {e}")
-                    elif ext == '.ofd':
-                        add_log_entry('INFO', f"开始处理OFD文件: {file_path}")
-                        
-                        # 先尝试直接从OFD文件提取信息
-                        ofd_info = extract_ofd_info_direct(file_path)
-                        if ofd_info.get('amount'):
-                            amount = ofd_info.get('amount')
-                            add_log_entry('INFO', f"从OFD文件直接提取到金额: {amount}")
-                        
-                        # 处理OFD文件
-                        result = process_ofd(file_path, "", False)
-                        add_log_entry('INFO', f"OFD处理结果: {result}")
-                        
-                        # 如果处理成功但没有金额信息，尝试从文件名获取
-                        if result and not amount:
-                            try:
-                                amount_match = re.search(r'\[¥(\d+\.\d{2})\]', os.path.basename(result))
-                                if amount_match:
-                                    amount = amount_match.group(1)
-                                    add_log_entry('INFO', f"从文件名提取到金额: {amount}")
-                            except Exception as e:
-                                add_log_entry('WARNING', f"从文件名提取金额失败: {e}")
-                    else:
-                        add_log_entry('WARNING', f"不支持的文件类型: {ext}")
-                except Exception as file_process_error:
-                    add_log_entry('ERROR', f"处理文件时出错: {file_process_error}")
-                    result = None
-                
-                # 准备结果
-                success = result is not None
-                new_name = os.path.basename(result) if success else None
-                
-                result_item = {
-                    "filename": file.filename,
-                    "success": success,
-                    "amount": amount,
-                    "new_name": new_name,
-                    "new_path": result if success else None
-                }
-                
-                add_log_entry('INFO', f"处理结果: {result_item}")
-                results.append(result_item)
-                
-                if success:
-                    processed_files.append(result)
-                
-            except Exception as e:
-                add_log_entry('ERROR', f"处理文件失败: {e}")
-                results.append({
-                    "filename": file.filename,
-                    "success": False,
-                    "error": str(e)
-                })
-                continue
+        # 处理文件：提取一次信息，重命名复用同一结果
+        outcomes = await map_concurrent(
+            process_invoice,
+            [(file_path, True, content_hash) for _, file_path, content_hash in pending],
+            with_amount=rename_with_amount
+        )
+        for (index, _, _), outcome in zip(pending, outcomes):
+            record_outcome(results, index, outcome)
         
-        # 创建ZIP文件（如果有成功处理的文件）
-        if processed_files:
-            zip_path, zip_filename = create_zip_file([r for r in results if r["success"]])
-            add_log_entry('INFO', f"创建ZIP文件: {zip_path}")
+        # 登记下载（如果有成功处理的文件），ZIP包在下载时流式生成
+        if any(r["success"] for r in results):
+            zip_filename = register_download(results)
+            add_log_entry('INFO', f"登记ZIP下载: {zip_filename}")
             return {"success": True, "results": results, "download": zip_filename}
         
         return {"success": True, "results": results}
@@ -277,25 +349,181 @@ async def upload_files(files: List[UploadFile] = File(...)):
     except Exception as e:
         add_log_entry('ERROR', f"处理上传文件时出错: {e}")
         return {"success": False, "error": str(e)}
-    finally:
-        # 恢复原始配置
-        config.set("rename_with_amount", rename_with_amount)
+
+@app.post("/upload/zip")
+async def upload_files_as_zip(files: List[UploadFile] = File(...)):
+    """
+    处理上传的文件，直接以ZIP流返回
+    不等待全部文件处理完成：先处理完的文件先写入压缩包并发送，
+    包的最后附带results.json记录每个文件的处理结果
+    """
+    rename_with_amount = config.get("webui_rename_with_amount", False)
+    results, pending = await save_uploads(files)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    async def generate():
+        stream = ZipStream()
+        completed = iter_completed(
+            process_invoice,
+            [(file_path, True, content_hash) for _, file_path, content_hash in pending],
+            with_amount=rename_with_amount
+        )
+        async for position, outcome in completed:
+            index = pending[position][0]
+            if not record_outcome(results, index, outcome):
+                continue
+            # 文件读取和打包在I/O线程中逐块进行
+            chunks = stream.add_file(results[index]["new_path"], results[index]["new_name"])
+            while True:
+                chunk = await run_io(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        summary = json.dumps(results, ensure_ascii=False, indent=2).encode('utf-8')
+        yield stream.add_bytes("results.json", summary)
+        yield stream.finish()
+        add_log_entry('INFO', f"ZIP流发送完成: {sum(1 for r in results if r['success'])}个文件")
+    
+    return zip_response(generate(), f"processed_invoices_{timestamp}.zip")
+
+@app.post("/api/jobs")
+async def create_job(files: List[UploadFile] = File(...)):
+    """
+    提交后台处理任务，保存文件后立即返回任务ID
+    文件在后台队列中处理，进度通过 GET /api/jobs/{job_id} 或事件流 /api/jobs/{job_id}/events 获取
+    """
+    if not background_jobs_supported():
+        raise HTTPException(status_code=501, detail="当前部署环境不支持后台任务，请使用 /upload")
+    rename_with_amount = config.get("webui_rename_with_amount", False)
+    results, pending = await save_uploads(files)
+    job = Job([r["filename"] for r in results])
+    # 上传时已被拒绝的文件直接标记为失败
+    pending_indexes = {index for index, _, _ in pending}
+    for index, item in enumerate(results):
+        if index not in pending_indexes:
+            job.update_file(index, item, 'failed')
+    
+    async def run(job):
+        completed = iter_completed(
+            process_invoice,
+            [(file_path, True, content_hash) for _, file_path, content_hash in pending],
+            with_amount=rename_with_amount
+        )
+        async for position, outcome in completed:
+            index = pending[position][0]
+            success = record_outcome(results, index, outcome)
+            if isinstance(outcome, Exception):
+                results[index]["error"] = str(outcome)
+            job.update_file(index, results[index], 'done' if success else 'failed')
+        if any(r["success"] for r in results):
+            job.summary['download'] = register_download(results)
+    
+    get_job_queue().submit(job, run)
+    add_log_entry('INFO', f"已提交后台任务 {job.id}: {len(results)}个文件")
+    return {"success": True, **job.snapshot()}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询后台任务状态及每个文件的处理结果"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "任务不存在"})
+    return job.snapshot()
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """
+    以Server-Sent Events推送任务进度：每个文件处理完成时发送file事件，
+    任务状态变化时发送status事件；支持Last-Event-ID断线续传
+    """
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "任务不存在"})
+    
+    try:
+        since = int(request.headers.get("last-event-id", -1)) + 1
+    except ValueError:
+        since = 0
+    
+    async def generate():
+        position = since
+        while True:
+            events = await job.wait_events(position, timeout=15)
+            for event in events:
+                data = json.dumps(event['data'], ensure_ascii=False)
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+            position += len(events)
+            if job.done and position >= len(job.events):
+                break
+            if not events:
+                # 心跳，防止代理断开空闲连接
+                yield ": keep-alive\n\n"
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def extract_record(filename, outcome):
+    """/api/extract 输出的一行记录"""
+    if isinstance(outcome, Exception):
+        return {"filename": filename, "success": False, "error": str(outcome)}
+    record = {
+        "filename": filename,
+        "success": outcome['success'],
+        "invoice_number": outcome['invoice_number'] if outcome['source'] != 'generated' else None,
+        "amount": outcome['amount'],
+        "method": outcome['source'],
+        "cached": outcome['cached'],
+        "elapsed_ms": outcome['elapsed_ms'],
+        "content_hash": outcome['content_hash']
+    }
+    if outcome.get('error'):
+        record["error"] = outcome['error']
+    return record
+
+@app.post("/api/extract")
+async def extract_files(files: List[UploadFile] = File(...)):
+    """
+    只提取发票号码和金额，不重命名、不打包
+    每个文件处理完成后立即输出一行JSON（NDJSON），上传的文件在响应结束后删除
+    """
+    request_dir = os.path.join(uploads_dir, f"extract_{secrets.token_hex(8)}")
+    results, pending = await save_uploads(files, request_dir)
+    
+    async def generate():
+        try:
+            pending_indexes = {index for index, _, _ in pending}
+            for index, item in enumerate(results):
+                if index not in pending_indexes:
+                    yield json.dumps(extract_record(item["filename"], ValueError(item.get("error", "未处理"))), ensure_ascii=False) + "\n"
+            
+            completed = iter_completed(
+                process_invoice,
+                [(file_path, False, content_hash) for _, file_path, content_hash in pending]
+            )
+            async for position, outcome in completed:
+                filename = results[pending[position][0]]["filename"]
+                yield json.dumps(extract_record(filename, outcome), ensure_ascii=False) + "\n"
+        finally:
+            # 客户端中途断开时也会执行，这里不能再等待其他协程
+            shutil.rmtree(request_dir, ignore_errors=True)
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 @app.get("/download/{filename}")
 async def download_file(filename: str):
-    """下载处理后的ZIP文件"""
-    file_path = os.path.join(downloads_dir, filename)
-    if not os.path.exists(file_path):
+    """下载处理后的文件，边打包边发送"""
+    entry = download_registry.get(filename)
+    if entry is None:
         return JSONResponse(
             status_code=404,
             content={"error": "文件不存在"}
         )
     
-    return FileResponse(
-        file_path,
-        media_type="application/zip",
-        filename=filename
-    )
+    files = [(path, name) for path, name in entry['files'] if os.path.exists(path)]
+    return zip_response(iter_zip(files), filename)
 
 @app.get("/config")
 async def get_config():
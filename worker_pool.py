@@ -0,0 +1,269 @@
+import os
+import asyncio
+import logging
+import functools
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config_manager import config
+
+_cpu_executor = None
+_io_executor = None
+_executor_lock = threading.Lock()
+_global_slots = None
+# 进程池模式下预热接口请求的二维码后端，新建进程池时由各工作进程加载
+_warmup_override = None
+# 各工作进程最近一次随任务结果上报的统计：pid -> 统计
+_worker_snapshots = {}
+
+def pool_type():
+    """
+    CPU密集任务使用的执行器类型：'process'（默认）或 'thread'
+    Vercel等无法创建子进程的环境默认使用线程
+    """
+    default = 'thread' if os.environ.get('VERCEL') == '1' else 'process'
+    return config.get('worker_pool_type', default)
+
+def worker_count():
+    """CPU密集任务的工作进程（线程）数，默认等于CPU核数"""
+    return max(1, int(config.get('worker_processes') or os.cpu_count() or 1))
+
+def _init_worker(warmup_decoders, log_level=logging.INFO):
+    """
+    工作进程初始化：配置日志，在本进程中打开提取缓存，按需预加载二维码后端，
+    使后续任务不再承担冷启动开销
+
+    Args:
+        warmup_decoders: True表示加载识别级联中的后端，也可以是后端名称列表
+    """
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger().setLevel(log_level)
+    from extraction_cache import reset_cache_after_fork, get_cache
+    reset_cache_after_fork()
+    get_cache()
+    if warmup_decoders:
+        from qr_decoders import warmup
+        warmup(warmup_decoders if isinstance(warmup_decoders, (list, tuple)) else None)
+
+def _worker_snapshot():
+    """工作进程中的缓存命中、识别级联和后端加载统计"""
+    from extraction_cache import get_cache
+    from qr_decoders import get_cascade, DECODERS
+    cache = get_cache()
+    cascade = get_cascade()
+    with cascade._lock:
+        cascade_stats = {name: dict(stat) for name, stat in cascade.stats.items()}
+    return {
+        'pid': os.getpid(),
+        'cache': {'hits': cache.hits, 'misses': cache.misses, 'evictions': cache.evictions} if cache else None,
+        'cascade': cascade_stats,
+        'decoders_loaded': [name for name, backend in DECODERS.items() if backend.loaded and backend.decoder is not None]
+    }
+
+def _run_in_worker(call):
+    """在工作进程中执行任务，结果附带本进程的统计，供父进程汇总"""
+    return call(), _worker_snapshot()
+
+def create_cpu_executor(workers=None, kind=None, warmup_decoders=None, log_level=logging.INFO):
+    """
+    创建处理发票的执行器
+    工作进程常驻，二维码后端在每个进程中只加载一次，之后的任务直接复用
+
+    Args:
+        workers: 工作进程（线程）数，默认使用worker_count()
+        kind: 'process' 或 'thread'，默认使用pool_type()
+        warmup_decoders: 进程启动时是否预加载二维码后端，默认使用配置项worker_warmup
+        log_level: 工作进程的日志级别
+    """
+    workers = workers or worker_count()
+    kind = kind or pool_type()
+    if warmup_decoders is None:
+        warmup_decoders = config.get('worker_warmup', False)
+    if kind == 'process':
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(warmup_decoders, log_level)
+        )
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='invoice-cpu')
+    logging.info(f"发票处理工作池已创建: {kind} x {workers}")
+    return executor
+
+def get_cpu_executor():
+    """获取处理发票（解析、渲染、识别）的执行器，首次调用时创建"""
+    global _cpu_executor
+    if _cpu_executor is None:
+        with _executor_lock:
+            if _cpu_executor is None:
+                _cpu_executor = create_cpu_executor(warmup_decoders=_warmup_override)
+    return _cpu_executor
+
+def get_io_executor():
+    """获取文件读写、打包等I/O任务的线程池"""
+    global _io_executor
+    if _io_executor is None:
+        with _executor_lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(
+                    max_workers=config.get('worker_io_threads', 4),
+                    thread_name_prefix='invoice-io'
+                )
+    return _io_executor
+
+def _get_global_slots():
+    """全局并发上限：所有请求同时提交到工作池的任务数"""
+    global _global_slots
+    if _global_slots is None:
+        _global_slots = asyncio.Semaphore(config.get('worker_max_inflight', worker_count() * 2))
+    return _global_slots
+
+def _reset_cpu_executor():
+    """工作进程异常退出后丢弃整个进程池，下次使用时重新创建"""
+    global _cpu_executor
+    with _executor_lock:
+        executor, _cpu_executor = _cpu_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+async def run_cpu(func, *args, **kwargs):
+    """
+    在工作池中执行CPU密集任务，不阻塞事件循环
+    使用进程池时func及参数必须可以被pickle（模块级函数）
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    async with _get_global_slots():
+        try:
+            if pool_type() != 'process':
+                return await loop.run_in_executor(get_cpu_executor(), call)
+            result, snapshot = await loop.run_in_executor(get_cpu_executor(), functools.partial(_run_in_worker, call))
+            _worker_snapshots[snapshot['pid']] = snapshot
+            return result
+        except BrokenProcessPool:
+            logging.error("发票处理工作进程异常退出，重建进程池")
+            _reset_cpu_executor()
+            raise
+
+async def run_io(func, *args, **kwargs):
+    """在I/O线程池中执行阻塞的文件操作"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), functools.partial(func, *args, **kwargs))
+
+async def map_concurrent(func, items, limit=None, **kwargs):
+    """
+    并发处理一个请求中的多个任务，结果顺序与items一致
+
+    Args:
+        func: 模块级函数
+        items: 每个任务的位置参数元组列表
+        limit: 单个请求的并发上限，默认使用配置项worker_per_request
+        kwargs: 传给func的其他关键字参数
+
+    Returns:
+        结果列表，出错的任务对应位置为异常对象
+    """
+    semaphore = asyncio.Semaphore(limit or config.get('worker_per_request', worker_count()))
+
+    async def run(args):
+        async with semaphore:
+            return await run_cpu(func, *args, **kwargs)
+
+    return await asyncio.gather(*(run(args) for args in items), return_exceptions=True)
+
+async def iter_completed(func, items, limit=None, **kwargs):
+    """
+    与map_concurrent相同的并发约束，但按完成顺序逐个产出结果，
+    调用方可以在其余任务仍在处理时先使用已完成的结果
+
+    Yields:
+        (任务在items中的序号, 结果或异常对象)
+    """
+    semaphore = asyncio.Semaphore(limit or config.get('worker_per_request', worker_count()))
+
+    async def run(index, args):
+        async with semaphore:
+            try:
+                return index, await run_cpu(func, *args, **kwargs)
+            except Exception as e:
+                return index, e
+
+    tasks = [asyncio.ensure_future(run(index, args)) for index, args in enumerate(items)]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        # 调用方提前结束（如客户端断开）时取消尚未开始的任务
+        for task in tasks:
+            task.cancel()
+
+def pool_status():
+    """工作池配置"""
+    return {
+        'type': pool_type(),
+        'workers': worker_count(),
+        'io_threads': config.get('worker_io_threads', 4),
+        'per_request': config.get('worker_per_request', worker_count()),
+        'max_inflight': config.get('worker_max_inflight', worker_count() * 2),
+        'started': _cpu_executor is not None
+    }
+
+def warmup_workers(names=None):
+    """
+    进程池模式下预热工作进程：以预加载参数重建进程池并立即启动全部工作进程，
+    每个进程在初始化时加载二维码后端（父进程不参与识别，不需要加载）
+    正在执行的任务在旧进程池中继续完成
+    """
+    global _warmup_override
+    _warmup_override = list(names) if names else True
+    _reset_cpu_executor()
+    executor = get_cpu_executor()
+    for _ in range(worker_count()):
+        executor.submit(os.getpid)
+
+def worker_stats():
+    """
+    汇总进程池中各工作进程上报的统计（每个任务完成时随结果返回，反映各进程最近一次任务后的状态）
+    线程池模式下工作线程与Web进程共享统计，返回None
+    """
+    if pool_type() != 'process':
+        return None
+    snapshots = list(_worker_snapshots.values())
+    cache = {'hits': 0, 'misses': 0, 'evictions': 0}
+    cascade = {}
+    loaded = set()
+    for snapshot in snapshots:
+        for key in cache:
+            cache[key] += (snapshot['cache'] or {}).get(key, 0)
+        for name, stat in snapshot['cascade'].items():
+            total = cascade.setdefault(name, {'attempts': 0, 'successes': 0, 'total_time': 0.0})
+            for key in total:
+                total[key] += stat[key]
+        loaded.update(snapshot['decoders_loaded'])
+    lookups = cache['hits'] + cache['misses']
+    cache['hit_rate'] = round(cache['hits'] / lookups, 4) if lookups else 0.0
+    return {
+        'workers': len(snapshots),
+        'pids': sorted(snapshot['pid'] for snapshot in snapshots),
+        'cache': cache,
+        'cascade': {
+            name: {
+                'attempts': stat['attempts'],
+                'successes': stat['successes'],
+                'success_rate': round(stat['successes'] / stat['attempts'], 4) if stat['attempts'] else None,
+                'avg_time_ms': round(stat['total_time'] / stat['attempts'] * 1000, 1) if stat['attempts'] else None
+            }
+            for name, stat in cascade.items()
+        },
+        'decoders_loaded': sorted(loaded)
+    }
+
+def shutdown(wait=True):
+    """关闭工作池（应用退出时调用）"""
+    global _cpu_executor, _io_executor
+    with _executor_lock:
+        executors = [_cpu_executor, _io_executor]
+        _cpu_executor = _io_executor = None
+    for executor in executors:
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,132 @@
+import io
+import os
+import zlib
+import zipfile
+from config_manager import config
+
+# 本身已压缩的格式，再次压缩几乎没有收益
+COMPRESSED_EXTENSIONS = ('.pdf', '.ofd', '.zip', '.jpg', '.jpeg', '.png')
+
+# 自动模式下试压缩的字节数和采用压缩的最低压缩比
+AUTO_SAMPLE_BYTES = 64 * 1024
+AUTO_MIN_RATIO = 0.9
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    只追加的输出缓冲区，zipfile写入后由生成器取走
+    不支持seek，zipfile会改用数据描述符（data descriptor）写出CRC和大小
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """取出已写入的数据"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def choose_compression(file_path, mode=None):
+    """
+    选择压缩方式
+    stored: 不压缩（默认，PDF/OFD本身已压缩）；deflated: 全部压缩；
+    auto: 已压缩格式直接存储，其他文件试压缩开头部分，压缩比足够时才压缩
+    """
+    mode = mode or config.get('zip_compression', 'stored')
+    if mode == 'deflated':
+        return zipfile.ZIP_DEFLATED
+    if mode != 'auto' or file_path.lower().endswith(COMPRESSED_EXTENSIONS):
+        return zipfile.ZIP_STORED
+    with open(file_path, 'rb') as f:
+        sample = f.read(AUTO_SAMPLE_BYTES)
+    if sample and len(zlib.compress(sample, 1)) < len(sample) * AUTO_MIN_RATIO:
+        return zipfile.ZIP_DEFLATED
+    return zipfile.ZIP_STORED
+
+class ZipStream:
+    """
+    边写边输出的ZIP包，不在磁盘上生成完整的压缩包
+    每个条目写入后即可把已生成的字节发送给客户端
+
+    用法:
+        stream = ZipStream()
+        for path, name in files:
+            for chunk in stream.add_file(path, name):
+                send(chunk)
+        send(stream.finish())
+    """
+
+    def __init__(self, compression=None, chunk_size=None):
+        self.compression = compression
+        self.chunk_size = chunk_size or config.get('zip_chunk_size', 256 * 1024)
+        self._buffer = _StreamBuffer()
+        self._zip = zipfile.ZipFile(self._buffer, 'w')
+        self._names = set()
+
+    def _unique_name(self, arcname):
+        """同一个包中的重复文件名加序号区分"""
+        name = arcname
+        base, ext = os.path.splitext(arcname)
+        counter = 1
+        while name in self._names:
+            name = f"{base}_{counter}{ext}"
+            counter += 1
+        self._names.add(name)
+        return name
+
+    def add_file(self, file_path, arcname=None):
+        """
+        写入一个文件，逐块生成已压缩好的字节
+
+        Yields:
+            ZIP包的字节片段
+        """
+        info = zipfile.ZipInfo.from_file(file_path, self._unique_name(arcname or os.path.basename(file_path)))
+        info.compress_type = choose_compression(file_path, self.compression)
+        with open(file_path, 'rb') as src, \
+                self._zip.open(info, 'w', force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dest:
+            for chunk in iter(lambda: src.read(self.chunk_size), b''):
+                dest.write(chunk)
+                data = self._buffer.drain()
+                if data:
+                    yield data
+        data = self._buffer.drain()
+        if data:
+            yield data
+
+    def add_bytes(self, arcname, data):
+        """写入内存中的数据（如处理结果清单），返回生成的字节"""
+        self._zip.writestr(self._unique_name(arcname), data, zipfile.ZIP_DEFLATED)
+        return self._buffer.drain()
+
+    def finish(self):
+        """写出中央目录，返回最后的字节"""
+        self._zip.close()
+        return self._buffer.drain()
+
+def iter_zip(files, compression=None):
+    """
+    按顺序生成包含files的ZIP包字节流
+
+    Args:
+        files: [(文件路径, 包内文件名)]
+    """
+    stream = ZipStream(compression)
+    for file_path, arcname in files:
+        yield from stream.add_file(file_path, arcname)
+    yield stream.finish()